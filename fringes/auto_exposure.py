@@ -0,0 +1,246 @@
+import math
+
+import numpy as np
+from PyQt5.QtCore import QThread, QMutex, QMutexLocker, QWaitCondition, pyqtSignal
+
+
+def clamp(x, minn, maxx):
+    return min(max(x, minn), maxx)
+
+
+class AutoExposure(QThread):
+    """
+    Keeps the brightness of the frames at a setpoint by adjusting gain and exposure time, in one of two modes:
+
+    "model": the signal is proportional to exposure time and to the gain (in dB, i.e. 10**(gain / 20)). A high
+    percentile of the pixel values of a frame is scaled to the setpoint by changing the exposure time, in one step.
+    The gain is only changed where the exposure time would be outside of its range. After every change, the
+    controller waits for frames that were taken with the new settings, so that it settles within a couple of frames.
+
+    "PID": the saturation (brightest pixel) is regulated by a PID controller every `interval` ms. Its parameters
+    have to be tuned by hand.
+
+    The controller runs in its own thread. The capture thread of the camera reports the saturation and the frames
+    (connect them with Qt.DirectConnection, set_saturation and set_frame only store the values), new settings are
+    sent to the camera with the gain_changed and exposure_time_changed signals.
+    """
+
+    gain_changed = pyqtSignal(float)
+    exposure_time_changed = pyqtSignal(float)
+
+    modes = ("model", "PID")
+
+    # percentile of the pixel values that is brought to the setpoint in model mode:
+    percentile = 99.5
+    # no change if the level is within this fraction of the setpoint:
+    tolerance = 0.05
+    # above this level (in percent) the data is clipped, and the real level is unknown:
+    clip_level = 98.
+    # largest change of the signal in a single step:
+    max_factor = 16.
+    # frames with the new settings that are skipped because they might have been exposed already:
+    settle_frames = 1
+    # give up waiting for frames with the new settings after this many frames:
+    max_wait_frames = 10
+    # every step-th pixel in both directions is used for the percentile
+    step = 4
+
+    def __init__(self, p=0.5, i=0.3, d=10, mode="model"):
+        super().__init__()
+        self._mutex = QMutex()
+        self._condition = QWaitCondition()
+        self._abort = False
+        self.mode = mode
+        self._saturation = 0
+        self._frame = None
+        self._maxval = None
+        self._piUi = 0
+        self._last_error = 0
+        self._gain = None
+        self._exposure_time = None
+        self._min_gain = None
+        self._max_gain = None
+        self._min_exposure_time = None
+        self._max_exposure_time = None
+        self._setpoint = 85.
+        self.Kp = p
+        self.Ki = i
+        self.Kd = d
+        # in ms:
+        self.interval = 200
+
+    def set_saturation(self, sat):
+        with QMutexLocker(self._mutex):
+            self._saturation = sat
+
+    def set_frame(self, frame):
+        # only the latest frame is kept, and only while it is needed
+        if self.mode == "model" and self.isRunning():
+            with QMutexLocker(self._mutex):
+                self._frame = frame
+                self._condition.wakeOne()
+
+    def set_maxval(self, maxval):
+        with QMutexLocker(self._mutex):
+            self._maxval = maxval
+
+    def set_exposure_time(self, exposure):
+        with QMutexLocker(self._mutex):
+            self._exposure_time = exposure
+
+    def set_gain(self, gain):
+        with QMutexLocker(self._mutex):
+            self._gain = gain
+
+    def set_exposure_range(self, rng):
+        with QMutexLocker(self._mutex):
+            self._min_exposure_time, self._max_exposure_time = rng
+
+    def set_gain_range(self, rng):
+        with QMutexLocker(self._mutex):
+            self._min_gain, self._max_gain = rng
+
+    def set_mode(self, mode):
+        """
+        :param mode: one of modes; a running controller is restarted with the new mode
+        """
+        if mode not in self.modes:
+            raise ValueError("Unknown auto exposure mode {}".format(mode))
+        was_running = self.isRunning()
+        if was_running:
+            self.stop()
+            self.wait()
+        self.mode = mode
+        if was_running:
+            self.start()
+
+    def stop(self):
+        with QMutexLocker(self._mutex):
+            self._abort = True
+            self._condition.wakeOne()
+
+    def run(self):
+        self._abort = False
+        if self.mode == "model":
+            self._run_model()
+        else:
+            self._run_pid()
+
+    def _run_model(self):
+        with QMutexLocker(self._mutex):
+            self._frame = None
+        requested = None
+        settled = 0
+        waited = 0
+
+        while True:
+            with QMutexLocker(self._mutex):
+                if self._frame is None and not self._abort:
+                    self._condition.wait(self._mutex)
+                if self._abort:
+                    break
+                frame = self._frame
+                self._frame = None
+                exposure_time = self._exposure_time
+                gain = self._gain
+                maxval = self._maxval
+            if frame is None or maxval is None:
+                continue
+
+            # wait for frames taken with the requested settings. If the camera doesn't tell, just wait a few frames
+            if requested is not None:
+                waited += 1
+                known = frame.exposure is not None and frame.gain is not None
+                if not known or self._matches(frame, *requested):
+                    settled += 1
+                if settled <= self.settle_frames + (0 if known else 2) and waited < self.max_wait_frames:
+                    continue
+                requested = None
+
+            level = float(np.percentile(frame.array[::self.step, ::self.step], self.percentile)) / maxval * 100
+            with QMutexLocker(self._mutex):
+                new_exposure_time, new_gain = self._predict(level, exposure_time, gain)
+                self._exposure_time = new_exposure_time
+                self._gain = new_gain
+
+            if new_exposure_time != exposure_time:
+                self.exposure_time_changed.emit(new_exposure_time)
+            if new_gain != gain:
+                self.gain_changed.emit(new_gain)
+            if new_exposure_time != exposure_time or new_gain != gain:
+                requested = (new_exposure_time, new_gain)
+                settled = 0
+                waited = 0
+
+    @staticmethod
+    def _matches(frame, exposure_time, gain):
+        return math.isclose(frame.exposure, exposure_time, rel_tol=1e-3, abs_tol=1e-3) and \
+            math.isclose(frame.gain, gain, rel_tol=1e-3, abs_tol=1e-2)
+
+    def _predict(self, level, exposure_time, gain):
+        """
+        Exposure time and gain that bring the level to the setpoint, called with the mutex locked
+        :param level: current level in percent of the full scale
+        :return: new exposure time and gain
+        """
+        if abs(level - self._setpoint) <= self.tolerance * self._setpoint:
+            return exposure_time, gain
+        if level >= self.clip_level:
+            # clipped, so the model doesn't know by how much. Go down a lot, the next frame will tell
+            factor = 1 / 4
+        else:
+            factor = self._setpoint / max(level, 1e-3)
+        factor = clamp(factor, 1 / self.max_factor, self.max_factor)
+
+        # the total signal in units of exposure time at the lowest gain:
+        signal = exposure_time * 10 ** ((gain - self._min_gain) / 20) * factor
+        new_exposure_time = clamp(signal, self._min_exposure_time, self._max_exposure_time)
+        new_gain = clamp(self._min_gain + 20 * math.log10(signal / new_exposure_time), self._min_gain, self._max_gain)
+        return new_exposure_time, new_gain
+
+    def _run_pid(self):
+        self._piUi = 0
+        self._last_error = 0
+
+        while True:
+            QThread.msleep(self.interval)
+            with QMutexLocker(self._mutex):
+                if self._abort:
+                    break
+                previous_gain = self._gain
+                previous_exposure_time = self._exposure_time
+                gain, exposure_time = self._step()
+                self._gain = gain
+                self._exposure_time = exposure_time
+
+            if exposure_time != previous_exposure_time:
+                self.exposure_time_changed.emit(exposure_time)
+            if gain != previous_gain:
+                self.gain_changed.emit(gain)
+
+    def _step(self):
+        """
+        One step of the controller, called with the mutex locked
+        :return: new gain and exposure time
+        """
+        gain = self._gain
+        exposure_time = self._exposure_time
+
+        error = self._saturation - self._setpoint
+        ui = self._piUi + error * self.interval / 1000 * self.Ki
+        self._piUi = ui
+        ud = self._last_error / self.interval * self.Kd
+        output = - self.Kp * (error + ui + ud)
+        self._last_error = error
+
+        if (error > 0 and self._min_gain < gain) or (error < 0 and gain < self._max_gain):
+            # adjust gain
+            db_increase = output / 5
+            gain = clamp(gain + db_increase, self._min_gain, self._max_gain)
+        elif (error > 0 and self._min_exposure_time < exposure_time) or \
+                (error < 0 and exposure_time < self._max_exposure_time):
+            exposure_time = clamp(exposure_time + output, self._min_exposure_time, self._max_exposure_time)
+        else:
+            # stuck at the edge...
+            self._piUi = 0
+        return gain, exposure_time
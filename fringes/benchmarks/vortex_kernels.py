@@ -0,0 +1,172 @@
+"""
+Benchmarks of the kernels in plugins/libs/vortex_tools_core.py on synthetic interferograms, from 256 x 256 up to a
+full 4k x 3k sensor, in float32 and float64. For every kernel, size and data type, the time per call (best and
+median of several runs) and the peak memory allocated during a call (measured with tracemalloc, which sees the
+numpy arrays) are reported.
+
+Results can be saved as a baseline and compared with it later, to find regressions after changes of the kernels.
+Baselines depend on the machine, so by default they are kept per host in benchmarks/baselines/.
+
+    python benchmarks/vortex_kernels.py --save                # measure and store the baseline of this machine
+    python benchmarks/vortex_kernels.py --compare             # measure and compare with it
+    python benchmarks/vortex_kernels.py --sizes 256x256 1280x960 --kernels highpass apply_window
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import plugins.libs.vortex_tools_core as vtc
+
+
+# (rows, columns) of the frames:
+sizes = [(256, 256), (512, 512), (960, 1280), (2048, 2048), (3072, 4096)]
+dtypes = ["float32", "float64"]
+transform_size = 300
+baseline_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def interferogram(shape, dtype, fringe_period=12., fringe_angle=30., noise=0.01, seed=0):
+    """
+    An off-axis interferogram: a Gaussian beam with tilted fringes and some noise, values 0..1
+    """
+    height, width = shape
+    y, x = np.ogrid[-height / 2:height / 2, -width / 2:width / 2]
+    angle = np.deg2rad(fringe_angle)
+    ramp = 2 * np.pi / fringe_period * (x * np.cos(angle) + y * np.sin(angle))
+    sigma = min(width, height) / 4
+    envelope = np.exp(-(x ** 2 + y ** 2) / (2 * sigma ** 2))
+    data = 0.5 * envelope * (1 + np.cos(ramp))
+    data += np.random.default_rng(seed).standard_normal(shape) * noise
+    return np.clip(data, 0, 1).astype(dtype)
+
+
+def kernels(data):
+    """
+    The kernels with their input, as the FFT plugin calls them
+    :return: dict name: function without arguments
+    """
+    transform, transform_abs = vtc.fourier_transform(data, transform_size)
+    blobs = vtc.find_blobs(transform)
+    blob = vtc.pick_blob(blobs) if blobs.shape[0] > 0 else np.array([transform_size / 4, transform_size / 4, 10.])
+    shifted = vtc.mask_and_shift(transform, blob[0], blob[1], blob[2])
+    return {
+        "fourier_transform": lambda: vtc.fourier_transform(data, transform_size),
+        "inv_fourier_transform": lambda: vtc.inv_fourier_transform(shifted),
+        "find_blobs": lambda: vtc.find_blobs(transform),
+        "find_number_blobs": lambda: vtc.find_number_blobs(transform),
+        "apply_mask": lambda: vtc.apply_mask(transform, blob[0], blob[1], blob[2]),
+        "mask_and_shift": lambda: vtc.mask_and_shift(transform, blob[0], blob[1], blob[2]),
+        "highpass": lambda: vtc.highpass(data),
+        "apply_window": lambda: vtc.apply_window(data),
+    }
+
+
+def measure(func, repeat, min_time=0.2):
+    """
+    :param repeat: number of timed runs (at least; fast kernels run until min_time has passed)
+    :return: best and median time per call in ms, peak memory of a call in bytes
+    """
+    func()  # warm up (caches, FFT plans...)
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat or (time.perf_counter() - start < min_time and len(times) < 100 * repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+def run(selected_sizes, selected_dtypes, selected_kernels, repeat):
+    """
+    :return: dict "kernel size dtype": {"best": ms, "median": ms, "peak": bytes}
+    """
+    results = {}
+    for shape in selected_sizes:
+        for dtype in selected_dtypes:
+            data = interferogram(shape, dtype)
+            for name, func in kernels(data).items():
+                if selected_kernels and name not in selected_kernels:
+                    continue
+                best, median, peak = measure(func, repeat)
+                key = "{} {}x{} {}".format(name, shape[1], shape[0], dtype)
+                results[key] = {"best": best, "median": median, "peak": peak}
+                print("{:45s} {:10.3f} ms {:10.3f} ms {:10.1f} MB".format(key, best, median, peak / 2**20),
+                      flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the changes with respect to the baseline
+    :param tolerance: relative change of the best time or the memory that counts as regression
+    :return: number of regressions
+    """
+    regressions = 0
+    print("\n{:45s} {:>12s} {:>12s}".format("compared with baseline", "time", "memory"))
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        time_ratio = result["best"] / baseline[key]["best"]
+        memory_ratio = result["peak"] / baseline[key]["peak"] if baseline[key]["peak"] else 1.
+        regression = time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance
+        regressions += regression
+        print("{:45s} {:11.2f}x {:11.2f}x{}".format(key, time_ratio, memory_ratio,
+                                                     "  REGRESSION" if regression else ""))
+    return regressions
+
+
+def parse_size(text):
+    columns, rows = text.lower().split("x")
+    return int(rows), int(columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the vortex_tools_core kernels")
+    default_baseline = os.path.join(baseline_folder, platform.node() + ".json")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, help="frame sizes as WIDTHxHEIGHT (default: all)")
+    parser.add_argument("--dtypes", nargs="+", choices=dtypes, default=dtypes)
+    parser.add_argument("--kernels", nargs="+", help="names of the kernels (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per kernel")
+    parser.add_argument("--save", nargs="?", const=default_baseline, help="save the results as baseline "
+                                                                          "(default file: per host)")
+    parser.add_argument("--compare", nargs="?", const=default_baseline, help="compare with a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown or increase of memory "
+                                                                     "reported as regression")
+    args = parser.parse_args(argv)
+
+    print("{:45s} {:>13s} {:>13s} {:>13s}".format("kernel, size, dtype", "best", "median", "peak memory"))
+    results = run(args.sizes or sizes, args.dtypes, args.kernels, args.repeat)
+
+    regressions = 0
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+    if args.save is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as file:
+            json.dump({"machine": platform.node(), "processor": platform.processor(), "python": sys.version,
+                       "numpy": np.__version__, "time": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results},
+                      file, indent=1)
+        print("Baseline saved to {}".format(args.save))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
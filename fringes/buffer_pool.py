@@ -0,0 +1,109 @@
+import mmap
+import threading
+import weakref
+
+import numpy as np
+
+
+class _Lease:
+    """
+    Owner of a buffer while it is handed out: the array returned by BufferPool.acquire() is created from this object,
+    so it (and every view derived from it) keeps the lease alive. When the lease goes away, the buffer goes back to
+    the pool.
+    """
+
+    __slots__ = ("__array_interface__", "raw", "__weakref__")
+
+    def __init__(self, raw, offset, nbytes):
+        self.raw = raw
+        self.__array_interface__ = {"data": (raw.ctypes.data + offset, False), "shape": (nbytes,), "typestr": "|u1",
+                                    "version": 3}
+
+
+class BufferPool:
+    """
+    A fixed set of preallocated, page-aligned byte buffers that a camera driver can fill in place.
+
+    Every buffer handed out by acquire() is owned by a lease (see _Lease) until it comes back to the pool.
+    Consumers don't release buffers explicitly: as long as any array derived from a buffer (a reshaped view, a
+    rotated view, a slice...) is still alive somewhere, numpy keeps a reference to the lease, and the buffer stays
+    busy. When the last of those arrays is gone, the lease is finalized and returns the buffer.
+
+    If all buffers are busy, a temporary buffer is allocated instead and the event is counted in `exhausted`, so
+    that the pool size can be tuned.
+    """
+
+    page_size = mmap.PAGESIZE
+
+    def __init__(self, nbytes=0, count=4):
+        self._count = count
+        self._nbytes = 0
+        self._blocks = []
+        self._free = []
+        # incremented by resize(), buffers of an older generation are not taken back:
+        self._generation = 0
+        # finalizers may run in any thread, also while the lock is held (garbage collection)
+        self._lock = threading.RLock()
+        self.exhausted = 0
+        if nbytes > 0:
+            self.resize(nbytes)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def busy(self):
+        """
+        Number of buffers of the pool that are handed out
+        """
+        with self._lock:
+            return len(self._blocks) - len(self._free)
+
+    def resize(self, nbytes):
+        """
+        (Re)allocate the buffers, if the requested size differs from the current one.
+        Buffers that are still referenced by consumers stay valid, they are just not recycled any more.
+        :param nbytes: size of a single buffer in bytes
+        """
+        with self._lock:
+            if nbytes == self._nbytes:
+                return
+            self._nbytes = nbytes
+            self._generation += 1
+            self._blocks = [self._allocate(nbytes) for _ in range(self._count)]
+            self._free = list(range(self._count))
+
+    def acquire(self):
+        """
+        Get a free buffer
+        :return: writable, page-aligned 1d uint8 array of size nbytes
+        """
+        with self._lock:
+            if self._free:
+                index = self._free.pop(0)
+                raw, offset = self._blocks[index]
+                lease = _Lease(raw, offset, self._nbytes)
+                weakref.finalize(lease, self._release, index, self._generation)
+                return np.asarray(lease)
+            self.exhausted += 1
+            raw, offset = self._allocate(self._nbytes)
+            return raw[offset:offset + self._nbytes]
+
+    def _release(self, index, generation):
+        """
+        Take a buffer back, called when its lease is finalized
+        """
+        with self._lock:
+            if generation == self._generation and index not in self._free:
+                self._free.append(index)
+
+    def _allocate(self, nbytes):
+        # over-allocate by one page so that an aligned piece of the right size can be cut out
+        raw = np.empty(nbytes + self.page_size, dtype=np.uint8)
+        offset = (-raw.ctypes.data) % self.page_size
+        return raw, offset
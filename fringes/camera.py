@@ -3,10 +3,52 @@ import numpy as np
 from PyQt5.QtWidgets import QWidget
 import re
 
+from frame import Frame
+
+
+def orient(array, flip_x=False, flip_y=False, copy=False):
+    """
+    The single place where frames are brought into the right orientation. Flips are applied as views, and the
+    result is copied (once) only if that is necessary to get a C-contiguous array, so that none of the processing
+    further down has to deal with negative strides.
+    :param array: image data, rows first
+    :param flip_x: mirror left and right
+    :param flip_y: mirror top and bottom
+    :param copy: always copy, e.g. because the memory of array is only valid for a short time
+    :return: C-contiguous array
+    """
+    if flip_y:
+        array = array[::-1]
+    if flip_x:
+        array = array[:, ::-1]
+    if copy or not array.flags.c_contiguous:
+        return np.array(array, order="C", copy=True)
+    return array
+
+
+def measure_saturation(array, maxval, step=4):
+    """
+    Saturation of a frame: the brightest pixel in percent of the full scale. Only every step-th pixel in both
+    directions is looked at, which is plenty for exposure control and a fraction of the work of the full frame.
+    Meant to be called in the capture threads, not on the GUI thread.
+    :param array: image data
+    :param maxval: full scale of the data
+    :param step: subsampling in both directions
+    :return: saturation in percent
+    """
+    return float(array[::step, ::step].max()) / maxval * 100
+
 
 class Camera(QObject):
 
-    ndarray_available = pyqtSignal(np.ndarray)
+    # virtual cameras (no real hardware) are never chosen automatically
+    virtual = False
+
+    frame_available = pyqtSignal(Frame)
+    # emitted when the size or type of the frames changes, e.g. because of a different binning:
+    readout_changed = pyqtSignal()
+    # errors and other news for the status bar:
+    message = pyqtSignal(str)
 
     # a decorator for easy checking that the device is valid
     # before a function is run
@@ -23,6 +65,9 @@ class Camera(QObject):
         self._manualMode = False
         self._active = False
         self.maxval = None
+        # orientation of the frames, see orient() and set_orientation()
+        self.flip_x = False
+        self.flip_y = False
 
     def _clear_interface(self):
         return NotImplementedError()
@@ -74,6 +119,47 @@ class Camera(QObject):
     def set_gain(self, gain):
         return NotImplementedError()
 
+    def get_binning_options(self):
+        return [1]
+
+    def get_binning(self):
+        return 1
+
+    def set_binning(self, bins):
+        return NotImplementedError()
+
+    def get_pixel_formats(self):
+        return []
+
+    def get_pixel_format(self):
+        return None
+
+    def set_pixel_format(self, pixel_format):
+        return NotImplementedError()
+
+    def set_orientation(self, flip_x, flip_y):
+        """
+        Mirror the frames. Cameras that can do this in hardware override this, all others pass their frames
+        through orient() with these settings.
+        """
+        self.flip_x = flip_x
+        self.flip_y = flip_y
+        self.readout_changed.emit()
+
+    def get_orientation(self):
+        return self.flip_x, self.flip_y
+
+    def supports_hardware_roi(self):
+        return False
+
+    def set_hardware_roi(self, rect):
+        """
+        Restrict the sensor readout to a region of interest
+        :param rect: QRect in the coordinates of the full frames emitted by the camera, or None for the full sensor
+        :return: QRect of the region actually read out (snapped to what the hardware supports)
+        """
+        return NotImplementedError()
+
     @staticmethod
     def read_pid_settings(cam_name):
         try:
@@ -15,6 +15,8 @@ from PyQt5.QtWidgets import QDialog, QFileDialog, QMessageBox
 
 from qt_camera import QtCamera
 from camera import Camera
+from simulated_camera import SimulatedCamera
+from replay_camera import ReplayCamera
 from zwo_camera import ZwoCamera
 
 
@@ -63,6 +65,10 @@ class CameraDialog(QDialog):
             elif not device.description().startswith("ASI"):
                 self.available_cameras.append(self.Available_Camera(name=device.description(), class_=QtCamera,
                                                                     kwargs=dict(device=device)))
+        self.available_cameras.append(self.Available_Camera(name="Simulated interferogram", class_=SimulatedCamera,
+                                                            kwargs=dict()))
+        self.available_cameras.append(self.Available_Camera(name="Replay recorded sequence...", class_=ReplayCamera,
+                                                            kwargs=dict()))
         names = [cam.name for cam in self.available_cameras]
         model = QStringListModel(names)
         self.ui.listView.setModel(model)
@@ -73,14 +79,22 @@ class CameraDialog(QDialog):
         if result == QDialog.Accepted:
             index = self.ui.listView.currentIndex().row()
             cam = self.available_cameras[index]
-            qDebug(str(cam.kwargs))
-            self.current_camera = cam.class_(**cam.kwargs)
+            kwargs = cam.kwargs
+            if cam.class_ is ReplayCamera:
+                filename, _ = QFileDialog.getOpenFileName(self, "Choose a recorded sequence",
+                                                          filter="netCDF file (*.nc)",
+                                                          options=QFileDialog.DontUseNativeDialog)
+                if filename == "":
+                    return
+                kwargs = dict(filename=filename)
+            qDebug(str(kwargs))
+            self.current_camera = cam.class_(**kwargs)
             self.camera_changed.emit(self.current_camera)
 
     @pyqtSlot()
     def choose_first_camera(self):
         try:
-            cam = self.available_cameras[0]
+            cam = next(cam for cam in self.available_cameras if not cam.class_.virtual)
             self.current_camera = cam.class_(**cam.kwargs)
             self.camera_changed.emit(self.current_camera)
         except:
@@ -1,7 +1,8 @@
 import numpy as np
 
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, qDebug, Qt
-from PyQt5.QtWidgets import QWidget, QSlider, QDoubleSpinBox, QLabel, QHBoxLayout, QVBoxLayout, QCheckBox, QGridLayout
+from PyQt5.QtWidgets import QWidget, QSlider, QDoubleSpinBox, QLabel, QHBoxLayout, QVBoxLayout, QCheckBox, QGridLayout, \
+    QComboBox
 
 
 def clamp(x, minn, maxx):
@@ -76,6 +77,9 @@ class CameraSettingsWidget(QWidget):
     exposure_changed = pyqtSignal(float)
     gain_changed = pyqtSignal(float)
     auto_changed = pyqtSignal(bool)
+    auto_mode_changed = pyqtSignal(str)
+    binning_changed = pyqtSignal(int)
+    pixel_format_changed = pyqtSignal(str)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -96,11 +100,34 @@ class CameraSettingsWidget(QWidget):
         self.auto_checkbox = QCheckBox("auto")
         self.auto_checkbox.toggled.connect(self.auto_changed)
         self.auto_checkbox.toggled.connect(self.disable_controls)
+        # how the automatic settings work, only shown if the camera offers a choice:
+        self.auto_mode_box = QComboBox()
+        self.auto_mode_box.activated[str].connect(self.auto_mode_changed)
+        self.set_auto_modes([])
+
+        # binning and pixel format are only shown if the camera offers a choice:
+        self.binning_label = QLabel("Binning")
+        self.binning_box = QComboBox()
+        self.binning_box.activated[str].connect(self._emit_binning)
+        self.pixel_format_label = QLabel("Pixel format")
+        self.pixel_format_box = QComboBox()
+        self.pixel_format_box.activated[str].connect(self.pixel_format_changed)
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(self.binning_box)
+        format_layout.addWidget(self.binning_label)
+        format_layout.addStretch(1)
+        format_layout.addWidget(self.pixel_format_box)
+        format_layout.addWidget(self.pixel_format_label)
+        format_layout.addStretch(1)
+        self.set_binning_options([])
+        self.set_pixel_formats([])
 
         layout = QGridLayout()
         layout.addWidget(self.exposure_widget, 0, 0)
         layout.addWidget(self.gain_widget, 1, 0)
-        layout.addWidget(self.auto_checkbox, 0, 1, 0, 1)
+        layout.addLayout(format_layout, 2, 0)
+        layout.addWidget(self.auto_checkbox, 0, 1)
+        layout.addWidget(self.auto_mode_box, 1, 1)
         layout.setContentsMargins(5, 5, 5, 5)
         self.setLayout(layout)
 
@@ -126,6 +153,40 @@ class CameraSettingsWidget(QWidget):
     def set_gain_range(self, min_gain, max_gain):
         self.gain_widget.set_range(min_gain, max_gain)
 
+    def set_binning_options(self, options):
+        self.binning_box.clear()
+        self.binning_box.addItems(["{0}x{0}".format(bins) for bins in options])
+        visible = len(options) > 1
+        self.binning_box.setVisible(visible)
+        self.binning_label.setVisible(visible)
+
+    @pyqtSlot(int)
+    def set_binning(self, bins):
+        self.binning_box.setCurrentText("{0}x{0}".format(bins))
+
+    def _emit_binning(self, text):
+        self.binning_changed.emit(int(text.split("x")[0]))
+
+    def set_pixel_formats(self, formats):
+        self.pixel_format_box.clear()
+        self.pixel_format_box.addItems(formats)
+        visible = len(formats) > 1
+        self.pixel_format_box.setVisible(visible)
+        self.pixel_format_label.setVisible(visible)
+
+    @pyqtSlot(str)
+    def set_pixel_format(self, pixel_format):
+        self.pixel_format_box.setCurrentText(pixel_format)
+
+    def set_auto_modes(self, modes):
+        self.auto_mode_box.clear()
+        self.auto_mode_box.addItems(modes)
+        self.auto_mode_box.setVisible(len(modes) > 1)
+
+    @pyqtSlot(str)
+    def set_auto_mode(self, mode):
+        self.auto_mode_box.setCurrentText(mode)
+
     @pyqtSlot(bool)
     def disable_controls(self, disable):
         self.gain_widget.setEnabled(not disable)
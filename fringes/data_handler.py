@@ -1,113 +1,346 @@
 import numpy as np
+import os
 import time
+from collections import namedtuple
 
 from PyQt5.QtCore import pyqtSlot, QObject, pyqtSignal, QRectF, qDebug, QRect
 from PyQt5.QtWidgets import QWidget
 
 from camera import Camera
-from data_saver import DataSaver
-from plugin_loader import PluginLoader
+import frame_ops
+import instrumentation
+from frame import Frame
+from rate_policy import DisplayRate
+
+
+# a consumer of one of the data streams, see DataHandler.subscribe. The label names it in the instrumentation
+Subscription = namedtuple("Subscription", ["stream", "callback", "policy", "is_active", "label"])
 
 
 class DataHandler(QObject):
+    """
+    Receives the frames from the camera, and passes them on to the main window and the plugins, together with the
+    derived data. There are four streams: "frame" (as it comes from the camera), "frame_bw" (grayscale),
+    "clipped_frame" (only the selected region) and "clipped_frame_bw".
+
+    Consumers subscribe to the streams they need, with a rate policy (see rate_policy.py) and optionally a function
+    that tells if they currently want data at all. Plugins are subscribed automatically to the streams whose
+    process_* methods they override, when they are loaded (plugins with process_batch get their batch_stream
+    through a FrameBatcher). A derived stream is only calculated if some active consumer takes the frame,
+    and at most once per frame.
+
+    Results calculated from the data (Fourier transform, high-pass filtered data...) can be shared by the consumers
+    of a stream through the intermediates of the frames, see intermediates.py.
+
+    Without a user interface (headless=True), no plugins are loaded and no widgets are created; the consumers
+    subscribe themselves, see headless.py.
+    """
+
+    streams = ("frame", "frame_bw", "clipped_frame", "clipped_frame_bw")
+
+    # set the environment variable FRINGES_CHECK_FRAMES=1 to find consumers that change the frames they get
+    check_frames = os.environ.get("FRINGES_CHECK_FRAMES", "0") not in ("", "0")
+    # frames that don't fit the expected readout are skipped for at most this time (in s, while a reconfiguration of
+    # the camera is pending), then the new readout is adopted:
+    readout_timeout = 1.
 
-    ndarray_available = pyqtSignal(np.ndarray)
-    ndarray_bw_available = pyqtSignal(np.ndarray)
-    clipped_ndarray_available = pyqtSignal(np.ndarray)
-    clipped_ndarray_bw_available = pyqtSignal(np.ndarray)
     camera_controls_changed = pyqtSignal(QWidget)
     save_file = pyqtSignal()
     enable_saturation_widget = pyqtSignal(bool)
     saturation_changed = pyqtSignal(int)
     message = pyqtSignal(str)
 
-    def __init__(self, **kwargs):
+    def __init__(self, headless=False, **kwargs):
         super().__init__(**kwargs)
 
         self.camera = None
+        self.headless = headless
 
         self.clip_size = None
-        self.ndarray_available.connect(self.clip_array)
-        self.ndarray_available.connect(self.convert_to_grayscale)
+        # with a hardware ROI, the camera only reads out part of the sensor; frame_rect is the region of the full
+        # frame that is read out (None if the full sensor is read out)
+        self.hardware_roi = False
+        self.frame_rect = None
+        self._full_shape = None
+        # time of the first frame that didn't fit the readout, see readout_timeout:
+        self._mismatch_since = None
+        self._subscriptions = []
+        # frames delivered with check_frames, to be checked again later (consumers might work in other threads):
+        self._delivered = []
+        # how color is converted to grayscale, see frame_ops.weightings:
+        self.grayscale_weighting = "mean"
+        # for everything that is shown on screen:
+        self.display_policy = DisplayRate()
+
+        self.plugin_loader = None
+        self.plugins = []
+        self.data_saver = None
+        if not headless:
+            # imported only here, they bring in QtQml, scipy...
+            from data_saver import DataSaver
+            self._load_plugins()
+            # the data saver converts to grayscale only when an image is actually saved
+            self.data_saver = DataSaver()
+            self.subscribe("frame", self.data_saver.set_frame, self.display_policy)
+            self.save_file.connect(self.data_saver.save_image)
+            self.data_saver.message.connect(self.message)
 
+    def _load_plugins(self):
+        # plugins are loaded on demand, see PluginLoader.load
+        from plugin_loader import PluginLoader
         self.plugin_loader = PluginLoader()
         self.plugins = self.plugin_loader.plugins
-        for plugin in self.plugins:
-            try:
-                plugin.message.connect(self.message)
-            except:
-                qDebug("Cannot connect to messages from {}".format(plugin.getName()))
-        self.ndarray_available.connect(self.plugin_loader.ndarray_available)
-        self.ndarray_bw_available.connect(self.plugin_loader.ndarray_bw_available)
-        self.clipped_ndarray_available.connect(self.plugin_loader.clipped_ndarray_available)
-        self.clipped_ndarray_bw_available.connect(self.plugin_loader.clipped_ndarray_bw_available)
-
-        self.data_saver = DataSaver()
-        self.ndarray_bw_available.connect(self.data_saver.set_array)
-        self.save_file.connect(self.data_saver.save_image)
-        self.data_saver.message.connect(self.message)
+        self.plugin_loader.plugin_loaded.connect(self.add_plugin)
 
-        # this limits the global frame rate in this program:
-        self.last_frame_time = time.time()
-        self.frame_interval = 0.1
+    @pyqtSlot(QObject)
+    def add_plugin(self, plugin):
+        try:
+            plugin.message.connect(self.message)
+        except:
+            qDebug("Cannot connect to messages from {}".format(plugin.getName()))
+        for stream in plugin.consumed_streams():
+            self.subscribe(stream, getattr(plugin, "process_" + stream), plugin.rate_policy, plugin.is_active,
+                           label="{}: {} process_{}".format(stream, plugin.getName(), stream))
+        batcher = self.plugin_loader.batchers.get(plugin)
+        if batcher is not None:
+            self.subscribe(plugin.batch_stream, batcher.add, plugin.rate_policy, plugin.is_active,
+                           label="{}: {} batches".format(plugin.batch_stream, plugin.getName()))
 
     @pyqtSlot(Camera)
     def change_camera(self, camera):
         if self.camera is not None:
             self.camera.stop()
             # TODO: fix these disconnect statements
-            # self.camera.ndarray_available.disconnect()
+            # self.camera.frame_available.disconnect()
             del self.camera
         self.camera = camera
+        # the selection belongs to the old sensor; the hardware ROI is applied again when something is selected
+        self.clip_size = None
+        self.frame_rect = None
+        self._full_shape = None
+        self._mismatch_since = None
+        if self.hardware_roi and not self.camera.supports_hardware_roi():
+            self.message.emit("This camera does not support a hardware ROI.")
         if self.camera.has_controls():
             try:
                 self.camera.saturation_changed.connect(self.saturation_changed)
             except:
                 pass
-        self.camera.ndarray_available.connect(self.process_new_array)
-        self.camera_controls_changed.emit(self.camera.get_controls())
+        self.camera.frame_available.connect(self.process_new_frame)
+        self.camera.readout_changed.connect(self.reset_readout)
+        self.camera.message.connect(self.message)
+        if not self.headless:
+            self.camera_controls_changed.emit(self.camera.get_controls())
         self.enable_saturation_widget.emit(self.camera.has_controls())
         self.camera.start()
 
-    @pyqtSlot(np.ndarray)
-    def process_new_array(self, array: np.ndarray):
+    @pyqtSlot(Frame)
+    def process_new_frame(self, frame: Frame):
+        instrumentation.count("data handler: frames in")
+        shape = frame.shape[:2]
+        if self.frame_rect is None:
+            expected = self._full_shape is None or shape == self._full_shape
+            fits = frame.roi_offset == (0, 0) and expected
+        else:
+            fits = shape == (self.frame_rect.height(), self.frame_rect.width()) and \
+                frame.roi_offset == (self.frame_rect.left(), self.frame_rect.top())
+        if not fits and not self._adopt_readout(frame):
+            # captured before the sensor readout was changed
+            instrumentation.count("data handler: stale frames skipped")
+            return
+        self._mismatch_since = None
+        if self.frame_rect is None:
+            self._full_shape = shape
+        if self.clip_size is None:
+            self.clip_size = QRect(0, 0, shape[1], shape[0])
+
+        # who wants this frame? Every rate policy is asked only once, even if it is shared by several subscriptions
         now = time.time()
-        if now - self.last_frame_time >= self.frame_interval:
-            if self.clip_size is None:
-                self.clip_size = QRect(0, 0, array.shape[1], array.shape[0])
-            self.last_frame_time = now
-            self.ndarray_available.emit(array)
-
-    @pyqtSlot(np.ndarray)
-    def convert_to_grayscale(self, array: np.ndarray):
+        decisions = {}
+        receivers = []
+        for subscription in self._subscriptions:
+            if subscription.is_active is not None and not subscription.is_active():
+                continue
+            policy = subscription.policy
+            if id(policy) not in decisions:
+                decisions[id(policy)] = policy.accept(now)
+            if decisions[id(policy)]:
+                receivers.append(subscription)
+
+        if self.check_frames:
+            self._check_delivered()
+        if not receivers:
+            return
+        with instrumentation.measure("data handler: derive streams"):
+            derived = self.derive_streams(frame, {subscription.stream for subscription in receivers})
+        for subscription in receivers:
+            data = derived[subscription.stream]
+            if self.check_frames:
+                self._delivered.append((subscription, data, frame_ops.checksum(data.array)))
+            # consumers that work in other threads only take the frame here, their work is measured there
+            start = time.perf_counter()
+            with instrumentation.measure(subscription.label):
+                subscription.callback(data)
+            if getattr(subscription.policy, "measure_callbacks", False):
+                subscription.policy.add_time(time.perf_counter() - start)
+        if self.check_frames:
+            self._check_delivered(keep=True)
+
+    def _check_delivered(self, keep=False):
         """
-        Convert color array to grayscale
-        :param array:
-        :return:
+        Debugging: complain about consumers that changed the data they got
+        :param keep: check the frames again next time
         """
-        if len(array.shape) == 3:
-            array = array.mean(axis=2)
-        self.ndarray_bw_available.emit(array)
-
-    @pyqtSlot(np.ndarray)
-    def clip_array(self, array):
-        if len(array.shape) == 2:
-            y_size, x_size = array.shape
-        else:
-            y_size, x_size, _ = array.shape
-        x_start = self.clip_size.left()
-        x_stop = self.clip_size.right() + 1
-        y_start = y_size - self.clip_size.bottom()
-        y_stop = y_size - self.clip_size.top()
-        clipped_array = array[y_start:y_stop, x_start:x_stop]
+        for subscription, data, checksum in self._delivered:
+            if frame_ops.checksum(data.array) != checksum:
+                message = "{} modified {} {}!".format(subscription.callback, subscription.stream, data)
+                qDebug(message)
+                self.message.emit(message)
+        if not keep:
+            self._delivered = []
 
-        self.clipped_ndarray_available.emit(clipped_array)
+    def subscribe(self, stream, callback, policy=None, is_active=None, label=None):
+        """
+        Get data from one of the streams
+        :param stream: one of streams
+        :param callback: called with a Frame
+        :param policy: RatePolicy, by default display_policy
+        :param is_active: function that returns False while the consumer doesn't need any data
+        :param label: name of the consumer in the instrumentation, by default stream, class and method
+        :return: Subscription, for unsubscribe()
+        """
+        if stream not in self.streams:
+            raise ValueError("Unknown data stream {}".format(stream))
+        if label is None:
+            owner = getattr(callback, "__self__", None)
+            if owner is not None:
+                # the class of the object, not the one that defines the method (e.g. Plugin)
+                label = "{}: {}.{}".format(stream, type(owner).__name__, callback.__name__)
+            else:
+                label = "{}: {}".format(stream, getattr(callback, "__qualname__", repr(callback)))
+        subscription = Subscription(stream, callback, self.display_policy if policy is None else policy, is_active,
+                                    label)
+        self._subscriptions.append(subscription)
+        return subscription
 
-        if len(clipped_array.shape) == 3:
-            clipped_array = clipped_array.sum(axis=2)
+    def unsubscribe(self, subscription):
+        self._subscriptions.remove(subscription)
 
-        self.clipped_ndarray_bw_available.emit(clipped_array)
+    def derive_streams(self, frame, streams):
+        """
+        Calculate the data of some streams for a frame, each of them once. Full and clipped grayscale data come from
+        a single pass (see frame_ops.crop_and_grayscale): the clipped data is a view on the full grayscale frame if
+        both are needed, otherwise only the clipped region is converted.
+        :param streams: names of the streams
+        :return: dict with a Frame for each stream
+        """
+        derived = {"frame": frame}
+        rect = self._clip_array_rect(frame)
+        if "clipped_frame" in streams:
+            derived["clipped_frame"] = frame.derive(frame_ops.crop(frame.array, rect))
+        if "frame_bw" in streams or "clipped_frame_bw" in streams:
+            gray, clipped_gray = frame_ops.crop_and_grayscale(frame.array, rect, full="frame_bw" in streams,
+                                                              cropped="clipped_frame_bw" in streams,
+                                                              weighting=self.grayscale_weighting)
+            if gray is not None:
+                derived["frame_bw"] = frame.derive(gray)
+            if clipped_gray is not None:
+                derived["clipped_frame_bw"] = frame.derive(clipped_gray)
+        return derived
+
+    @pyqtSlot(str)
+    def set_grayscale_weighting(self, weighting):
+        if weighting not in frame_ops.weightings:
+            raise ValueError("Unknown grayscale weighting {}".format(weighting))
+        self.grayscale_weighting = weighting
+        if self.data_saver is not None:
+            self.data_saver.grayscale_weighting = weighting
+
+    def _clip_rect(self):
+        """
+        The part of the full frame that is passed on as clipped data, in array coordinates (x: columns, y: rows).
+        The main view shows the rows from the top down, so the selection drawn there is in these coordinates already.
+        """
+        height, width = self._full_shape
+        return QRect(self.clip_size).intersected(QRect(0, 0, width, height))
+
+    def _clip_array_rect(self, frame: Frame):
+        """
+        The selected region in the coordinates of the array of this frame, see frame_ops.crop
+        """
+        rect = self._clip_rect()
+        rect.translate(-frame.roi_offset[0], -frame.roi_offset[1])
+        return rect.top(), rect.bottom() + 1, rect.left(), rect.right() + 1
 
     @pyqtSlot(QRectF)
     def set_clip_size(self, rect):
         self.clip_size = rect
+        if self.hardware_roi:
+            self._apply_hardware_roi()
+
+    @pyqtSlot()
+    def reset_clip_size(self):
+        self.clip_size = None
+        if self.frame_rect is not None:
+            self._apply_hardware_roi()
+
+    def _adopt_readout(self, frame):
+        """
+        A frame that doesn't fit the readout: skip it while a change of the readout may still be pending, but if
+        this goes on for longer than readout_timeout, the camera changed its readout without telling (e.g. a Qt
+        camera with a different resolution, or the replay of another file). Then the readout of the frame is
+        taken as the new one.
+        :return: True if the readout of the frame was adopted
+        """
+        now = time.time()
+        if self._mismatch_since is None:
+            self._mismatch_since = now
+        if now - self._mismatch_since < self.readout_timeout:
+            return False
+        height, width = frame.shape[:2]
+        if frame.roi_offset == (0, 0):
+            self.frame_rect = None
+            self._full_shape = None
+            self.clip_size = None
+        else:
+            # still a hardware ROI: select what is read out
+            self.frame_rect = QRect(frame.roi_offset[0], frame.roi_offset[1], width, height)
+            if self._full_shape is None:
+                self._full_shape = (self.frame_rect.bottom() + 1, self.frame_rect.right() + 1)
+            self.clip_size = QRect(self.frame_rect)
+        message = "Camera readout changed to {} x {} without notice, data selection was reset.".format(width, height)
+        qDebug("WARNING: " + message)
+        self.message.emit(message)
+        return True
+
+    @pyqtSlot()
+    def reset_readout(self):
+        """
+        The camera now delivers frames of a different size, so the selected data no longer fits
+        """
+        self.clip_size = None
+        self.frame_rect = None
+        self._full_shape = None
+        self._mismatch_since = None
+        self.message.emit("Camera readout changed, data selection was reset.")
+
+    @pyqtSlot(bool)
+    def set_hardware_roi(self, enabled):
+        self.hardware_roi = enabled
+        if self.camera is not None and not self.camera.supports_hardware_roi():
+            if enabled:
+                self.message.emit("This camera does not support a hardware ROI.")
+            return
+        self._apply_hardware_roi()
+
+    def _apply_hardware_roi(self):
+        if self.camera is None or self._full_shape is None:
+            return
+        full_rect = QRect(0, 0, self._full_shape[1], self._full_shape[0])
+        rect = self._clip_rect() if self.hardware_roi and self.clip_size is not None else None
+        try:
+            frame_rect = self.camera.set_hardware_roi(rect)
+        except ValueError as err:
+            self.message.emit("Could not set hardware ROI: {}".format(str(err)))
+            return
+        self.frame_rect = None if rect is None or frame_rect == full_rect else frame_rect
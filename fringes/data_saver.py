@@ -4,10 +4,11 @@ import sys
 import xarray as xr
 import re
 import os
-from scipy.misc import imsave
 
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtProperty, pyqtSlot, qDebug
-from PyQt5.QtWidgets import QFileDialog
+
+import frame_ops
+from frame import Frame
 
 
 class SaveNameGenerator(QObject):
@@ -47,10 +48,17 @@ class DataSaver(QObject):
         self.name_generator = SaveNameGenerator()
         self._image_to_save = None
         self._last_image = None
+        # color images are saved in grayscale, like the frame_bw stream (see DataHandler.grayscale_weighting):
+        self.grayscale_weighting = "mean"
 
     @pyqtSlot()
     def save_image(self):
+        # only needed here; xarray_from_frame is also used without a user interface (see headless.py)
+        from PyQt5.QtWidgets import QFileDialog
+        from scipy.misc import imsave
         self._image_to_save = self._last_image
+        if self._image_to_save is not None:
+            self._image_to_save = frame_ops.to_grayscale(self._image_to_save, self.grayscale_weighting)
 
         filter_netcdf = "netCDF file (*.nc)"
         filter_png = "png file (*.png)"
@@ -92,6 +100,10 @@ class DataSaver(QObject):
     def set_array(self, array):
         self._last_image = array
 
+    @pyqtSlot(Frame)
+    def set_frame(self, frame):
+        self._last_image = frame.array
+
 
 def xarray_from_frame(frame):
     # if there is a calibration file, add calibrated coordinates
@@ -0,0 +1,73 @@
+from PyQt5.QtCore import QTimer, pyqtSlot
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, \
+    QFileDialog, QHeaderView
+
+import instrumentation
+
+
+class DiagnosticsDialog(QDialog):
+    """
+    Shows the numbers collected by the instrumentation (timing of the pipeline stages, rates, dropped frames),
+    updated every second, and saves them as CSV.
+    """
+
+    update_interval = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.setWindowTitle("Diagnostics")
+        self.resize(800, 400)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(0, len(instrumentation.Instrumentation.columns))
+        self.table.setHorizontalHeaderLabels(instrumentation.Instrumentation.columns)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        button_layout.addWidget(reset_button)
+        save_button = QPushButton("Save as CSV...")
+        save_button.clicked.connect(self.save_csv)
+        button_layout.addWidget(save_button)
+        button_layout.addStretch(1)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_table)
+        self.timer.start(self.update_interval)
+        self.update_table()
+
+    @pyqtSlot()
+    def update_table(self):
+        rows = instrumentation.instrumentation.rows()
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                if value is None:
+                    text = ""
+                elif isinstance(value, float):
+                    text = "{:.3g}".format(value)
+                else:
+                    text = str(value)
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+    @pyqtSlot()
+    def reset(self):
+        instrumentation.instrumentation.reset()
+        self.update_table()
+
+    @pyqtSlot()
+    def save_csv(self):
+        filename, _ = QFileDialog.getSaveFileName(self, "Save diagnostics", "diagnostics.csv", "CSV files (*.csv)")
+        if filename:
+            instrumentation.instrumentation.write_csv(filename)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        event.accept()
+        self.deleteLater()
@@ -0,0 +1,66 @@
+import itertools
+import time
+
+
+_sequence_counter = itertools.count()
+
+
+class Frame:
+    """
+    A camera frame together with the information about how it was taken.
+
+    Frames are created once, where the data comes from (usually in a capture thread), and are then passed on
+    through the DataHandler to the main window and all plugins. Derived data (grayscale, clipped...) is passed on
+    as a new Frame with the same metadata, see derive().
+
+    The same array is shared by all consumers, so it is made read-only here: nobody gets to change the data under
+    the feet of the others, and nobody has to make defensive copies. Consumers that need to modify the data work
+    on their own copy (or better, write the results of their calculations into new arrays).
+
+    array: the image data
+    timestamp: capture time, in seconds since the epoch
+    sequence: number of the frame; increases monotonically over the whole run of the program
+    exposure: exposure time in ms (None if unknown)
+    gain: gain in dB (None if unknown)
+    roi_offset: (x, y) position of the frame on the full sensor, if only a part of it was read out
+    camera: name of the camera that took the frame
+    dropped: number of frames the camera has dropped so far
+    saturation: brightest pixel in percent of the full scale, measured by the camera (None if unknown)
+    intermediates: results calculated from the data, shared by all consumers (see intermediates.py)
+    """
+
+    __slots__ = ("array", "timestamp", "sequence", "exposure", "gain", "roi_offset", "camera", "dropped",
+                 "saturation", "intermediates")
+
+    def __init__(self, array, timestamp=None, exposure=None, gain=None, roi_offset=(0, 0), camera="", dropped=0,
+                 saturation=None):
+        array.flags.writeable = False
+        self.array = array
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.sequence = next(_sequence_counter)
+        self.exposure = exposure
+        self.gain = gain
+        self.roi_offset = roi_offset
+        self.camera = camera
+        self.dropped = dropped
+        self.saturation = saturation
+        self.intermediates = None
+
+    def derive(self, array):
+        """
+        A new frame with the same metadata, but different data, e.g. a clipped or grayscale version of this one
+        """
+        frame = Frame.__new__(Frame)
+        for slot in self.__slots__:
+            setattr(frame, slot, getattr(self, slot))
+        array.flags.writeable = False
+        frame.array = array
+        frame.intermediates = None
+        return frame
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    def __repr__(self):
+        return "Frame(#{}, shape={}, camera='{}')".format(self.sequence, self.array.shape, self.camera)
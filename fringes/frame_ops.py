@@ -0,0 +1,72 @@
+import zlib
+
+import numpy as np
+
+
+# weights of the color channels (r, g, b) for the conversion to grayscale:
+weightings = {
+    "mean": (1 / 3, 1 / 3, 1 / 3),
+    # ITU-R BT.601
+    "luma": (0.299, 0.587, 0.114),
+}
+
+
+def crop(array, rect):
+    """
+    :param array: image data, rows first
+    :param rect: (top, bottom, left, right) in array coordinates, bottom and right exclusive
+    :return: view on the region
+    """
+    top, bottom, left, right = rect
+    return array[max(top, 0):bottom, max(left, 0):right]
+
+
+def to_grayscale(array, weighting="mean"):
+    """
+    Weighted sum of the color channels, calculated channel by channel in float32 (several times faster than
+    array.mean(axis=2), and half the memory of float64). Grayscale data is returned unchanged.
+    :param array: image data (rows, columns[, channels])
+    :param weighting: one of weightings
+    :return: float32 array (rows, columns), or array itself if it is grayscale already
+    """
+    if array.ndim < 3:
+        return array
+    weights = [np.float32(weight) for weight in weightings[weighting][:array.shape[2]]]
+    if all(weight == weights[0] for weight in weights):
+        gray = array[..., 0].astype(np.float32)
+        for channel in range(1, len(weights)):
+            gray += array[..., channel]
+        gray *= weights[0]
+    else:
+        gray = np.multiply(array[..., 0], weights[0], dtype=np.float32)
+        weighted = np.empty_like(gray)
+        for channel in range(1, len(weights)):
+            np.multiply(array[..., channel], weights[channel], out=weighted, dtype=np.float32)
+            gray += weighted
+    return gray
+
+
+def crop_and_grayscale(array, rect, full=True, cropped=True, weighting="mean"):
+    """
+    Full and cropped grayscale data in one pass: if both are needed, the cropped data is a view on the full
+    grayscale image, otherwise only the region is converted.
+    :param array: image data
+    :param rect: region, see crop()
+    :param full: calculate the grayscale version of the full array
+    :param cropped: calculate the grayscale version of the region
+    :param weighting: see to_grayscale()
+    :return: full and cropped grayscale data (None where not requested)
+    """
+    if full:
+        full_gray = to_grayscale(array, weighting)
+        return full_gray, crop(full_gray, rect) if cropped else None
+    if cropped:
+        return None, to_grayscale(crop(array, rect), weighting)
+    return None, None
+
+
+def checksum(array):
+    """
+    Checksum of the data of an array, to find out if it was changed (slow, for debugging only)
+    """
+    return zlib.crc32(np.ascontiguousarray(array).view(np.uint8).data)
@@ -0,0 +1,292 @@
+"""
+Acquisition and processing without a user interface, e.g. for long unattended recordings or for extracting the
+phase from a recorded sequence on a machine without a display. Runs on a QCoreApplication: no widgets, no plugins
+and no pyqtgraph are loaded.
+
+The camera is connected to the DataHandler, which passes the grayscale frames on to the sequence recorder and/or
+the phase extraction. Settings come from the command line, or from a configuration file whose [headless] section
+has the same keys as the long options (with _ instead of -). The [phase] section sets the parameters of the phase
+extraction, see phase_parameters. Options on the command line override the file. Example:
+
+    [headless]
+    camera = zwo
+    output = /data/run.nc
+    rate = 0.5
+    images = 1000
+    averages = 4
+    diagnostics = /data/run_diagnostics.csv
+    phase = /data/run_phase.nc
+    phase_rate = 2
+
+    [phase]
+    homogenize = yes
+
+The program ends when the recording is complete, after --duration seconds, at the end of a replayed sequence,
+or with Ctrl+C. Unfinished recordings are saved. Phase images are written while the program runs, in parts of
+--phase-part-size images (run_phase_0000.nc, run_phase_0001.nc... in the example).
+"""
+import argparse
+import configparser
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QSettings, QTimer
+
+import instrumentation
+from data_handler import DataHandler
+from mailbox_worker import MailboxWorker
+from rate_policy import DisplayRate, FullRate, LatestWhenIdle
+
+
+# default parameters of the phase extraction (as in the FFT plugin), see plugins.libs.phase_extraction:
+phase_parameters = {
+    'min_sigma': 8,
+    'max_sigma': 17,
+    'overlap': 0.,
+    'threshold': 1.,
+    'number': 3,
+    'method': "dog",
+    'window': False,
+    'invWindow': False,
+    'auto': True,
+    'blob_x': 0,
+    'blob_y': 0,
+    'blob_r': 0.,
+    'auto_blob': True,
+    'homogenize': False,
+    'homogenize_value': 4.,
+    'homogenize_blur': 0,
+}
+
+
+class PhaseWorker(MailboxWorker):
+    """
+    Extracts the phase of the newest frame whenever it is done with the previous one. The results are written to
+    netCDF files in parts of `part_size` images (<name>_0000.nc, <name>_0001.nc..., to be opened together with
+    xarray.open_mfdataset), so that long runs don't fill the memory and a crash loses at most one part.
+    """
+
+    def __init__(self, filename, parameters, use_process=False, transform_size=300, part_size=100):
+        super().__init__()
+        self.filename = filename
+        self.parameters = parameters
+        self.transform_size = transform_size
+        self.part_size = part_size
+        self._executor = None
+        if use_process:
+            from process_executor import SharedMemoryExecutor
+            self._executor = SharedMemoryExecutor()
+        # results that are not written yet:
+        self.timestamps = []
+        self.phases = []
+        self.periods = []
+        self.saved = 0
+        self.parts = 0
+
+    def process(self, frame):
+        from plugins.libs.phase_extraction import extract_phase
+        if self._executor is not None:
+            result = self._executor.run(extract_phase, frame.array, self.parameters, self.transform_size)
+        else:
+            result = extract_phase(frame.array, self.parameters, self.transform_size)
+        self.timestamps.append(frame.timestamp)
+        self.phases.append(result["phase"].astype(np.float32))
+        self.periods.append(np.nan if result["period"] is None else result["period"])
+        if len(self.phases) >= self.part_size:
+            self.save_part()
+
+    def shutdown(self):
+        """
+        Write the remaining results and stop the worker process, call after the thread has finished
+        """
+        if self.phases:
+            self.save_part()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def save_part(self):
+        import xarray as xr
+        stem, extension = os.path.splitext(self.filename)
+        filename = "{}_{:04d}{}".format(stem, self.parts, extension or ".nc")
+        index = np.arange(self.saved, self.saved + len(self.phases))
+        array = xr.DataArray(np.stack(self.phases), dims=("index", "y", "x"),
+                             coords={"index": index,
+                                     "timestamp": ("index", self.timestamps),
+                                     "period": ("index", self.periods)})
+        array.attrs["parameters"] = repr(self.parameters)
+        try:
+            array.to_netcdf(path=filename)
+        except Exception as err:
+            # keep the results, they are tried again with the next part
+            print("Could not write {}: {}".format(filename, err), file=sys.stderr)
+            return
+        self.saved += len(self.phases)
+        self.parts += 1
+        self.timestamps = []
+        self.phases = []
+        self.periods = []
+
+
+def parse_arguments(argv):
+    """
+    :return: settings (argparse.Namespace) and the parameters of the phase extraction
+    """
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config", help="configuration file")
+    config_args, _ = config_parser.parse_known_args(argv)
+
+    parser = argparse.ArgumentParser(description="Fringes without a user interface", parents=[config_parser],
+                                     epilog="See the documentation of headless.py for the configuration file.")
+    parser.add_argument("--camera", choices=("zwo", "simulated", "replay"), default="zwo")
+    parser.add_argument("--camera-number", type=int, default=0, help="number of the ZWO camera")
+    parser.add_argument("--zwo-library", help="path of the ZWO SDK library (default: as in the GUI)")
+    parser.add_argument("--replay-file", help="sequence to replay with --camera replay")
+    parser.add_argument("--replay-speed", type=float, default=1., help="multiple of the recorded frame rate, "
+                                                                       "0 for as fast as possible")
+    parser.add_argument("--exposure", type=float, help="exposure time in ms")
+    parser.add_argument("--gain", type=float, help="gain in dB")
+    parser.add_argument("--auto-exposure", action="store_true", help="regulate exposure time and gain")
+    parser.add_argument("--output", help="record a sequence to this netCDF file")
+    parser.add_argument("--rate", type=float, default=1., help="recorded images per second")
+    parser.add_argument("--images", type=int, default=10, help="number of images to record")
+    parser.add_argument("--averages", type=int, default=1, help="frames averaged per recorded image")
+    parser.add_argument("--phase", help="extract the phase and save it to netCDF files with this name and a part "
+                                        "number")
+    parser.add_argument("--phase-rate", type=float, default=0., help="extracted phase images per second at most "
+                                                                     "(0: as fast as possible)")
+    parser.add_argument("--phase-part-size", type=int, default=100, help="phase images per file")
+    parser.add_argument("--phase-process", action="store_true", help="extract the phase in a separate process")
+    parser.add_argument("--duration", type=float, default=0., help="stop after this many seconds (0: no limit)")
+    parser.add_argument("--diagnostics", help="save the timing of the pipeline to this CSV file at the end")
+
+    parameters = dict(phase_parameters)
+    if config_args.config is not None:
+        config = configparser.ConfigParser()
+        if not config.read(config_args.config):
+            parser.error("cannot read {}".format(config_args.config))
+        if config.has_section("headless"):
+            section = config["headless"]
+            # all settings with their defaults:
+            known = vars(parser.parse_args([]))
+            config_values = {}
+            for key in section:
+                dest = key.replace("-", "_")
+                if dest not in known:
+                    parser.error("unknown setting {} in {}".format(key, config_args.config))
+                # flags are not converted by argparse; other defaults are, if they are strings
+                config_values[dest] = section.getboolean(key) if isinstance(known[dest], bool) else section[key]
+            parser.set_defaults(**config_values)
+        if config.has_section("phase"):
+            section = config["phase"]
+            # configparser makes the keys lower case:
+            names = {name.lower(): name for name in parameters}
+            for key in section:
+                if key not in names:
+                    parser.error("unknown phase parameter {} in {}".format(key, config_args.config))
+                default = parameters[names[key]]
+                parameters[names[key]] = section.getboolean(key) if isinstance(default, bool) \
+                    else type(default)(section[key])
+
+    args = parser.parse_args(argv)
+    if args.camera == "replay" and args.replay_file is None:
+        parser.error("--camera replay needs --replay-file")
+    return args, parameters
+
+
+def make_camera(args):
+    """
+    :return: the camera chosen in the settings; the modules of the other cameras are not imported
+    """
+    if args.camera == "simulated":
+        from simulated_camera import SimulatedCamera
+        return SimulatedCamera()
+    if args.camera == "replay":
+        from replay_camera import ReplayCamera
+        return ReplayCamera(filename=args.replay_file, speed=args.replay_speed, loop=False)
+
+    from zwo_camera import ZwoCamera
+    library = args.zwo_library
+    if library is None:
+        library = QSettings("Fringes", "Fringes").value("zwo_library_path")
+    ZwoCamera.init_library(library)
+    return ZwoCamera(cam_number=args.camera_number)
+
+
+def main(argv=None):
+    args, parameters = parse_arguments(sys.argv[1:] if argv is None else argv)
+    app = QCoreApplication(sys.argv)
+
+    data_handler = DataHandler(headless=True)
+    data_handler.message.connect(print)
+
+    camera = make_camera(args)
+    if args.exposure is not None:
+        camera.set_exposure(args.exposure)
+    if args.gain is not None:
+        camera.set_gain(args.gain)
+    if args.auto_exposure:
+        if hasattr(camera, "enable_auto"):
+            camera.enable_auto(True)
+        else:
+            print("This camera has no auto exposure.", file=sys.stderr)
+
+    recorder = None
+    if args.output is not None:
+        # xarray is only imported when needed
+        from recorder import RecorderWorker
+        recorder = RecorderWorker()
+        recorder.message.connect(print)
+        recorder.imagesRecorded.connect(lambda number: print("Recorded {} / {} images".format(number, args.images)))
+        recorder.finished.connect(app.quit)
+        # frames are picked by their timestamps, so the recorder needs all of them
+        data_handler.subscribe("frame_bw", recorder.processFrame, FullRate(), recorder.is_recording)
+
+    phase_worker = None
+    if args.phase is not None:
+        phase_worker = PhaseWorker(args.phase, parameters, use_process=args.phase_process,
+                                   part_size=args.phase_part_size)
+        is_idle = phase_worker.is_idle
+        if args.phase_rate > 0:
+            # the newest frame when the worker is idle, but not more often than phase_rate
+            limit = DisplayRate(args.phase_rate)
+            is_idle = lambda: phase_worker.is_idle() and limit.accept(time.time())
+        data_handler.subscribe("frame_bw", phase_worker.post, LatestWhenIdle(is_idle))
+
+    if args.duration > 0:
+        QTimer.singleShot(int(args.duration * 1000), app.quit)
+    if args.camera == "replay":
+        camera.replay_thread.finished.connect(app.quit)
+
+    # Ctrl+C: the timer gives the Python interpreter a chance to handle the signal while Qt is running
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(200)
+
+    data_handler.change_camera(camera)
+    if recorder is not None:
+        recorder.startRecording(args.output, args.rate, args.images, args.averages)
+    if recorder is None or recorder.is_recording():
+        app.exec_()
+
+    camera.stop()
+    if recorder is not None and recorder.is_recording():
+        recorder.stopRecording()
+    if phase_worker is not None:
+        phase_worker.stop()
+        phase_worker.wait()
+        phase_worker.shutdown()
+        if phase_worker.saved:
+            print("{} phase images saved to {} files {}_*.".format(phase_worker.saved, phase_worker.parts,
+                                                                   os.path.splitext(args.phase)[0]))
+        else:
+            print("No phase images saved.", file=sys.stderr)
+    if args.diagnostics is not None:
+        instrumentation.instrumentation.write_csv(args.diagnostics)
+
+
+if __name__ == "__main__":
+    main()
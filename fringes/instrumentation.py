@@ -0,0 +1,172 @@
+import bisect
+import csv
+import functools
+import itertools
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Stage:
+    """
+    Statistics of one stage of the pipeline (capture, distribution of the frames, a plugin worker...): how often it
+    ran, how long it took (as a histogram with logarithmic bins) and at which rate it ran recently.
+    """
+
+    # upper edges of the histogram bins, in ms (the last bin takes everything above):
+    bin_edges = [float(edge) for edge in np.logspace(-2, 4, 61)]
+    # the rate is averaged over this time, in s:
+    rate_window = 2.
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.histogram = [0] * (len(self.bin_edges) + 1)
+        self.timed = 0
+        self._times = deque()
+
+    def add(self, duration, now):
+        """
+        :param duration: in ms, None for events without a duration
+        :param now: time.perf_counter()
+        """
+        self.count += 1
+        self._times.append(now)
+        while self._times[0] < now - self.rate_window:
+            self._times.popleft()
+        if duration is not None:
+            self.total += duration
+            self.max = max(self.max, duration)
+            self.timed += 1
+            self.histogram[bisect.bisect_left(self.bin_edges, duration)] += 1
+
+    def rate(self, now):
+        """
+        Events per second during the last rate_window seconds
+        """
+        while self._times and self._times[0] < now - self.rate_window:
+            self._times.popleft()
+        return len(self._times) / self.rate_window
+
+    def mean(self):
+        timed = self.timed
+        return self.total / timed if timed else None
+
+    def percentile(self, q):
+        """
+        Approximate percentile of the durations (upper edge of its histogram bin), in ms
+        """
+        timed = self.timed
+        if not timed:
+            return None
+        index = bisect.bisect_left(list(itertools.accumulate(self.histogram)), q / 100 * timed)
+        if index >= len(self.bin_edges):
+            return self.max
+        return min(self.bin_edges[index], self.max)
+
+
+class Instrumentation:
+    """
+    Collects the timing of the stages of the pipeline, event counters (frames in, dropped frames...) and values
+    reported by the hardware (e.g. frames dropped by the camera SDK). Thread safe, and cheap enough to be always on
+    (a few microseconds per measurement).
+
+    Usually used through the module level functions measure(), timed(), count() and set_value().
+    """
+
+    columns = ("name", "count", "rate (1/s)", "mean (ms)", "median (ms)", "95% (ms)", "max (ms)", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = OrderedDict()
+        self._values = OrderedDict()
+
+    def _stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = Stage(name)
+        return stage
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Time a block of code: with instrumentation.measure("stage"): ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            with self._lock:
+                self._stage(name).add((now - start) * 1000, now)
+
+    def timed(self, name):
+        """
+        Decorator that measures every call of a function
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.measure(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name):
+        """
+        Count an event, e.g. an incoming or a dropped frame
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self._stage(name).add(None, now)
+
+    def set_value(self, name, value):
+        """
+        Report a value that is counted elsewhere, e.g. by the camera
+        """
+        with self._lock:
+            self._values[name] = value
+
+    def reset(self):
+        with self._lock:
+            for stage in self._stages.values():
+                stage.reset()
+            self._values.clear()
+
+    def rows(self):
+        """
+        :return: a list of rows (see columns) with the current numbers; None where a number doesn't apply
+        """
+        now = time.perf_counter()
+        rows = []
+        with self._lock:
+            for name, stage in self._stages.items():
+                timed = stage.timed > 0
+                rows.append((name, stage.count, stage.rate(now), stage.mean(), stage.percentile(50),
+                             stage.percentile(95), stage.max if timed else None, None))
+            for name, value in self._values.items():
+                rows.append((name, None, None, None, None, None, None, value))
+        return rows
+
+    def write_csv(self, filename):
+        with open(filename, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.columns)
+            for row in self.rows():
+                writer.writerow(["" if value is None else value for value in row])
+
+
+# the instrumentation of the application:
+instrumentation = Instrumentation()
+measure = instrumentation.measure
+timed = instrumentation.timed
+count = instrumentation.count
+set_value = instrumentation.set_value
@@ -0,0 +1,117 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+import instrumentation
+
+
+# the functions that calculate the nodes of the graph, see node():
+nodes = {}
+_lock = threading.Lock()
+
+
+def node(name):
+    """
+    Decorator that declares a named intermediate result. The function is called with the frame and keyword
+    parameters, and may get other intermediates of the same frame with get(). Its result must not depend on anything
+    but the frame and the parameters, and is read-only for everyone (like the frame data).
+    """
+    def decorator(func):
+        nodes[name] = func
+        return func
+    return decorator
+
+
+def get(frame, name, **parameters):
+    """
+    An intermediate result for the data of a frame. Each node is calculated only once per frame and set of
+    parameters, no matter how many consumers ask for it: the others get the stored result, and if it is still
+    being calculated in another thread, they wait for it.
+
+    The results are stored with the frame (each derived frame, i.e. each data stream, has its own), so they go
+    away together with it.
+    :param frame: Frame, e.g. the clipped grayscale data a plugin got from the DataHandler
+    :param name: one of nodes
+    :param parameters: parameters of the node, must be hashable
+    :return: the result of the node
+    """
+    key = (name, tuple(sorted(parameters.items())))
+    with _lock:
+        if frame.intermediates is None:
+            frame.intermediates = {}
+        future = frame.intermediates.get(key)
+        calculate = future is None
+        if calculate:
+            future = frame.intermediates[key] = Future()
+
+    if not calculate:
+        instrumentation.count("intermediates: {} reused".format(name))
+        return future.result()
+
+    try:
+        with instrumentation.measure("intermediates: {}".format(name)):
+            result = _read_only(nodes[name](frame, **parameters))
+    except BaseException as err:
+        future.set_exception(err)
+        raise
+    future.set_result(result)
+    return result
+
+
+def _read_only(result):
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+    elif isinstance(result, tuple):
+        for item in result:
+            _read_only(item)
+    return result
+
+
+@node("highpass")
+def highpass(frame, sigma, blur=0):
+    """
+    High-pass filtered data, see vortex_tools_core.highpass
+    """
+    import plugins.libs.vortex_tools_core as vtc
+    return vtc.highpass(frame.array, sigma, blur)
+
+
+@node("preprocessed")
+def preprocessed(frame, highpass=None, window=False):
+    """
+    Data prepared for the Fourier transform
+    :param highpass: None, or (sigma, blur) of the high-pass filter
+    :param window: apply a window function (vortex_tools_core.apply_window)
+    """
+    import plugins.libs.vortex_tools_core as vtc
+    data = frame.array if highpass is None else get(frame, "highpass", sigma=highpass[0], blur=highpass[1])
+    if window:
+        data = vtc.apply_window(data)
+    return data
+
+
+@node("fft")
+def fft(frame, transform_size, highpass=None, window=False):
+    """
+    Centered Fourier transform and power spectrum of the preprocessed data, see vortex_tools_core.fourier_transform
+    """
+    import plugins.libs.vortex_tools_core as vtc
+    return vtc.fourier_transform(get(frame, "preprocessed", highpass=highpass, window=window), transform_size)
+
+
+@node("pyramid")
+def pyramid(frame, levels=3):
+    """
+    The grayscale data downsampled by 2, 4, 8... (mean of 2x2 pixels of the previous level), in float32
+    :return: tuple with one array per level
+    """
+    data = frame.array
+    result = []
+    for _ in range(levels):
+        height, width = data.shape[0] // 2, data.shape[1] // 2
+        if height == 0 or width == 0:
+            break
+        data = data[:2 * height, :2 * width].reshape(height, 2, width, 2).mean(axis=(1, 3), dtype=np.float32)
+        result.append(data)
+    return tuple(result)
@@ -0,0 +1,96 @@
+import sys
+import time
+import traceback
+
+from PyQt5.QtCore import QThread, QMutex, QMutexLocker, QWaitCondition
+
+import instrumentation
+
+
+class MailboxWorker(QThread):
+    """
+    A thread that works on the newest item (usually a frame) posted to it.
+
+    The mailbox holds a single item: if a new one is posted before the worker got to the previous one, the previous
+    one is replaced and counted as dropped. The thread sleeps on a wait condition while there is nothing to do, and
+    is started by the first post().
+
+    Subclasses implement process(item), which is called in the worker thread.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._mutex = QMutex()
+        self._condition = QWaitCondition()
+        self._abort = False
+        self._item = None
+        self._has_item = False
+        self._busy = False
+        # statistics:
+        self.posted = 0
+        self.processed = 0
+        self.dropped = 0
+        # rate_policy.Budget that gets the processing time of each item, if any:
+        self.budget = None
+
+    def post(self, item):
+        """
+        Hand a new item to the worker, replacing one that is still waiting
+        """
+        with QMutexLocker(self._mutex):
+            if self._has_item:
+                self.dropped += 1
+                instrumentation.count("{}: dropped".format(type(self).__name__))
+            self._item = item
+            self._has_item = True
+            self.posted += 1
+            self._condition.wakeOne()
+            start = not self.isRunning()
+            if start:
+                self._abort = False
+        if start:
+            self.start()
+
+    def is_idle(self):
+        """
+        True if the worker is ready for a new item
+        """
+        with QMutexLocker(self._mutex):
+            return not self._busy and not self._has_item
+
+    def stop(self):
+        """
+        Stop after the current item; wait() for the thread to finish
+        """
+        with QMutexLocker(self._mutex):
+            self._abort = True
+            self._condition.wakeOne()
+
+    def run(self):
+        while True:
+            with QMutexLocker(self._mutex):
+                while not self._has_item and not self._abort:
+                    self._condition.wait(self._mutex)
+                if self._abort:
+                    break
+                item = self._item
+                self._item = None
+                self._has_item = False
+                self._busy = True
+
+            start = time.perf_counter()
+            try:
+                with instrumentation.measure("{}: process".format(type(self).__name__)):
+                    self.process(item)
+            except Exception:
+                print("Error in {}:".format(type(self).__name__), file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                if self.budget is not None:
+                    self.budget.add_time(time.perf_counter() - start)
+                with QMutexLocker(self._mutex):
+                    self._busy = False
+                    self.processed += 1
+
+    def process(self, item):
+        return NotImplementedError()
@@ -1,39 +1,60 @@
+import time
+# startup time is measured from here, see report_startup_time:
+start_time = time.perf_counter()
+
 import sys
 
 from PyQt5 import QtWidgets
 from PyQt5.QtGui import QPalette, QColor, QIcon
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, qDebug
 
+import instrumentation
 from main_window import MainWindow
 
 
-app = QtWidgets.QApplication(sys.argv)
-app.setWindowIcon(QIcon('fringes.png'))
-app.setStyle("Fusion")
+def report_startup_time(window):
+    startup_time = time.perf_counter() - start_time
+    instrumentation.set_value("startup time (s)", round(startup_time, 3))
+    qDebug("Started in {:.2f} s".format(startup_time))
+    window.show_message("Started in {:.2f} s".format(startup_time))
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+    app.setWindowIcon(QIcon('fringes.png'))
+    app.setStyle("Fusion")
+
+    dark_palette = QPalette()
+
+    dark_palette.setColor(QPalette.Window, QColor(53, 53, 53))
+    dark_palette.setColor(QPalette.WindowText, Qt.white)
+    dark_palette.setColor(QPalette.Base, QColor(25, 25, 25))
+    dark_palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
+    dark_palette.setColor(QPalette.ToolTipBase, Qt.white)
+    dark_palette.setColor(QPalette.ToolTipText, Qt.white)
+    dark_palette.setColor(QPalette.Text, Qt.white)
+    dark_palette.setColor(QPalette.Button, QColor(53, 53, 53))
+    dark_palette.setColor(QPalette.ButtonText, Qt.white)
+    dark_palette.setColor(QPalette.BrightText, Qt.red)
+    dark_palette.setColor(QPalette.Link, QColor(42, 130, 218))
+    dark_palette.setColor(QPalette.Highlight, QColor(42, 130, 218))
+    dark_palette.setColor(QPalette.HighlightedText, Qt.black)
+    dark_palette.setColor(QPalette.Disabled, QPalette.Text, Qt.darkGray)
+    dark_palette.setColor(QPalette.Disabled, QPalette.ButtonText, Qt.darkGray)
 
-dark_palette = QPalette()
+    app.setPalette(dark_palette)
 
-dark_palette.setColor(QPalette.Window, QColor(53, 53, 53))
-dark_palette.setColor(QPalette.WindowText, Qt.white)
-dark_palette.setColor(QPalette.Base, QColor(25, 25, 25))
-dark_palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
-dark_palette.setColor(QPalette.ToolTipBase, Qt.white)
-dark_palette.setColor(QPalette.ToolTipText, Qt.white)
-dark_palette.setColor(QPalette.Text, Qt.white)
-dark_palette.setColor(QPalette.Button, QColor(53, 53, 53))
-dark_palette.setColor(QPalette.ButtonText, Qt.white)
-dark_palette.setColor(QPalette.BrightText, Qt.red)
-dark_palette.setColor(QPalette.Link, QColor(42, 130, 218))
-dark_palette.setColor(QPalette.Highlight, QColor(42, 130, 218))
-dark_palette.setColor(QPalette.HighlightedText, Qt.black)
-dark_palette.setColor(QPalette.Disabled, QPalette.Text, Qt.darkGray)
-dark_palette.setColor(QPalette.Disabled, QPalette.ButtonText, Qt.darkGray)
+    app.setStyleSheet("QToolTip { color: #ffffff; background-color: #2a82da; border: 1px solid white; }")
 
-app.setPalette(dark_palette)
+    window = MainWindow()
+    app.aboutToQuit.connect(window.data_handler.plugin_loader.stop)
 
-app.setStyleSheet("QToolTip { color: #ffffff; background-color: #2a82da; border: 1px solid white; }")
+    window.show()
+    # called as soon as the event loop runs, i.e. the window is on the screen:
+    QTimer.singleShot(0, lambda: report_startup_time(window))
+    sys.exit(app.exec_())
 
-window = MainWindow()
 
-window.show()
-sys.exit(app.exec_())
+# guarded, because worker processes (process_executor) import the main module again
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import numpy as np
-import time
 import pyqtgraph as pg
 from PyQt5.QtCore import pyqtSlot, pyqtSignal, qDebug, QRectF, QRect, Qt
-from PyQt5.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QDialog, QGridLayout, QLabel, QDoubleSpinBox, QAction
+from PyQt5.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QDialog, QGridLayout, QLabel, QDoubleSpinBox, QAction, \
+    QApplication
 
 from ui.main_window import Ui_MainWindow
 from camera_dialog import CameraDialog
 from data_handler import DataHandler
+from diagnostics_dialog import DiagnosticsDialog
+from frame import Frame
 from plugin_dialog import PluginDialog
+from plugin_loader import PluginPlaceholder
 
 
 class MainWindow(QMainWindow):
@@ -67,6 +70,7 @@ class MainWindow(QMainWindow):
         self.image_item = pg.ImageItem()
         self.image_item.setOpts(axisOrder='row-major')
         self.plot_box.addItem(self.image_item)
+        self.image_offset = (0, 0)
 
         self.roi = None
         self.ui.selectDataButton.toggled.connect(self.show_roi)
@@ -78,9 +82,11 @@ class MainWindow(QMainWindow):
         self.ui.camSettingsWidget.setLayout(self.settings_layout)
 
         self.data_handler = DataHandler()
-        for plugin in self.data_handler.plugins:
-            self.add_plugin(plugin.get_widget(), plugin.name)
-        self.data_handler.ndarray_available.connect(self.show_ndarray)
+        # the plugins are loaded when their tab is opened for the first time
+        for info in self.data_handler.plugin_loader.available:
+            self.add_plugin(PluginPlaceholder(info), info.name)
+        self.ui.tabWidget.currentChanged.connect(self.load_plugin_tab)
+        self.data_handler.subscribe("frame", self.show_frame)
         self.data_handler.camera_controls_changed.connect(self.set_camera_controls)
         self.ui.actionSave_image.triggered.connect(self.data_handler.save_file)
         self.data_handler.enable_saturation_widget.connect(self.enable_saturation_bar)
@@ -99,9 +105,26 @@ class MainWindow(QMainWindow):
         self.hline = None
         self.vline = None
 
-    @pyqtSlot(np.ndarray)
-    def show_ndarray(self, array):
-        self.image_item.setImage(array)
+        # let the camera itself crop to the selected data, if it can:
+        self.actionHardware_roi = QAction("Hardware ROI", self)
+        self.actionHardware_roi.setCheckable(True)
+        self.actionHardware_roi.setToolTip("Read out only the selected region from the sensor (faster)")
+        self.actionHardware_roi.toggled.connect(self.data_handler.set_hardware_roi)
+        self.ui.toolBar.insertAction(self.ui.actionTune_camera_parameters, self.actionHardware_roi)
+
+        # timing of the processing pipeline:
+        self.actionDiagnostics = QAction("Diagnostics", self)
+        self.actionDiagnostics.setToolTip("Show the timing of the processing stages and the dropped frames")
+        self.actionDiagnostics.triggered.connect(self.show_diagnostics)
+        self.ui.toolBar.addAction(self.actionDiagnostics)
+
+    @pyqtSlot(Frame)
+    def show_frame(self, frame):
+        self.image_item.setImage(frame.array)
+        # with a hardware ROI, the frame is only a part of the sensor:
+        if frame.roi_offset != self.image_offset:
+            self.image_offset = frame.roi_offset
+            self.image_item.setPos(*frame.roi_offset)
 
     @pyqtSlot(QWidget)
     def set_camera_controls(self, controls):
@@ -129,6 +152,27 @@ class MainWindow(QMainWindow):
     def add_plugin(self, widget: QWidget, name: str):
         self.ui.tabWidget.addTab(widget, name)
 
+    @pyqtSlot(int)
+    def load_plugin_tab(self, index):
+        placeholder = self.ui.tabWidget.widget(index)
+        if not isinstance(placeholder, PluginPlaceholder):
+            return
+        self.ui.statusbar.showMessage("Loading {}...".format(placeholder.info.name))
+        QApplication.processEvents()
+        plugin = self.data_handler.plugin_loader.load(placeholder.info)
+        if plugin is None:
+            placeholder.setText("{} could not be loaded, see the console output.".format(placeholder.info.name))
+            self.ui.statusbar.clearMessage()
+            return
+        # replace the placeholder, without loading the plugins of the tabs in between
+        self.ui.tabWidget.blockSignals(True)
+        self.ui.tabWidget.removeTab(index)
+        self.ui.tabWidget.insertTab(index, plugin.get_widget(), plugin.name)
+        self.ui.tabWidget.setCurrentIndex(index)
+        self.ui.tabWidget.blockSignals(False)
+        placeholder.deleteLater()
+        self.ui.statusbar.clearMessage()
+
     @pyqtSlot(str)
     def show_message(self, message):
         self.ui.statusbar.showMessage(message, 5000)
@@ -153,7 +197,7 @@ class MainWindow(QMainWindow):
     def reset_roi(self):
         self.ui.selectDataButton.setChecked(False)
         self.show_roi(False)
-        self.data_handler.clip_size = None
+        self.data_handler.reset_clip_size()
 
     @pyqtSlot()
     def on_roi_changed(self):
@@ -182,6 +226,12 @@ class MainWindow(QMainWindow):
                 self.plot_box.removeItem(self.vline)
                 self.vline = None
 
+    def show_diagnostics(self):
+        dialog = DiagnosticsDialog(parent=self)
+        dialog.show()
+        dialog.raise_()
+        dialog.activateWindow()
+
     def tune_pid(self):
         try:
             dialog = self.PidDialog(parent=self)
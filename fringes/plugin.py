@@ -6,8 +6,39 @@ from PyQt5.QtCore import QObject, pyqtProperty, pyqtSignal, pyqtSlot
 from PyQt5.QtQml import qmlRegisterType
 from PyQt5.QtWidgets import QWidget
 
+from frame import Frame
+from rate_policy import DisplayRate
+
 
 class Plugin(QObject):
+    """
+    Base class for plugins.
+
+    Data arrives as Frame objects (the array plus capture time, sequence number, exposure...) in the process_*frame
+    slots. By default these just pass the array on to the corresponding process_*ndarray slot, so plugins that
+    don't need the metadata can simply override those.
+
+    The arrays in the frames are read-only and shared with all other consumers: never modify them in place (see
+    Frame). Run the program with FRINGES_CHECK_FRAMES=1 to check for this.
+
+    A plugin only gets the data streams whose process_* methods it overrides (see DataHandler), and only while
+    is_active() returns True. How many frames it gets is set by its rate_policy (see rate_policy.py), by default
+    the display rate.
+
+    The processing time of the workers of a plugin (see workers()), or of its process_* methods if it has no
+    workers, counts against its CPU budget: a plugin that needs more than cpu_budget seconds per second only gets
+    every Nth frame (see PluginLoader and rate_policy.Budget). Plugins that must see every frame, like the recorder
+    and the averaging, set cpu_budget to None. They are exempt from the budget, so they must do their work in
+    threads of their own; their process_* methods only hand the frames on (through queued signals), otherwise they
+    would slow down the GUI thread at the full frame rate.
+
+    Plugins that can work on several frames at once (a stacked FFT, statistics over frames...) may override
+    process_batch instead of the per-frame slots: they get the frames of batch_stream stacked in an array, up to
+    batch_size at a time (see FrameBatcher in plugin_loader.py).
+
+    Calculations that other plugins might need as well (Fourier transform, high-pass filter...) should be taken
+    from the intermediates of the frame (see intermediates.py), so that they are done only once per frame.
+    """
 
     message = pyqtSignal(str)
 
@@ -16,10 +47,17 @@ class Plugin(QObject):
         super().__init__()
 
         self._name = name
-        self.process_frame = None
         self.init = None
         self.show_window = None
         self._active = False
+        self.rate_policy = DisplayRate()
+        # share of one CPU core, None for no limit:
+        self.cpu_budget = 0.25
+        # for process_batch: the stream, the number of frames per batch, and how long (in s) an incomplete batch
+        # waits for more frames:
+        self.batch_stream = "frame_bw"
+        self.batch_size = 8
+        self.batch_delay = 0.1
 
     def get_widget(self):
         return QWidget()
@@ -27,8 +65,46 @@ class Plugin(QObject):
     def getName(self):
         return self._name
 
+    def is_active(self):
+        return self._active
+
+    def consumed_streams(self):
+        """
+        The data streams this plugin processes: those for which it overrides process_<stream> or the
+        corresponding process_*ndarray method
+        """
+        streams = []
+        for stream in ("frame", "frame_bw", "clipped_frame", "clipped_frame_bw"):
+            for method in ("process_" + stream, "process_" + stream.replace("frame", "ndarray")):
+                if getattr(type(self), method) is not getattr(Plugin, method):
+                    streams.append(stream)
+                    break
+        return streams
+
+    def workers(self):
+        """
+        The MailboxWorkers that do the processing of this plugin, their time counts against the CPU budget
+        """
+        return []
+
     name = pyqtProperty('QString', fget=getName, constant=True)
 
+    @pyqtSlot(Frame)
+    def process_frame(self, frame: Frame):
+        self.process_ndarray(frame.array)
+
+    @pyqtSlot(Frame)
+    def process_frame_bw(self, frame: Frame):
+        self.process_ndarray_bw(frame.array)
+
+    @pyqtSlot(Frame)
+    def process_clipped_frame(self, frame: Frame):
+        self.process_clipped_ndarray(frame.array)
+
+    @pyqtSlot(Frame)
+    def process_clipped_frame_bw(self, frame: Frame):
+        self.process_clipped_ndarray_bw(frame.array)
+
     @pyqtSlot(np.ndarray)
     def process_ndarray(self, array: np.ndarray):
         pass
@@ -45,9 +121,30 @@ class Plugin(QObject):
     def process_clipped_ndarray_bw(self, array: np.ndarray):
         pass
 
+    def has_batches(self):
+        """
+        True if the plugin overrides process_batch
+        """
+        return type(self).process_batch is not Plugin.process_batch
+
+    @pyqtSlot(np.ndarray)
+    def process_batch(self, frames: np.ndarray):
+        """
+        Optional: process several frames of batch_stream at once
+        :param frames: read-only array [N, y, x] (or [N, y, x, color]) with the frames in the order of arrival,
+            N <= batch_size
+        """
+        pass
+
     @pyqtSlot(bool)
     def set_active(self, active: bool):
         self._active = active
 
+    def stop(self):
+        """
+        Called when the program exits: stop any threads of the plugin
+        """
+        pass
+
 
 qmlRegisterType(Plugin, 'Plugins', 1, 0, 'Plugin')
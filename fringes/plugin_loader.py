@@ -1,52 +1,218 @@
+import ast
 import importlib
 import os
 import sys
+import time
 import traceback
+from collections import namedtuple
 from enum import Enum
 
 import numpy as np
 from PyQt5.QtCore import QObject, pyqtProperty, pyqtSignal, pyqtSlot, QAbstractListModel, Qt, QModelIndex, \
-    QVariant, QSize, QRectF
+    QVariant, QSize, QRectF, QSettings, QTimer
 from PyQt5.QtQml import qmlRegisterType
-from PyQt5.QtWidgets import QWidget
+from PyQt5.QtWidgets import QWidget, QLabel
 
+import instrumentation
+from frame import Frame
 from plugin import Plugin
+from rate_policy import Budget
+
+
+# what is known about a plugin before it is imported: its module and the module level name and description
+PluginInfo = namedtuple("PluginInfo", ["module", "name", "description"])
+
+
+def read_manifest(path):
+    """
+    Name and description of a plugin, read from the module level assignments `name = "..."` and
+    `description = "..."` in its source, without importing it
+    :param path: path of the plugin module
+    :return: dict with the string constants name and description (if present)
+    """
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=path)
+    manifest = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and \
+                isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in ("name", "description"):
+                    manifest[target.id] = node.value.value
+    return manifest
+
+
+class PluginPlaceholder(QLabel):
+    """
+    Takes the place of the widget of a plugin that is not loaded yet, see PluginLoader
+    """
+
+    def __init__(self, info, parent=None):
+        super().__init__(info.description, parent)
+        self.info = info
+        self.setAlignment(Qt.AlignCenter)
+
+
+class FrameBatcher(QObject):
+    """
+    Collects the frames for Plugin.process_batch: they are copied into a stacked array, which is passed on when it
+    is full, or when its first frame has waited for `delay` seconds (so that a slow camera doesn't hold the frames
+    back, and no frames are left over when the plugin stops taking data). A change of the frame size or type starts
+    a new batch.
+    """
+
+    def __init__(self, callback, size, delay, parent=None):
+        """
+        :param callback: called with the array of frames, e.g. Plugin.process_batch
+        :param size: maximum number of frames per batch
+        :param delay: in s
+        """
+        super().__init__(parent)
+        self.callback = callback
+        self.size = size
+        self._buffer = None
+        self._count = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(int(delay * 1000))
+        self._timer.timeout.connect(self.flush)
+
+    @pyqtSlot(Frame)
+    def add(self, frame: Frame):
+        array = frame.array
+        if self._buffer is not None and (self._buffer.shape[1:] != array.shape or self._buffer.dtype != array.dtype):
+            self.flush()
+        if self._buffer is None:
+            self._buffer = np.empty((self.size,) + array.shape, array.dtype)
+        self._buffer[self._count] = array
+        self._count += 1
+        if self._count == 1:
+            self._timer.start()
+        if self._count == self.size:
+            self.flush()
+
+    @pyqtSlot()
+    def flush(self):
+        """
+        Pass on the frames collected so far
+        """
+        self._timer.stop()
+        if self._count == 0:
+            return
+        frames = self._buffer[:self._count]
+        frames.flags.writeable = False
+        # the consumer may keep the batch, the next one gets a new buffer
+        self._buffer = None
+        self._count = 0
+        self.callback(frames)
 
 
 class PluginLoader(QObject):
+    """
+    Finds the plugins in the plugin folder, and loads them when they are needed.
+
+    Importing the plugins (matplotlib, scikit-image, xarray...) and building their widgets takes a while, so at
+    startup only the name and description of each plugin are read from its source (see read_manifest). A plugin
+    is imported and instantiated by load(), e.g. when its tab is opened for the first time.
 
-    ndarray_available = pyqtSignal(np.ndarray)
-    ndarray_bw_available = pyqtSignal(np.ndarray)
-    clipped_ndarray_available = pyqtSignal(np.ndarray)
-    clipped_ndarray_bw_available = pyqtSignal(np.ndarray)
+    The loader also keeps the plugins within their CPU budget: the processing time of their workers (or, for
+    plugins without workers, of their process_* methods) is measured, and a plugin that needs more than its budget
+    only gets every Nth frame (see rate_policy.Budget). The budget of a plugin can be changed in the settings,
+    group PluginBudgets, key: module name, value: share of one CPU core (0 for no limit). Plugins without a budget
+    must work in threads of their own, see Plugin.
+
+    For plugins that process batches of frames, the loader keeps a FrameBatcher (see batchers).
+    """
+
+    plugin_loaded = pyqtSignal(QObject)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._plugin_folder = "plugins"
+        # PluginInfo of all plugins, and the loaded plugins:
+        self.available = []
         self.plugins = []
+        self._loaded = {}
+        # FrameBatcher of each loaded plugin that overrides process_batch:
+        self.batchers = {}
 
         # find candidates for plugins
         for file in sorted(os.listdir("./" + self._plugin_folder)):
             if file.endswith(".py"):
-                name = os.path.splitext(file)[0]
-
-                # try to import:
-                plugin_import = importlib.import_module(self._plugin_folder + "." + name)
-                if plugin_import is None:
-                    print("Error importing plugin {} !".format(file))
+                module = os.path.splitext(file)[0]
+                try:
+                    manifest = read_manifest(os.path.join(self._plugin_folder, file))
+                except (OSError, SyntaxError, ValueError):
+                    print("Error reading plugin {}!\n".format(file), file=sys.stderr)
+                    traceback.print_exc()
                     continue
+                self.available.append(PluginInfo(module, manifest.get("name", module),
+                                                 manifest.get("description", "")))
 
-                try:
-                    plugin = plugin_import.get_instance(self)
-                    self.ndarray_available.connect(plugin.process_ndarray)
-                    self.ndarray_bw_available.connect(plugin.process_ndarray_bw)
-                    self.clipped_ndarray_available.connect(plugin.process_clipped_ndarray)
-                    self.clipped_ndarray_bw_available.connect(plugin.process_clipped_ndarray_bw)
+    def load(self, info):
+        """
+        Import and instantiate a plugin, if it is not loaded yet
+        :param info: PluginInfo
+        :return: the plugin, or None if it couldn't be loaded
+        """
+        if info.module in self._loaded:
+            return self._loaded[info.module]
 
-                    # if it was possible to import it, the plugin goes in the list:
-                    self.plugins.append(plugin)
+        try:
+            with instrumentation.measure("plugin: load {}".format(info.name)):
+                plugin_import = importlib.import_module(self._plugin_folder + "." + info.module)
+                plugin = plugin_import.get_instance(self)
+        except Exception:
+            print("Error importing plugin {}!\n".format(info.module), file=sys.stderr)
+            traceback.print_exc()
+            print()
+            return None
 
-                except Exception:
-                    print("Error importing plugin {}!\n".format(file), file=sys.stderr)
-                    traceback.print_exc()
-                    print()
+        self._apply_budget(plugin, info)
+        if plugin.has_batches():
+            self.batchers[plugin] = FrameBatcher(plugin.process_batch, plugin.batch_size, plugin.batch_delay, self)
+        self._loaded[info.module] = plugin
+        self.plugins.append(plugin)
+        self.plugin_loaded.emit(plugin)
+        return plugin
+
+    def _apply_budget(self, plugin, info):
+        """
+        Wrap the rate policy of the plugin in a Budget and report the processing time of its workers to it. Without
+        workers, the DataHandler reports the time of the process_* calls (see Budget.measure_callbacks).
+        """
+        settings = QSettings("Fringes", "Fringes")
+        settings.beginGroup("PluginBudgets")
+        budget = settings.value(info.module, plugin.cpu_budget)
+        settings.endGroup()
+        if not budget or float(budget) <= 0:
+            return
+        budget = float(budget)
+
+        # the decimation takes a few steps to settle, don't flood the status bar:
+        last_message = [0.]
+
+        def changed(decimation):
+            instrumentation.set_value("plugin: {} decimation".format(info.name), decimation)
+            now = time.monotonic()
+            if decimation > 1 and now - last_message[0] < 5:
+                return
+            last_message[0] = now
+            if decimation > 1:
+                plugin.message.emit("{} needs {:.0f} ms per frame, more than its CPU budget of {:.0%}: processing "
+                                    "only 1 of {} frames".format(info.name, 1000 * policy.time_per_frame, budget,
+                                                                  decimation))
+            else:
+                plugin.message.emit("{} is within its CPU budget again, no longer skipping frames".format(info.name))
+
+        policy = Budget(plugin.rate_policy, budget, changed)
+        plugin.rate_policy = policy
+        workers = plugin.workers()
+        for worker in workers:
+            worker.budget = policy
+        policy.measure_callbacks = not workers
+
+    @pyqtSlot()
+    def stop(self):
+        for plugin in self.plugins:
+            plugin.stop()
@@ -1,5 +1,4 @@
 import os
-import matplotlib.pyplot as plt
 import pyqtgraph as pg
 from scipy.misc import imsave
 
@@ -9,22 +8,16 @@ from PyQt5.QtWidgets import QHBoxLayout, QGroupBox, QLabel, QPushButton, QFileDi
     QDoubleSpinBox, QVBoxLayout, QSpinBox, QWidget, QProgressBar
 from scipy.misc import imsave
 
+import colormaps
+import instrumentation
 import plugin_canvas
 from plugin import Plugin
+from rate_policy import FullRate
 from data_saver import SaveNameGenerator, xarray_from_frame
 
 
-name = "Sequence recorder"
-description = "Saves a sequence of images"
-
-
-def generatePgColormap(cm_name):
-    pltMap = plt.get_cmap(cm_name)
-    colors = pltMap.colors
-    colors = [c + [1.] for c in colors]
-    positions = np.linspace(0, 1, len(colors))
-    pgMap = pg.ColorMap(positions, colors)
-    return pgMap
+name = "Averaging"
+description = "Averages a number of frames"
 
 
 # this does the calculations in another thread:
@@ -45,25 +38,33 @@ class AveragingWorker(QObject):
         self._filename = "/home"
         self._rate = None
         self._nextFrameTime = None
-        self._arrays = None
-
-    def processFrame(self, frame):
+        # running sum of the frames:
+        self._sum = None
+
+    @pyqtSlot(np.ndarray)
+    @instrumentation.timed("AveragingWorker: process")
+    def processBatch(self, frames):
+        """
+        :param frames: array [N, y, x], see Plugin.process_batch
+        """
         if self._recording:
-            if self._arrays is None:
-                self._arrays = frame
-                self.averagedImageAvailable.emit(frame)
-            else:
-                self._arrays = np.dstack((self._arrays, frame))
-                averaged = self._arrays.mean(axis=2)
-                self.averagedImageAvailable.emit(averaged)
-            self._images_recorded += 1
+            frames = frames[:self._total_images - self._images_recorded]
+            if self._sum is None:
+                self._sum = np.zeros(frames.shape[1:])
+            self._sum += frames.sum(axis=0, dtype=np.float64)
+            self._images_recorded += frames.shape[0]
+            self.averagedImageAvailable.emit(self.average())
             self.imagesRecorded.emit(self._images_recorded)
             if self._images_recorded >= self._total_images:
                 self.stopRecording()
 
+    def average(self):
+        return self._sum / self._images_recorded
+
+    @pyqtSlot(str)
     def save_as_png(self, filename):
         try:
-            averaged = self._arrays.mean(axis=2)
+            averaged = self.average()
             if os.path.isfile(filename):
                 os.remove(filename)
             imsave(filename, averaged)
@@ -71,9 +72,10 @@ class AveragingWorker(QObject):
         except:
             self.message.emit("{} not saved!".format(filename))
 
+    @pyqtSlot(str)
     def save_as_netcdf(self, filename):
         try:
-            averaged = self._arrays.mean(axis=2)
+            averaged = self.average()
             xarr = xarray_from_frame(averaged)
             if os.path.isfile(filename):
                 os.remove(filename)
@@ -82,21 +84,29 @@ class AveragingWorker(QObject):
         except:
             self.message.emit("{} not saved!".format(filename))
 
+    @pyqtSlot(int)
     def startRecording(self, total_images):
         self._images_recorded = 0
         self._total_images = total_images
-        self._arrays = None
+        self._sum = None
         self._recording = True
 
+    @pyqtSlot()
     def stopRecording(self):
         if self._recording:
             self._recording = False
             self.finished.emit()
 
+    def is_recording(self):
+        return self._recording
+
 
 class AveragingPlugin(Plugin):
 
-    frameAvailable = pyqtSignal(np.ndarray)
+    batchAvailable = pyqtSignal(np.ndarray)
+    startRequested = pyqtSignal(int)
+    savePngRequested = pyqtSignal(str)
+    saveNetcdfRequested = pyqtSignal(str)
 
     def __init__(self, parent, name):
         super().__init__(name)
@@ -109,6 +119,10 @@ class AveragingPlugin(Plugin):
         self.canvas.layout.removeWidget(self.canvas.active_checkbox)
         self.canvas.active_checkbox.setParent(None)
         self.set_active(True)
+        # every frame goes into the average
+        self.rate_policy = FullRate()
+        self.cpu_budget = None
+        self.batch_size = 16
 
         self.layout = QHBoxLayout()
         number_label = QLabel("# of averages:")
@@ -136,15 +150,21 @@ class AveragingPlugin(Plugin):
         self.widget.setLayout(self.layout)
         self.canvas.layout.insertWidget(0, self.widget)
 
-        magma = generatePgColormap('magma')
         self.main_plot = self.layoutWidget.addViewBox(invertY=True)
         self.main_plot.setAspectLocked()
-        self.mainImage = pg.ImageItem(lut=magma.getLookupTable())
+        self.mainImage = pg.ImageItem(lut=colormaps.lut("magma"))
         self.mainImage.setOpts(axisOrder="row-major")
         self.main_plot.addItem(self.mainImage)
 
+        # averaging takes every frame: the worker runs in its own thread, and is only used through queued signals
         self.worker_thread = AveragingWorker()
-        self.frameAvailable.connect(self.worker_thread.processFrame)
+        self.averaging_thread = QThread()
+        self.worker_thread.moveToThread(self.averaging_thread)
+        self.averaging_thread.start()
+        self.batchAvailable.connect(self.worker_thread.processBatch)
+        self.startRequested.connect(self.worker_thread.startRecording)
+        self.savePngRequested.connect(self.worker_thread.save_as_png)
+        self.saveNetcdfRequested.connect(self.worker_thread.save_as_netcdf)
         self.worker_thread.averagedImageAvailable.connect(self.set_image)
         self.start_button.clicked.connect(self.start_recording)
         self.stop_button.clicked.connect(self.worker_thread.stopRecording)
@@ -157,14 +177,18 @@ class AveragingPlugin(Plugin):
     def set_image(self, image):
         self.mainImage.setImage(image)
 
-    def process_ndarray_bw(self, frame: np.ndarray):
+    def is_active(self):
+        # frames are only needed while averaging
+        return self.worker_thread.is_recording()
+
+    def process_batch(self, frames: np.ndarray):
         if self._active:
-            self.frameAvailable.emit(frame)
+            self.batchAvailable.emit(frames)
 
     def start_recording(self):
         self.progress_bar.setValue(0)
         self.progress_bar.setMaximum(self.averages_spinbox.value())
-        self.worker_thread.startRecording(self.averages_spinbox.value())
+        self.startRequested.emit(self.averages_spinbox.value())
 
     def save_image(self):
         filter_netcdf = "netCDF file (*.nc)"
@@ -178,13 +202,13 @@ class AveragingPlugin(Plugin):
             if filter == filter_netcdf:
                 if not filename.endswith(".nc"):
                     filename += ".nc"
-                self.worker_thread.save_as_netcdf(filename)
+                self.saveNetcdfRequested.emit(filename)
             elif filter == filter_png:
                 if not filename.endswith(".png"):
                     filename += ".png"
                 if os.path.isfile(filename):
                     os.remove(filename)
-                self.worker_thread.save_as_png(filename)
+                self.savePngRequested.emit(filename)
             else:
                 raise Exception()
 
@@ -195,6 +219,10 @@ class AveragingPlugin(Plugin):
     def get_widget(self):
         return self.canvas
 
+    def stop(self):
+        self.averaging_thread.quit()
+        self.averaging_thread.wait()
+
 
 def get_instance(parent:QObject=None):
-    return AveragingPlugin(parent=parent, name="Averaging")
+    return AveragingPlugin(parent=parent, name=name)
@@ -1,27 +1,25 @@
-from PyQt5.QtCore import QThread, QObject, pyqtSignal, qDebug, QMutex, QWaitCondition, pyqtSlot
+from PyQt5.QtCore import QObject, pyqtSignal, qDebug, pyqtSlot
 from PyQt5.QtWidgets import QHBoxLayout, QGroupBox, QSpinBox, QDoubleSpinBox, QWidget, QComboBox, QLabel, QCheckBox, \
     QVBoxLayout
 import pyqtgraph as pg
 import numpy as np
-import matplotlib.pyplot as plt
-import sys
-import time
 
+import colormaps
+import intermediates
 import plugin_canvas
-import plugins.libs.vortex_tools_core as vtc
+from frame import Frame
+from mailbox_worker import MailboxWorker
 from plugin import Plugin
+from plugins.libs.phase_extraction import extract_phase, preprocessing
+from process_executor import SharedMemoryExecutor
+from rate_policy import LatestWhenIdle
 
-def generatePgColormap(cm_name):
-    pltMap = plt.get_cmap(cm_name)
-    colors = pltMap.colors
-    colors = [c + [1.] for c in colors]
-    positions = np.linspace(0, 1, len(colors))
-    pgMap = pg.ColorMap(positions, colors)
-    return pgMap
+name = "FFT and Phase Extraction"
+description = "Extracts the phase of off-axis interferograms by Fourier filtering"
 
 
 # this does the calculations in another thread:
-class FFTWorker(QThread):
+class FFTWorker(MailboxWorker):
 
     blobs = pyqtSignal(int)
     orig = pyqtSignal(np.ndarray)
@@ -36,163 +34,69 @@ class FFTWorker(QThread):
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._mutex = QMutex()
-        self._condition = QWaitCondition()
-        self.frame = None
-        self.parameters = None
-        self.abort = False
         self.transform_size = 300
-        self.last_time = 0
-        self.time_interval = 0.5
+        # run the calculations in a separate process, to keep the GIL free for the GUI and the camera:
+        self.use_process = False
+        self._executor = None
 
     def processFrame(self, frame, parameters):
-        # limit frame rate to keep interface responsive
-        if time.time() > self.last_time + self.time_interval:
-            self.last_time = time.time()
-            self._mutex.lock()
-            self.frame = frame
-            self.parameters = parameters
-            self._mutex.unlock()
-
-            if not self.isRunning():
-                self.start()
-
-    def run(self):
-        while not self.abort:
-            # copy new frame and parameters:
-            self._mutex.lock()
-            frame = self.frame
-            parameters = self.parameters
-            self.frame = None
-            self.parameters = None
-            self._mutex.unlock()
-
-            min_sigma = parameters['min_sigma']
-            max_sigma = parameters['max_sigma']
-            overlap = parameters['overlap']
-            threshold = parameters['threshold']
-            number = parameters['number']
-            method = parameters['method']
-            auto = parameters['auto']
-            blob_x = parameters['blob_x']
-            blob_y = parameters['blob_y']
-            blob_r = parameters['blob_r']
-            auto_blob = parameters['auto_blob']
-            homogenize = parameters['homogenize']
-            homogenize_value = parameters['homogenize_value']
-            homogenize_blur = parameters['homogenize_blur']
-            window = parameters["window"]
-            invWindow = parameters["invWindow"]
-
-            # convert frame to grayscale and rotate to give the correction orientation
-            # data = frame.sum(axis=2).astype(np.float64)
-            data = np.rot90(frame, axes=(1,0))
-
-            if homogenize:
-                data = vtc.highpass(data, homogenize_value, homogenize_blur)
-
-            if window:
-                data = vtc.apply_window(data)
-
-            # calculate and plot transform
-            transform, transform_abs = vtc.fourier_transform(data, self.transform_size)
-            transform_abs = np.nan_to_num(np.log(transform_abs))
-
-            if auto_blob:
-
-                try:
-                    if auto:   # automatic threshold finding
-                        blobs = vtc.find_number_blobs(transform, number=number, max_sigma=max_sigma, min_sigma=min_sigma,
-                                                 overlap=overlap, threshold=threshold, method=method)
-                    else:
-                        blobs = vtc.find_blobs(transform, max_sigma=max_sigma, min_sigma=min_sigma,
-                                               overlap=overlap, threshold=threshold, method=method)
-                    found_blobs = blobs.shape[0] == number
-                except ValueError:
-                    print("Blob detection failed!", file=sys.stderr)
-                    blobs = np.array([])
-                    found_blobs = False
-
-                if found_blobs:
-                    # success! get the main blob and do a reverse transform
-                    main_blob = vtc.pick_blob(blobs)
-
-                    # extend the main blob for greatest possible resolution:
-                    center = (self.transform_size / 2) - 1
-                    main_blob[2] = np.sqrt((main_blob[0] - center) ** 2 + (main_blob[1] - center) ** 2) / 2
-
-                    shifted_transform = vtc.mask_and_shift(transform, main_blob[0], main_blob[1], main_blob[2])
-                    if invWindow:
-                        shifted_transform = vtc.apply_window(shifted_transform)
-                    backtransform, backtransform_abs, backtransform_phase = vtc.inv_fourier_transform(shifted_transform)
-                    backtransform_phase = self.phase_shift_center(backtransform_phase)
-                    self.calculate_period(main_blob[0], main_blob[1], transform.shape)
-                else:
-                    backtransform_abs = np.zeros_like(transform_abs)
-                    backtransform_phase = backtransform_abs
-
-                # update the user interface:
-                self.blobs.emit(blobs.shape[0])
-                self.clearCircles.emit()
-                # if it's not too many, plot all blobs in blue:
-                if 0 < blobs.shape[0] < 30:
-                    for i in range(blobs.shape[0]):
-                        self.circle.emit((blobs[i, 0], blobs[i, 1]), blobs[i, 2], 'blue')
-                    if found_blobs:
-                        self.circle.emit((main_blob[0], main_blob[1]), main_blob[2], 'green')
-                        self.blob_position.emit(main_blob[0], main_blob[1], main_blob[2])
-                self.orig.emit(data)
-                self.fft.emit(transform_abs)
-                self.backtransform.emit(backtransform_abs)
-                self.phase.emit(backtransform_phase)
-
-            else:   # with fixed blob position
-                main_blob = [blob_x, blob_y, blob_r]
-                shifted_transform = vtc.mask_and_shift(transform, main_blob[0], main_blob[1], main_blob[2])
-                if invWindow:
-                    shifted_transform = vtc.apply_window(shifted_transform)
-                backtransform, backtransform_abs, backtransform_phase = vtc.inv_fourier_transform(shifted_transform)
-                backtransform_phase = self.phase_shift_center(backtransform_phase)
-                self.blobs.emit(1)
-                self.clearCircles.emit()
-                self.orig.emit(data)
-                self.fft.emit(transform_abs)
-                self.backtransform.emit(backtransform_abs)
-                self.phase.emit(backtransform_phase)
-                self.circle.emit((main_blob[0], main_blob[1]), main_blob[2], 'green')
-                self.calculate_period(main_blob[0], main_blob[1], transform.shape)
-
-            # see if new data is available, go to sleep if not
-            while True:
-                self._mutex.lock()
-                data_available = self.frame is not None and self.parameters is not None
-                self._mutex.unlock()
-                if not data_available:
-                    QThread.msleep(self.time_interval)
-                else:
-                    break
-
-    def phase_shift_center(self, phase):
-        center_x = int(phase.shape[0] / 2 - 1)
-        center_y = int(phase.shape[1] / 2 - 1)
-        shift = phase[center_x, center_y]
-        phase = (phase + 1 + shift) % 2 - 1
-        return phase
-
-    def calculate_period(self, blob_x, blob_y, shape):
-        x = abs(blob_x - shape[0] / 2)
-        y = abs(blob_y - shape[1] / 2)
-        r = np.sqrt(x**2 + y**2)
-        try:
-            period = 1 / (r / np.max(shape))
-            self.pixel_period.emit(period)
-        except RuntimeWarning:
-            pass
+        self.post((frame, parameters))
+
+    def set_use_process(self, use_process):
+        self.use_process = use_process
+
+    def process(self, item):
+        frame, parameters = item
+
+        # frames arrive in the right orientation (rows first, C-contiguous), all images are shown row-major.
+        # Blob coordinates in the transform are (row, column), they are shown as (x, y) = (column, row)
+        if self.use_process:
+            # intermediates can't be shared with other processes
+            if self._executor is None:
+                self._executor = SharedMemoryExecutor()
+            result = self._executor.run(extract_phase, frame.array, parameters, self.transform_size)
+        else:
+            # the preprocessed data and the transform are shared with other plugins that need the same
+            preprocessing_parameters = preprocessing(parameters)
+            preprocessed = intermediates.get(frame, "preprocessed", **preprocessing_parameters)
+            transform = intermediates.get(frame, "fft", transform_size=self.transform_size,
+                                          **preprocessing_parameters)
+            result = extract_phase(frame.array, parameters, self.transform_size, preprocessed, transform)
+
+        blobs = result["blobs"]
+        main_blob = result["main_blob"]
+        # update the user interface:
+        self.blobs.emit(blobs.shape[0])
+        self.clearCircles.emit()
+        if parameters['auto_blob']:
+            # if it's not too many, plot all blobs in blue:
+            if 0 < blobs.shape[0] < 30:
+                for i in range(blobs.shape[0]):
+                    self.circle.emit((blobs[i, 1], blobs[i, 0]), blobs[i, 2], 'blue')
+                if result["found_blobs"]:
+                    self.circle.emit((main_blob[1], main_blob[0]), main_blob[2], 'green')
+                    self.blob_position.emit(main_blob[1], main_blob[0], main_blob[2])
+        else:
+            self.circle.emit((main_blob[1], main_blob[0]), main_blob[2], 'green')
+        self.orig.emit(frame.array if result["data"] is None else result["data"])
+        self.fft.emit(result["transform_abs"])
+        self.backtransform.emit(result["backtransform_abs"])
+        self.phase.emit(result["phase"])
+        if result["period"] is not None:
+            self.pixel_period.emit(result["period"])
+
+    def shutdown(self):
+        """
+        Stop the worker process, call after the thread has finished
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
 
 class FFTPlugin2(Plugin):
 
-    frameAvailable = pyqtSignal(np.ndarray, dict)
+    frameAvailable = pyqtSignal(Frame, dict)
 
     def __init__(self, parent, name):
         super().__init__(name)
@@ -254,6 +158,10 @@ class FFTPlugin2(Plugin):
         layout.addWidget(invTransfromWindowCheckbox)
         self.canvas.param_layout.addWidget(window_box)
 
+        process_box = QCheckBox("separate process")
+        process_box.setToolTip("Calculate in a separate process, so that the live view doesn't stutter")
+        self.canvas.param_layout.addWidget(process_box)
+
         # default parameters:
         self.parameter_boxes["min_sigma"].setValue(8)
         self.parameter_boxes["max_sigma"].setValue(17)
@@ -324,41 +232,47 @@ class FFTPlugin2(Plugin):
         self.canvas.layout.insertLayout(3, label_layout)
 
         # some image plots:
-        viridis = generatePgColormap('viridis')
-        inferno = generatePgColormap('inferno')
-        magma = generatePgColormap('magma')
-
         self.origplot = self.layoutWidget.addPlot(title="Original")
         self.origplot.setAspectLocked()
         self.origplot.showAxis('bottom', False)
         self.origplot.showAxis('left', False)
         self.origimage = pg.ImageItem()
+        self.origimage.setOpts(axisOrder="row-major")
+        self.origplot.invertY(True)
         self.origplot.addItem(self.origimage)
 
         self.fftplot = self.layoutWidget.addPlot(title="FFT")
         self.fftplot.setAspectLocked()
         self.fftplot.showAxis('bottom', False)
         self.fftplot.showAxis('left', False)
-        self.fftimage = pg.ImageItem(lut=inferno.getLookupTable())
+        self.fftimage = pg.ImageItem(lut=colormaps.lut("inferno"))
+        self.fftimage.setOpts(axisOrder="row-major")
+        self.fftplot.invertY(True)
         self.fftplot.addItem(self.fftimage)
 
         self.transformplot = self.layoutWidget.addPlot(title="Inverse transform")
         self.transformplot.setAspectLocked()
         self.transformplot.showAxis('bottom', False)
         self.transformplot.showAxis('left', False)
-        self.transformimage = pg.ImageItem(lut=magma.getLookupTable())
+        self.transformimage = pg.ImageItem(lut=colormaps.lut("magma"))
+        self.transformimage.setOpts(axisOrder="row-major")
+        self.transformplot.invertY(True)
         self.transformplot.addItem(self.transformimage)
 
         self.phaseplot = self.layoutWidget.addPlot(title="Phase")
         self.phaseplot.setAspectLocked()
         self.phaseplot.showAxis('bottom', False)
         self.phaseplot.showAxis('left', False)
-        self.phaseimage = pg.ImageItem(lut=viridis.getLookupTable())
+        self.phaseimage = pg.ImageItem(lut=colormaps.lut("viridis"))
+        self.phaseimage.setOpts(axisOrder="row-major")
+        self.phaseplot.invertY(True)
         self.phaseplot.addItem(self.phaseimage)
 
         self.circle_plots = []
 
         self.workerThread = FFTWorker()
+        # the calculations take a while, so the worker gets a new frame whenever it is done with the last one
+        self.rate_policy = LatestWhenIdle(self.workerThread.is_idle)
         self.frameAvailable.connect(self.workerThread.processFrame)
         self.workerThread.clearCircles.connect(self.clearCircles)
         self.workerThread.circle.connect(self.plotCircle)
@@ -369,6 +283,7 @@ class FFTPlugin2(Plugin):
         self.workerThread.blobs.connect(self.setBlobsLabel)
         self.workerThread.blob_position.connect(self.setBlobCoords)
         self.workerThread.pixel_period.connect(self.setFringePeriod)
+        process_box.toggled.connect(self.workerThread.set_use_process)
 
     def plotCircle(self, origin, radius, color_name):
         if color_name == "green":
@@ -409,8 +324,8 @@ class FFTPlugin2(Plugin):
     def setFringePeriod(self, period):
         self.period_label.setText("Fringe period: {:.1f} px".format(period))
 
-    @pyqtSlot(np.ndarray)
-    def process_clipped_ndarray_bw(self, array: np.ndarray):
+    @pyqtSlot(Frame)
+    def process_clipped_frame_bw(self, frame: Frame):
         if self._active:
             parameters = {'min_sigma': self.parameter_boxes["min_sigma"].value(),
                           'max_sigma': self.parameter_boxes["max_sigma"].value(),
@@ -429,11 +344,19 @@ class FFTPlugin2(Plugin):
                           'homogenize_value': self.blob_boxes["homogenize_value"].value(),
                           'homogenize_blur': self.blob_boxes["homogenize_blur"].value()
                           }
-            self.frameAvailable.emit(array, parameters)
+            self.frameAvailable.emit(frame, parameters)
 
     def get_widget(self):
         return self.canvas
 
+    def workers(self):
+        return [self.workerThread]
+
+    def stop(self):
+        self.workerThread.stop()
+        self.workerThread.wait()
+        self.workerThread.shutdown()
+
 
 def get_instance(parent:QObject=None):
-    return FFTPlugin2(parent=parent, name="FFT and Phase Extraction")
+    return FFTPlugin2(parent=parent, name=name)
@@ -1,80 +1,45 @@
-from PyQt5.QtCore import QThread, QObject, pyqtSignal, qDebug, QMutex, QWaitCondition
+from PyQt5.QtCore import QObject, pyqtSignal, qDebug
 from PyQt5.QtWidgets import QHBoxLayout, QWidget, QCheckBox, QSpinBox, QLabel, QDoubleSpinBox
 import pyqtgraph as pg
 import numpy as np
-import matplotlib.pyplot as plt
 
+import colormaps
+import intermediates
 import plugin_canvas
-import plugins.libs.vortex_tools_core as vtc
+from frame import Frame
+from mailbox_worker import MailboxWorker
 from plugin import Plugin
 
-name = "Interferogram viewer"
+name = "Image viewer"
 description = "Shows the selected interferogram"
 
 
-def generatePgColormap(cm_name):
-    pltMap = plt.get_cmap(cm_name)
-    colors = pltMap.colors
-    colors = [c + [1.] for c in colors]
-    positions = np.linspace(0, 1, len(colors))
-    pgMap = pg.ColorMap(positions, colors)
-    return pgMap
-
-
 # this does the calculations in another thread:
-class Worker(QThread):
+class Worker(MailboxWorker):
     result = pyqtSignal(np.ndarray)
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self._mutex = QMutex()
-        self._condition = QWaitCondition()
-        self.frame = None
-        self.parameters = None
-        self.abort = False
-
     def processFrame(self, frame, parameters):
-        self._mutex.lock()
-        self.frame = frame
-        self.parameters = parameters
-        self._mutex.unlock()
-
-        if not self.isRunning():
-            self.start()
-        else:
-            self._condition.wakeOne()
+        self.post((frame, parameters))
 
-    def run(self):
-        while not self.abort:
-            # copy new frame and parameters:
-            self._mutex.lock()
-            frame = self.frame
-            parameters = self.parameters
-            self.frame = None
-            self.parameters = None
-            self._mutex.unlock()
+    def process(self, item):
+        frame, parameters = item
 
-            homogenize = parameters["homogenize"]
-            sigma = parameters["sigma"]
-            blur = parameters["blur"]
+        homogenize = parameters["homogenize"]
+        sigma = parameters["sigma"]
+        blur = parameters["blur"]
 
-            if homogenize:
-                frame = vtc.highpass(frame, sigma, blur)
-                #frame = np.uint16(np.float32(frame) / np.float32(frame.max()) * 255)
-
-            # update the user interface:
-            self.result.emit(frame)
+        if homogenize:
+            # shared with other plugins that filter the same data
+            image = intermediates.get(frame, "highpass", sigma=sigma, blur=blur)
+        else:
+            image = frame.array
 
-            # see if new data is available, go to sleep if not
-            self._mutex.lock()
-            data_available = self.frame is not None and self.parameters is not None
-            if not data_available:
-                self._condition.wait(self._mutex)
-            self._mutex.unlock()
+        # update the user interface:
+        self.result.emit(image)
 
 
 class PolarizationPlugin(Plugin):
-    frameAvailable = pyqtSignal(np.ndarray, dict)
+    frameAvailable = pyqtSignal(Frame, dict)
 
     def __init__(self, parent, name):
         super().__init__(name)
@@ -109,11 +74,9 @@ class PolarizationPlugin(Plugin):
 
 
         # some image plots:
-        magma = generatePgColormap('magma')
-
         self.main_plot = self.layoutWidget.addPlot(invertY=True)
         self.main_plot.setAspectLocked()
-        self.mainImage = pg.ImageItem(lut=magma.getLookupTable())
+        self.mainImage = pg.ImageItem(lut=colormaps.lut("magma"))
         self.mainImage.setOpts(axisOrder="row-major")
         self.main_plot.addItem(self.mainImage)
 
@@ -124,7 +87,7 @@ class PolarizationPlugin(Plugin):
     def setResult(self, image):
         self.mainImage.setImage(image)
 
-    def process_clipped_ndarray_bw(self, frame: np.ndarray):
+    def process_clipped_frame_bw(self, frame: Frame):
         if self._active:
             parameters = dict(homogenize=self.homogenizeCheckbox.isChecked(),
                               sigma=self.sigmaBox.value(),
@@ -134,6 +97,13 @@ class PolarizationPlugin(Plugin):
     def get_widget(self):
         return self.canvas
 
+    def workers(self):
+        return [self.workerThread]
+
+    def stop(self):
+        self.workerThread.stop()
+        self.workerThread.wait()
+
 
 def get_instance(parent:QObject=None):
-    return PolarizationPlugin(parent=parent, name="Image viewer")
+    return PolarizationPlugin(parent=parent, name=name)
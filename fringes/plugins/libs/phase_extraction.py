@@ -0,0 +1,126 @@
+import sys
+
+import numpy as np
+
+import plugins.libs.vortex_tools_core as vtc
+
+
+def preprocessing(parameters):
+    """
+    The preprocessing of the data set by the parameters, as parameters of the "preprocessed" and "fft" intermediates
+    (see intermediates.py)
+    """
+    highpass = (parameters['homogenize_value'], parameters['homogenize_blur']) if parameters['homogenize'] else None
+    return dict(highpass=highpass, window=parameters["window"])
+
+
+def preprocess(data, highpass=None, window=False):
+    """
+    :param highpass: None, or (sigma, blur) of the high-pass filter
+    :param window: apply a window function
+    :return: the data prepared for the Fourier transform
+    """
+    if highpass is not None:
+        data = vtc.highpass(data, *highpass)
+    if window:
+        data = vtc.apply_window(data)
+    return data
+
+
+def extract_phase(data, parameters, transform_size=300, preprocessed=None, transform=None):
+    """
+    Phase extraction from an off-axis interferogram: Fourier transform, finding the side band (blob) of the carrier
+    frequency, shifting it to the center and transforming back.
+    Pure function without Qt, so that it can run in a worker process.
+
+    Blob coordinates are (row, column) of the transform.
+    :param data: grayscale image, rows first
+    :param parameters: dict with the settings of the FFT plugin
+    :param transform_size: size of the (square) transform
+    :param preprocessed: the preprocessed data, if known already (e.g. from the intermediates of the frame)
+    :param transform: (transform, power spectrum) of the preprocessed data, if known already
+    :return: dict with
+        data: the preprocessed image, None if no preprocessing was applied
+        transform_abs: log of the absolute value of the transform
+        backtransform_abs, phase: absolute value and phase (-1..1, 0 in the center) of the inverse transform
+        blobs: all blobs that were found (n, 3), main_blob: (row, column, radius) of the side band, or None
+        found_blobs: True if the side band was found, period: fringe period in pixels, or None
+    """
+    if preprocessed is None:
+        preprocessed = preprocess(data, **preprocessing(parameters))
+    if transform is None:
+        transform = vtc.fourier_transform(preprocessed, transform_size)
+    transform, transform_abs = transform
+    transform_abs = np.nan_to_num(np.log(transform_abs))
+
+    if parameters['auto_blob']:
+        number = parameters['number']
+        try:
+            if parameters['auto']:   # automatic threshold finding
+                blobs = vtc.find_number_blobs(transform, number=number, max_sigma=parameters['max_sigma'],
+                                              min_sigma=parameters['min_sigma'], overlap=parameters['overlap'],
+                                              threshold=parameters['threshold'], method=parameters['method'])
+            else:
+                blobs = vtc.find_blobs(transform, max_sigma=parameters['max_sigma'],
+                                       min_sigma=parameters['min_sigma'], overlap=parameters['overlap'],
+                                       threshold=parameters['threshold'], method=parameters['method'])
+            found_blobs = blobs.shape[0] == number
+        except ValueError:
+            print("Blob detection failed!", file=sys.stderr)
+            blobs = np.array([])
+            found_blobs = False
+
+        if found_blobs:
+            main_blob = vtc.pick_blob(blobs)
+            # extend the main blob for greatest possible resolution:
+            center = (transform_size / 2) - 1
+            main_blob[2] = np.sqrt((main_blob[0] - center) ** 2 + (main_blob[1] - center) ** 2) / 2
+        else:
+            main_blob = None
+    else:   # with fixed blob position
+        main_blob = [parameters['blob_y'], parameters['blob_x'], parameters['blob_r']]
+        blobs = np.array([main_blob])
+        found_blobs = True
+
+    if found_blobs:
+        shifted_transform = vtc.mask_and_shift(transform, main_blob[0], main_blob[1], main_blob[2])
+        if parameters["invWindow"]:
+            shifted_transform = vtc.apply_window(shifted_transform)
+        backtransform, backtransform_abs, backtransform_phase = vtc.inv_fourier_transform(shifted_transform)
+        backtransform_phase = phase_shift_center(backtransform_phase)
+        period = calculate_period(main_blob[0], main_blob[1], transform.shape)
+    else:
+        backtransform_abs = np.zeros_like(transform_abs)
+        backtransform_phase = backtransform_abs
+        period = None
+
+    return {"data": preprocessed if preprocessed is not data else None,
+            "transform_abs": transform_abs,
+            "backtransform_abs": backtransform_abs,
+            "phase": backtransform_phase,
+            "blobs": blobs,
+            "main_blob": main_blob,
+            "found_blobs": found_blobs,
+            "period": period}
+
+
+def phase_shift_center(phase):
+    """
+    Shift the phase (in units of pi) so that it is 0 in the center
+    """
+    center_x = int(phase.shape[0] / 2 - 1)
+    center_y = int(phase.shape[1] / 2 - 1)
+    shift = phase[center_x, center_y]
+    return (phase + 1 + shift) % 2 - 1
+
+
+def calculate_period(blob_x, blob_y, shape):
+    """
+    Fringe period in pixels from the position of the side band in the transform, None for a blob in the center
+    """
+    x = abs(blob_x - shape[0] / 2)
+    y = abs(blob_y - shape[1] / 2)
+    r = np.sqrt(x**2 + y**2)
+    if r == 0:
+        return None
+    return 1 / (r / np.max(shape))
@@ -253,15 +253,12 @@ def apply_mask(transform, x, y, radius):
     :param x: center in x
     :param y: center in y
     :param radius: blob radius (is multiplied by a factor of 1.2)
-    :return: Masked array
+    :return: Masked array (new array, transform is not changed)
     """
-    trans_data = transform.copy()
-    lx, ly = trans_data.shape
+    lx, ly = transform.shape
     xx, yy = np.ogrid[0:lx, 0:ly]
     mask = (xx - x) ** 2 + (yy - y) ** 2 > (radius * 1.2) ** 2
-    trans_data[mask] = 0
-
-    return trans_data
+    return np.where(mask, 0, transform)
 
 
 def mask_and_shift(transform, x, y, radius):
@@ -1,83 +1,44 @@
-from PyQt5.QtCore import QThread, QObject, pyqtSignal, qDebug, QMutex, QWaitCondition
+from PyQt5.QtCore import QObject, pyqtSignal, qDebug
 from PyQt5.QtWidgets import QHBoxLayout, QGroupBox, QSpinBox, QDoubleSpinBox, QWidget, QComboBox, QLabel, QCheckBox
 import pyqtgraph as pg
 import numpy as np
-import matplotlib.pyplot as plt
 
+import colormaps
 import plugin_canvas
 import plugins.libs.vortex_tools_core as vtc
+from mailbox_worker import MailboxWorker
 
 
 name = "Polarization demo"
 description = "Subtracts the left and right halves of the screen"
 
 
-def generatePgColormap(cm_name):
-    pltMap = plt.get_cmap(cm_name)
-    colors = pltMap.colors
-    colors = [c + [1.] for c in colors]
-    positions = np.linspace(0, 1, len(colors))
-    pgMap = pg.ColorMap(positions, colors)
-    return pgMap
-
-
 # this does the calculations in another thread:
-class Worker(QThread):
+class Worker(MailboxWorker):
 
     result = pyqtSignal(np.ndarray)
     leftImage = pyqtSignal(np.ndarray)
     rightImage = pyqtSignal(np.ndarray)
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self._mutex = QMutex()
-        self._condition = QWaitCondition()
-        self.frame = None
-        self.parameters = None
-        self.abort = False
-
     def processFrame(self, frame, parameters):
-        self._mutex.lock()
-        self.frame = frame
-        self.parameters = parameters
-        self._mutex.unlock()
-
-        if not self.isRunning():
-            self.start()
-        else:
-            self._condition.wakeOne()
-
-    def run(self):
-        while not self.abort:
-            # copy new frame and parameters:
-            self._mutex.lock()
-            frame = self.frame
-            parameters = self.parameters
-            self.frame = None
-            self.parameters = None
-            self._mutex.unlock()
-
-            # convert frame to grayscale and rotate to give the correction orientation
-            data = frame.sum(axis=2).astype(np.float64)
-            data = np.rot90(data, axes=(1, 0))
-
-            # split data in half and subtract the two halves:
-            center = data.shape[0] // 2
-            left = data[0:center, :]
-            right = data[center:, :]
-            res = left - right
-
-            # update the user interface:
-            self.result.emit(res)
-            self.leftImage.emit(left)
-            self.rightImage.emit(right)
-
-            # see if new data is available, go to sleep if not
-            self._mutex.lock()
-            data_available = self.frame is not None and self.parameters is not None
-            if not data_available:
-                self._condition.wait(self._mutex)
-            self._mutex.unlock()
+        self.post((frame, parameters))
+
+    def process(self, item):
+        frame, parameters = item
+
+        # convert frame to grayscale, it arrives in the right orientation already
+        data = frame.sum(axis=2).astype(np.float64)
+
+        # split data in half and subtract the two halves:
+        center = data.shape[1] // 2
+        left = data[:, 0:center]
+        right = data[:, center:2 * center]
+        res = left - right
+
+        # update the user interface:
+        self.result.emit(res)
+        self.leftImage.emit(left)
+        self.rightImage.emit(right)
 
 
 class PolarizationPlugin(QObject):
@@ -96,27 +57,31 @@ class PolarizationPlugin(QObject):
         self.layoutWidget = self.canvas.layoutWidget
 
         # some image plots:
-        magma = generatePgColormap('magma')
-
         self.leftPlot = self.layoutWidget.addPlot(title="left")
         self.leftPlot.setAspectLocked()
         self.leftPlot.showAxis('bottom', False)
         self.leftPlot.showAxis('left', False)
-        self.leftImage = pg.ImageItem(lut=magma.getLookupTable())
+        self.leftImage = pg.ImageItem(lut=colormaps.lut("magma"))
+        self.leftImage.setOpts(axisOrder="row-major")
+        self.leftPlot.invertY(True)
         self.leftPlot.addItem(self.leftImage)
 
         self.rightPlot = self.layoutWidget.addPlot(title="right")
         self.rightPlot.setAspectLocked()
         self.rightPlot.showAxis('bottom', False)
         self.rightPlot.showAxis('left', False)
-        self.rightImage = pg.ImageItem(lut=magma.getLookupTable())
+        self.rightImage = pg.ImageItem(lut=colormaps.lut("magma"))
+        self.rightImage.setOpts(axisOrder="row-major")
+        self.rightPlot.invertY(True)
         self.rightPlot.addItem(self.rightImage)
 
         self.differencePlot = self.layoutWidget.addPlot(title="difference")
         self.differencePlot.setAspectLocked()
         self.differencePlot.showAxis('bottom', False)
         self.differencePlot.showAxis('left', False)
-        self.differenceImage = pg.ImageItem(lut=magma.getLookupTable())
+        self.differenceImage = pg.ImageItem(lut=colormaps.lut("magma"))
+        self.differenceImage.setOpts(axisOrder="row-major")
+        self.differencePlot.invertY(True)
         self.differencePlot.addItem(self.differenceImage)
 
         self.workerThread = Worker()
@@ -1,136 +1,25 @@
 import datetime
-import os
-import queue
-import re
 import time
-import xarray as xr
 
-import numpy as np
-from PyQt5.QtCore import QThread, QObject, pyqtSignal, QMutex, QWaitCondition, QDir, QTimer, pyqtSlot
-from PyQt5.QtWidgets import QHBoxLayout, QGroupBox, QLabel, QPushButton, QFileDialog, QMessageBox, \
+from PyQt5.QtCore import QThread, QObject, pyqtSignal, QDir, QTimer, pyqtSlot
+from PyQt5.QtWidgets import QHBoxLayout, QGroupBox, QLabel, QPushButton, QFileDialog, \
     QDoubleSpinBox, QVBoxLayout, QSpinBox
-from scipy.misc import imsave
 
 import plugin_canvas
-from data_saver import xarray_from_frame
+from frame import Frame
 from plugin import Plugin
+from rate_policy import FullRate
+from recorder import RecorderWorker
 
 
 name = "Sequence recorder"
 description = "Saves a sequence of images"
 
 
-# this does the calculations in another thread:
-class RecorderWorker(QObject):
-
-    imagesRecorded = pyqtSignal(int)
-    imagesSaved = pyqtSignal(str)
-    message = pyqtSignal(str)
-    finished = pyqtSignal()
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.parameters = None
-        self.abort = False
-        self._total_images = 0
-        self._images_recorded = 0
-        self._current_average = 0
-        self._total_averages = 0
-        self._recording = False
-        self._filename = "/home"
-        self._rate = None
-        self._nextFrameTime = None
-        self._array = None
-        self._temp_array = None
-        self.file_writer = None
-        self.write_thread = None
-
-    def processFrame(self, frame):
-        if self._recording:
-            if time.time() < self._nextFrameTime:
-                # see if there is still averaging to do:
-                if self._current_average < self._total_averages:
-                    self.record_average(frame)
-            else:
-                # time for the next step:
-                if self._temp_array is None:
-                    return
-                if len(self._temp_array.shape) < 3:
-                    # only one average:
-                    array = xarray_from_frame(self._temp_array)
-                else:
-                    # averaging for one sequence image:
-                    array = xarray_from_frame(self._temp_array.mean(axis=2))
-                self._temp_array = None
-                self._current_average = 0
-                array = array.expand_dims("index")
-                array.coords["index"] = [self._images_recorded]
-                if self._array is None:
-                    self._array = array
-                else:
-                    self._array = xr.concat([self._array, array], "index")
-                self._images_recorded += 1
-                self.imagesRecorded.emit(self._images_recorded)
-                # print("FRAME {} of {}".format(self._images_recorded, self._total_images))
-                if self._images_recorded >= self._total_images:
-                    self.stopRecording()
-                else:
-                    self._nextFrameTime += 1 / self._rate
-                    self.record_average(frame)
-
-    def record_average(self, frame):
-        if self._temp_array is None:
-            self._temp_array = frame
-        else:
-            self._temp_array = np.dstack((self._temp_array, frame))
-        self._current_average += 1
-        # print("recorded average {} of {}".format(self._current_average, self._total_averages))
-
-
-    def saveArray(self):
-        self.message.emit("writing images...")
-        self.imagesSaved.emit("saving...")
-        try:
-            self._array.attrs["frame_rate"] = self._rate
-            self._array.attrs["time"] = datetime.datetime.now().isoformat()
-            self._array.encoding['zlib'] = True
-            if os.path.isfile(self._filename):
-                os.remove(self._filename)
-            self._array.to_netcdf(path=self._filename)
-            self.imagesSaved.emit("yes")
-            self.message.emit("{} successfully saved.".format(self._filename))
-        except:
-            self.imagesSaved.emit("ERROR!")
-            self.message.emit("Error writing sequence data!")
-
-    def startRecording(self, filename, rate, total_images, averages):
-        self._filename = filename
-        self._rate = rate
-        self._total_images = total_images
-        self._nextFrameTime = time.time() + 1 / rate
-        self._images_recorded = 0
-        self._current_average = 0
-        self._total_averages = averages
-        self._array = None
-        with open(filename.replace(".netcdf", "_config.txt"), 'w') as f:
-            f.write("Start time: " + str(datetime.datetime.fromtimestamp(time.time())))
-            f.write("\nFrame rate: {} / s".format(rate))
-            f.write("\nTotal frames: {}".format(total_images))
-            f.write("\nAverages / frame: {}".format(averages))
-
-        self.imagesSaved.emit("not yet")
-        self._recording = True
-
-    def stopRecording(self):
-        if self._recording:
-            self._recording = False
-            self.finished.emit()
-            self.saveArray()
-
-
 class RecorderPlugin(Plugin):
 
-    frameAvailable = pyqtSignal(np.ndarray)
+    frameAvailable = pyqtSignal(Frame)
+    startRequested = pyqtSignal(str, float, int, int)
 
     def __init__(self, parent, name):
         super().__init__(name)
@@ -145,6 +34,9 @@ class RecorderPlugin(Plugin):
         self.canvas.layout.removeWidget(self.canvas.active_checkbox)
         self.canvas.active_checkbox.setParent(None)
         self.set_active(True)
+        # frames are picked by their timestamps, so the recorder needs all of them
+        self.rate_policy = FullRate()
+        self.cpu_budget = None
 
         main_layout = QVBoxLayout()
 
@@ -224,10 +116,15 @@ class RecorderPlugin(Plugin):
 
         self.updateTotalTime()
 
+        # the recorder gets every frame: it works in its own thread, and gets the frames through queued signals
         self.recorder_worker = RecorderWorker()
+        self.worker_thread = QThread()
+        self.recorder_worker.moveToThread(self.worker_thread)
+        self.worker_thread.start()
         self.recorder_worker.imagesRecorded.connect(self.updateImagesRecorded)
         self.recorder_worker.imagesSaved.connect(self.updateImagesSaved)
         self.frameAvailable.connect(self.recorder_worker.processFrame)
+        self.startRequested.connect(self.recorder_worker.startRecording)
         self.start_button.clicked.connect(self.startRecording)
         self.stop_button.clicked.connect(self.recorder_worker.stopRecording)
         self.recorder_worker.message.connect(self.message)
@@ -243,12 +140,9 @@ class RecorderPlugin(Plugin):
         self.startTime = time.time()
         self.updateTime()
         self._total_images = self.numberImagesSpinBox.value()
-        try:
-            self.recorder_worker.startRecording(self.filename, self.rateSpinBox.value(), self._total_images,
-                                                self.averagesSpinBox.value())
-            self.timer.start(1000)
-        except Exception as err:
-            self.message.emit("ERROR: Could not start recording: {}".format(str(err)))
+        self.startRequested.emit(self.filename, self.rateSpinBox.value(), self._total_images,
+                                 self.averagesSpinBox.value())
+        self.timer.start(1000)
 
     def updateImagesRecorded(self, number):
         self.recorded_images_label.setText("Images recorded: {}".format(number))
@@ -268,9 +162,13 @@ class RecorderPlugin(Plugin):
             seconds = 0
         self.total_time_label.setText("Total time: {} ({} s)".format(datetime.timedelta(seconds=seconds), seconds))
 
-    @pyqtSlot(np.ndarray)
-    def process_clipped_ndarray_bw(self, array: np.ndarray):
-        self.frameAvailable.emit(array)
+    def is_active(self):
+        # frames are only needed while recording
+        return self.recorder_worker.is_recording()
+
+    @pyqtSlot(Frame)
+    def process_clipped_frame_bw(self, frame: Frame):
+        self.frameAvailable.emit(frame)
 
     def chooseFolder(self):
         filename, _ = QFileDialog.getSaveFileName(caption="Save image", directory=self.filename,
@@ -288,6 +186,10 @@ class RecorderPlugin(Plugin):
     def get_widget(self):
         return self.canvas
 
+    def stop(self):
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+
 
 def get_instance(parent:QObject=None):
-    return RecorderPlugin(parent=parent, name="Sequence recorder")
\ No newline at end of file
+    return RecorderPlugin(parent=parent, name=name)
\ No newline at end of file
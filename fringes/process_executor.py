@@ -0,0 +1,121 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _attach(name):
+    """
+    Open an existing shared memory block without making this process responsible for removing it
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the block with the resource tracker. Spawned worker processes share
+        # the tracker of the parent, which has registered the block already, so this is harmless
+        return shared_memory.SharedMemory(name=name)
+
+
+def _detach(result, array):
+    """
+    Copy arrays in the result that are views on the shared input, so that the block can be closed
+    """
+    if isinstance(result, np.ndarray):
+        return result.copy() if np.shares_memory(result, array) else result
+    if isinstance(result, dict):
+        return {key: _detach(value, array) for key, value in result.items()}
+    if isinstance(result, (tuple, list)):
+        return type(result)(_detach(value, array) for value in result)
+    return result
+
+
+def _run_shared(func, name, shape, dtype, args, kwargs):
+    """
+    Runs in the worker process: call func on the array in the shared memory block
+    """
+    block = _attach(name)
+    try:
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        result = _detach(func(array, *args, **kwargs), array)
+        del array
+        return result
+    finally:
+        block.close()
+
+
+class SharedMemoryExecutor:
+    """
+    Runs a function on frames in separate worker processes, so that calculations which hold the GIL (e.g. the blob
+    detection of skimage) don't compete with the GUI and the capture threads.
+
+    The frame is copied once into a shared memory block, and only the name of the block, shape and dtype are sent
+    to the worker process, instead of pickling the data. The blocks are reused for later frames. The result of the
+    function is pickled on the way back, so it should be small (a few arrays of the size of the transform).
+
+    The function has to be importable by the worker process, i.e. a module level function of a module without
+    side effects on import. The worker processes are spawned on first use.
+    """
+
+    def __init__(self, max_workers=1):
+        """
+        :param max_workers: number of worker processes
+        """
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._free_blocks = []
+        self._blocks = []
+
+    def submit(self, func, array, *args, **kwargs):
+        """
+        Call func(array, *args, **kwargs) in a worker process
+        :param func: module level function
+        :param array: the data, the shared copy is read-only for func
+        :return: concurrent.futures.Future with the result
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        block = self._acquire(array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        future = self._pool.submit(_run_shared, func, block.name, array.shape, array.dtype.str, args, kwargs)
+        future.add_done_callback(lambda _: self._release(block))
+        return future
+
+    def run(self, func, array, *args, **kwargs):
+        """
+        Like submit(), but wait for the result
+        """
+        return self.submit(func, array, *args, **kwargs).result()
+
+    def shutdown(self):
+        """
+        Stop the worker processes and free the shared memory
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        with self._lock:
+            for block in self._blocks:
+                block.close()
+                block.unlink()
+            self._blocks = []
+            self._free_blocks = []
+
+    def _acquire(self, nbytes):
+        nbytes = max(nbytes, 1)
+        with self._lock:
+            for block in self._free_blocks:
+                if block.size >= nbytes:
+                    self._free_blocks.remove(block)
+                    return block
+            block = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._blocks.append(block)
+            return block
+
+    def _release(self, block):
+        with self._lock:
+            if block in self._blocks:
+                self._free_blocks.append(block)
@@ -180,6 +180,18 @@ def _stop_video_capture(id_):
     return
 
 
+def _buffer_size(buffer_):
+    # the SDK writes straight into the buffer, so anything exposing a writable, contiguous memory block will do
+    # (bytearray or a C-contiguous numpy array)
+    if isinstance(buffer_, np.ndarray):
+        if not buffer_.flags.c_contiguous or not buffer_.flags.writeable:
+            raise TypeError('Supplied numpy buffer must be C-contiguous and writeable')
+        return buffer_.nbytes
+    if not isinstance(buffer_, bytearray):
+        raise TypeError('Supplied buffer must be a bytearray or numpy array')
+    return len(buffer_)
+
+
 def _get_video_data(id_, timeout, buffer_=None):
     if buffer_ is None:
         whbi = _get_roi_format(id_)
@@ -190,11 +202,9 @@ def _get_video_data(id_, timeout, buffer_=None):
             sz *= 2
         buffer_ = bytearray(sz)
     else:
-        if not isinstance(buffer_, bytearray):
-            raise TypeError('Supplied buffer must be a bytearray')
-        sz = len(buffer_)
+        sz = _buffer_size(buffer_)
     
-    cbuf_type = c.c_char * len(buffer_)
+    cbuf_type = c.c_char * sz
     cbuf = cbuf_type.from_buffer(buffer_)
     r = zwolib.ASIGetVideoData(id_, cbuf, sz, int(timeout))
     
@@ -249,11 +259,9 @@ def _get_data_after_exposure(id_, buffer_=None):
             sz *= 2
         buffer_ = bytearray(sz)
     else:
-        if not isinstance(buffer_, bytearray):
-            raise TypeError('Supplied buffer must be a bytearray')
-        sz = len(buffer_)
+        sz = _buffer_size(buffer_)
     
-    cbuf_type = c.c_char * len(buffer_)
+    cbuf_type = c.c_char * sz
     cbuf = cbuf_type.from_buffer(buffer_)
     r = zwolib.ASIGetDataAfterExp(id_, cbuf, sz)
     
@@ -1,102 +1,139 @@
 import platform
+import sys
 import numpy as np
 
-from PyQt5.QtCore import qDebug, pyqtSignal, pyqtSlot, QThread, QMutexLocker, QMutex, QWaitCondition
-from PyQt5.QtGui import QImage
+from PyQt5.QtCore import qDebug, pyqtSignal, pyqtSlot
 from PyQt5.QtMultimedia import QAbstractVideoSurface, QVideoFrame, QAbstractVideoBuffer, QVideoSurfaceFormat, QCamera
 from PyQt5.QtWidgets import QWidget
 
-from camera import Camera
+from camera import Camera, orient, measure_saturation
+from frame import Frame
+from mailbox_worker import MailboxWorker
 
 
 class QtCamera(Camera):
 
     class VideoSurface(QAbstractVideoSurface):
 
-        class ConversionThread(QThread):
-            ndarray_available = pyqtSignal(np.ndarray)
+        class ConversionThread(MailboxWorker):
+            """
+            Converts the newest video frame to a numpy array; frames that arrive while the thread is busy are dropped
+            """
+            frame_available = pyqtSignal(Frame)
+            # only emitted when the value changes:
+            saturation_changed = pyqtSignal(int)
+            maxval_changed = pyqtSignal(int)
+
+            # full scale of the data of the pixel formats with more than 8 bits:
+            _pixel_format_maxval = {QVideoFrame.Format_Y16: 2**16}
 
             def __init__(self):
                 super().__init__()
-                self._mutex = QMutex()
-                self._abort = False
-                self._condition = QWaitCondition()
-                self.frame = None
+                # metadata attached to each frame:
+                self.name = ""
+                self.exposure = None
+                self.gain = None
+                self.flip_x = False
+                self.flip_y = False
+                # full scale of the data, for the saturation; set by the pixel format of the frames
+                self.maxval = 2**8
+                self._last_saturation = None
 
             def process_frame(self, frame: QVideoFrame):
-                with QMutexLocker(self._mutex):
-                    self.frame = frame
-
-                if not self.isRunning():
-                    self.start()
-                else:
-                    self._condition.wakeOne()
-
-            def stop(self):
-                with QMutexLocker(self._mutex):
-                    self._abort = True
-                    self._condition.wakeOne()
-
-            def run(self):
-                self._abort = False
-
-                while True:
-                    with QMutexLocker(self._mutex):
-                        if self._abort:
-                            break
-                        frame = self.frame
-                        self.frame = None
-
-                    pixel_format = frame.pixelFormat()
-                    image_format = QVideoFrame.imageFormatFromPixelFormat(pixel_format)
-                    if image_format == QImage.Format_Invalid:
-                        qDebug("WARNING: Could not convert video frame to image!")
-                        return
-                    if not frame.map(QAbstractVideoBuffer.ReadOnly):
-                        qDebug("WARNING: Could not map video frame!")
-                        return
-
-                    width = frame.width()
-                    height = frame.height()
-                    bytes_per_line = frame.bytesPerLine()
-                    image = QImage(frame.bits(), width, height, bytes_per_line, image_format)
-                    image = image.convertToFormat(QImage.Format_RGB32)
-
+                self.post(frame)
+
+            def process(self, frame: QVideoFrame):
+                if not frame.map(QAbstractVideoBuffer.ReadOnly):
+                    qDebug("WARNING: Could not map video frame!")
+                    return
+                try:
+                    array = self.convert(frame, self.flip_x, self.flip_y)
+                finally:
                     frame.unmap()
 
-                    # fix upside-down data for windows
-                    if platform.system() == "Windows":
-                        image = image.mirrored(vertical=True)
-
-                    # now convert QImage to ndarray
-                    pointer = image.constBits()
-                    pointer.setsize(image.byteCount())
-                    array = np.array(pointer).reshape(image.height(), image.width(), 4)
-
-                    # get rid of the transparency channel and organize the colors as rgb
-                    # NB: it would be safer to figure out the image format first, and where the transparency channel is
-                    # stored...
-                    array = array[:, :, 0:3:][:, :, ::-1]
-
-                    self.ndarray_available.emit(array)
+                if array is None:
+                    qDebug("WARNING: Unsupported pixel format {}!".format(frame.pixelFormat()))
+                    return
+
+                maxval = self._pixel_format_maxval.get(frame.pixelFormat(), 2**8)
+                if maxval != self.maxval:
+                    self.maxval = maxval
+                    self.maxval_changed.emit(maxval)
+
+                saturation = measure_saturation(array, self.maxval)
+                if int(saturation) != self._last_saturation:
+                    self._last_saturation = int(saturation)
+                    self.saturation_changed.emit(self._last_saturation)
+
+                self.frame_available.emit(Frame(array, exposure=self.exposure, gain=self.gain, camera=self.name,
+                                                saturation=saturation))
+
+            @staticmethod
+            def convert(frame: QVideoFrame, flip_x=False, flip_y=False):
+                """
+                Convert a mapped video frame to a numpy array: rgb for color formats, the luma plane for YUV formats
+                (which is all that's needed for grayscale data). The mapped data is wrapped without copying, channels,
+                padding and orientation are handled with strides, and the result is copied exactly once into a
+                C-contiguous array (that copy is needed anyway, since the mapped memory goes away with unmap()).
+                :param frame: the mapped frame
+                :param flip_x: mirror left and right
+                :param flip_y: mirror top and bottom
+                :return: numpy array, or None for unsupported pixel formats
+                """
+                width = frame.width()
+                height = frame.height()
+                bytes_per_line = frame.bytesPerLine()
+                pointer = frame.bits()
+                pointer.setsize(frame.mappedBytes())
+                # plane 0, one row per line, including any padding at the end of the lines:
+                rows = np.frombuffer(pointer, dtype=np.uint8, count=height * bytes_per_line)
+                rows = rows.reshape(height, bytes_per_line)
+
+                pixel_format = frame.pixelFormat()
+                if pixel_format in (QVideoFrame.Format_RGB32, QVideoFrame.Format_ARGB32,
+                                    QVideoFrame.Format_ARGB32_Premultiplied):
+                    # 0xAARRGGBB words, i.e. BGRA bytes on little endian machines
+                    pixels = rows[:, :width * 4].reshape(height, width, 4)
+                    view = pixels[:, :, 2::-1] if sys.byteorder == "little" else pixels[:, :, 1:]
+                elif pixel_format == QVideoFrame.Format_RGB24:
+                    view = rows[:, :width * 3].reshape(height, width, 3)
+                elif pixel_format in (QVideoFrame.Format_YUV420P, QVideoFrame.Format_YV12, QVideoFrame.Format_NV12,
+                                      QVideoFrame.Format_NV21, QVideoFrame.Format_Y8):
+                    # planar formats start with the full resolution luma plane
+                    view = rows[:, :width]
+                elif pixel_format == QVideoFrame.Format_YUYV:
+                    view = rows[:, 0:2 * width:2]
+                elif pixel_format == QVideoFrame.Format_UYVY:
+                    view = rows[:, 1:2 * width:2]
+                elif pixel_format == QVideoFrame.Format_Y16:
+                    view = rows[:, :width * 2].view(np.uint16)
+                else:
+                    return None
 
-                    # see if new data is available, go to sleep if not
-                    with QMutexLocker(self._mutex):
-                        if self.frame is None:
-                            self._condition.wait(self._mutex)
+                return orient(view, flip_x, flip_y, copy=True)
 
-        ndarray_available = pyqtSignal(np.ndarray)
+        frame_available = pyqtSignal(Frame)
 
         supportedFormats = [
             QVideoFrame.Format_RGB32,
-            QVideoFrame.Format_ARGB32
+            QVideoFrame.Format_ARGB32,
+            QVideoFrame.Format_ARGB32_Premultiplied,
+            QVideoFrame.Format_RGB24,
+            QVideoFrame.Format_YUV420P,
+            QVideoFrame.Format_YV12,
+            QVideoFrame.Format_NV12,
+            QVideoFrame.Format_NV21,
+            QVideoFrame.Format_YUYV,
+            QVideoFrame.Format_UYVY,
+            QVideoFrame.Format_Y8,
+            QVideoFrame.Format_Y16
         ]
 
         def __init__(self, parent=None):
             super().__init__()
             self._source = None
             self.conversion_thread = self.ConversionThread()
-            self.conversion_thread.ndarray_available.connect(self.ndarray_available)
+            self.conversion_thread.frame_available.connect(self.frame_available)
 
         # method for QAbstractVideoSurface
         def supportedPixelFormats(self, handleType=QAbstractVideoBuffer.NoHandle):
@@ -104,7 +141,7 @@ class QtCamera(Camera):
 
         # method for QAbstractVideoSurface
         def isFormatSupported(self, fmt: QVideoSurfaceFormat):
-            return fmt in self.supportedFormats
+            return fmt.pixelFormat() in self.supportedFormats
 
         # method for QAbstractVideoSurface
         def present(self, frame: QVideoFrame):
@@ -119,7 +156,10 @@ class QtCamera(Camera):
         self._active = False
 
         self._video_surface = self.VideoSurface()
-        self._video_surface.ndarray_available.connect(self.ndarray_available)
+        self._video_surface.frame_available.connect(self.frame_available)
+        self._video_surface.conversion_thread.maxval_changed.connect(self.set_maxval)
+        if device is not None:
+            self._video_surface.conversion_thread.name = device.description()
 
         self._camera = QCamera(device)
         self._camera.setViewfinder(self._video_surface)
@@ -127,7 +167,10 @@ class QtCamera(Camera):
         if error != QCamera.NoError:
             qDebug("Camera error: ", error)
 
+        # full scale of the data, depends on the pixel format (see ConversionThread):
         self.maxval = 2**8
+        # fix upside-down data for windows
+        self.set_orientation(False, platform.system() == "Windows")
 
     def __del__(self):
         self._camera.stop()
@@ -135,9 +178,19 @@ class QtCamera(Camera):
         self._video_surface.conversion_thread.stop()
         self._video_surface.conversion_thread.wait()
 
+    @pyqtSlot(int)
+    def set_maxval(self, maxval):
+        self.maxval = maxval
+
     def _valid(self):
         return True
 
+    def set_orientation(self, flip_x, flip_y):
+        super().set_orientation(flip_x, flip_y)
+        conversion_thread = self._video_surface.conversion_thread
+        conversion_thread.flip_x = flip_x
+        conversion_thread.flip_y = flip_y
+
     @pyqtSlot()
     def start(self):
         self._camera.start()
@@ -0,0 +1,127 @@
+import math
+from collections import deque
+
+
+class RatePolicy:
+    """
+    How many of the camera frames a consumer (the main view, a plugin...) wants to get.
+
+    The DataHandler asks accept() once for every frame from the camera, and passes the frame on to the consumer only
+    if the answer is True. This base class takes every frame.
+    """
+
+    def accept(self, now):
+        """
+        :param now: arrival time of the frame (time.time())
+        :return: True if the consumer gets this frame
+        """
+        return True
+
+
+class FullRate(RatePolicy):
+    """
+    Every frame, at the full rate of the camera (e.g. for recording)
+    """
+
+
+class DisplayRate(RatePolicy):
+    """
+    At most `rate` frames per second (e.g. for showing them on screen)
+    """
+
+    def __init__(self, rate=25.):
+        self.interval = 1 / rate
+        self._next_time = 0
+
+    def accept(self, now):
+        if now < self._next_time:
+            return False
+        # keep the average rate, but don't try to catch up after a pause
+        self._next_time = max(self._next_time + self.interval, now)
+        return True
+
+
+class LatestWhenIdle(RatePolicy):
+    """
+    The newest frame, whenever the consumer is done with the previous one (e.g. for slow calculations)
+    """
+
+    def __init__(self, is_idle):
+        """
+        :param is_idle: function that tells if the consumer is ready for a new frame
+        """
+        self._is_idle = is_idle
+
+    def accept(self, now):
+        return self._is_idle()
+
+
+class Budget(RatePolicy):
+    """
+    Limits the processing time of a consumer to a share of the CPU: if it needs more than `budget` seconds of
+    processing per second, it only gets every Nth of the frames that its own policy accepts (decimation), with N
+    just large enough to stay within the budget. N goes down again when the processing gets faster.
+
+    The consumer reports how long it took for each frame with add_time() (from any thread). For consumers that
+    do their work in the callback itself, set measure_callbacks, and the DataHandler reports the time of the calls.
+    """
+
+    # the rate of frames is averaged over this time, in s:
+    window = 2.
+
+    def __init__(self, policy, budget=0.25, changed=None):
+        """
+        :param policy: RatePolicy of the consumer
+        :param budget: share of one CPU core, e.g. 0.25 for 250 ms of processing per second
+        :param changed: function called with the new decimation when it changes (in the thread that calls accept)
+        """
+        self.policy = policy
+        self.budget = budget
+        self.changed = changed
+        self.measure_callbacks = False
+        self.decimation = 1
+        self.time_per_frame = None
+        self._skip = 0
+        # arrival times of the frames accepted by the policy of the consumer:
+        self._offered = deque()
+
+    def add_time(self, duration):
+        """
+        :param duration: processing time of a frame in s
+        """
+        # exponential average, so that a single slow frame doesn't throttle the consumer
+        if self.time_per_frame is None:
+            self.time_per_frame = duration
+        else:
+            self.time_per_frame += 0.2 * (duration - self.time_per_frame)
+
+    def accept(self, now):
+        if not self.policy.accept(now):
+            return False
+        self._offered.append(now)
+        while self._offered[0] < now - self.window:
+            self._offered.popleft()
+        self._update_decimation()
+        if self._skip > 0:
+            self._skip -= 1
+            return False
+        self._skip = self.decimation - 1
+        return True
+
+    def _update_decimation(self):
+        if self.time_per_frame is None:
+            return
+        if len(self._offered) < 2:
+            return
+        # processing time per second if the consumer got all frames its policy accepts:
+        rate = (len(self._offered) - 1) / max(self._offered[-1] - self._offered[0], 1e-3)
+        load = self.time_per_frame * rate
+        decimation = max(1, math.ceil(load / self.budget))
+        # some hysteresis, so that the decimation doesn't flip back and forth at the limit
+        if decimation < self.decimation and load / (self.decimation - 1) > 0.8 * self.budget:
+            return
+        if decimation != self.decimation:
+            self.decimation = decimation
+            self._skip = min(self._skip, decimation - 1)
+            if self.changed is not None:
+                self.changed(decimation)
@@ -0,0 +1,146 @@
+import datetime
+import os
+import time
+
+import numpy as np
+import xarray as xr
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+import instrumentation
+from data_saver import xarray_from_frame
+from frame import Frame
+
+
+class RecorderWorker(QObject):
+    """
+    Records a sequence of frames at a given rate, optionally averaging several frames per image, and writes it
+    to a netCDF file. Works without widgets, see the sequence recorder plugin and headless.py.
+
+    The recorder gets every frame, so in the GUI it lives in a thread of its own (see the sequence recorder plugin)
+    and is only used through queued signals.
+    """
+
+    imagesRecorded = pyqtSignal(int)
+    imagesSaved = pyqtSignal(str)
+    message = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parameters = None
+        self.abort = False
+        self._total_images = 0
+        self._images_recorded = 0
+        self._current_average = 0
+        self._total_averages = 0
+        self._recording = False
+        self._filename = "/home"
+        self._rate = None
+        self._nextFrameTime = None
+        self._array = None
+        self._temp_array = None
+        self._temp_timestamp = None
+        self.file_writer = None
+        self.write_thread = None
+
+    @pyqtSlot(Frame)
+    @instrumentation.timed("RecorderWorker: process")
+    def processFrame(self, frame):
+        if self._recording:
+            if frame.timestamp < self._nextFrameTime:
+                # see if there is still averaging to do:
+                if self._current_average < self._total_averages:
+                    self.record_average(frame)
+            else:
+                # time for the next step:
+                if self._temp_array is None:
+                    return
+                if self._current_average == 1:
+                    # only one average, keep the data type:
+                    array = xarray_from_frame(self._temp_array)
+                else:
+                    # averaging for one sequence image:
+                    array = xarray_from_frame(self._temp_array / self._current_average)
+                self._temp_array = None
+                self._current_average = 0
+                array = array.expand_dims("index")
+                array.coords["index"] = [self._images_recorded]
+                # capture time of the (first) frame that went into this image:
+                array.coords["timestamp"] = ("index", [self._temp_timestamp])
+                if self._array is None:
+                    self._array = array
+                else:
+                    self._array = xr.concat([self._array, array], "index")
+                self._images_recorded += 1
+                self.imagesRecorded.emit(self._images_recorded)
+                # print("FRAME {} of {}".format(self._images_recorded, self._total_images))
+                if self._images_recorded >= self._total_images:
+                    self.stopRecording()
+                else:
+                    self._nextFrameTime += 1 / self._rate
+                    self.record_average(frame)
+
+    def record_average(self, frame):
+        """
+        Add a frame to the image being averaged: _temp_array is the first frame, or the sum of the frames so far
+        """
+        if self._temp_array is None:
+            self._temp_array = frame.array
+            self._temp_timestamp = frame.timestamp
+        elif self._current_average == 1:
+            self._temp_array = self._temp_array.astype(np.float64) + frame.array
+        else:
+            self._temp_array += frame.array
+        self._current_average += 1
+        # print("recorded average {} of {}".format(self._current_average, self._total_averages))
+
+
+    def saveArray(self):
+        self.message.emit("writing images...")
+        self.imagesSaved.emit("saving...")
+        try:
+            self._array.attrs["frame_rate"] = self._rate
+            self._array.attrs["time"] = datetime.datetime.now().isoformat()
+            self._array.encoding['zlib'] = True
+            if os.path.isfile(self._filename):
+                os.remove(self._filename)
+            self._array.to_netcdf(path=self._filename)
+            self.imagesSaved.emit("yes")
+            self.message.emit("{} successfully saved.".format(self._filename))
+        except:
+            self.imagesSaved.emit("ERROR!")
+            self.message.emit("Error writing sequence data!")
+
+    @pyqtSlot(str, float, int, int)
+    def startRecording(self, filename, rate, total_images, averages):
+        self._filename = filename
+        self._rate = rate
+        self._total_images = total_images
+        self._nextFrameTime = time.time() + 1 / rate
+        self._images_recorded = 0
+        self._current_average = 0
+        self._total_averages = averages
+        self._array = None
+        try:
+            with open(os.path.splitext(filename)[0] + "_config.txt", 'w') as f:
+                f.write("Start time: " + str(datetime.datetime.fromtimestamp(time.time())))
+                f.write("\nFrame rate: {} / s".format(rate))
+                f.write("\nTotal frames: {}".format(total_images))
+                f.write("\nAverages / frame: {}".format(averages))
+        except OSError as err:
+            self.message.emit("ERROR: Could not start recording: {}".format(str(err)))
+            self.finished.emit()
+            return
+
+        self.imagesSaved.emit("not yet")
+        self._recording = True
+
+    @pyqtSlot()
+    def stopRecording(self):
+        if self._recording:
+            self._recording = False
+            self.finished.emit()
+            self.saveArray()
+
+    def is_recording(self):
+        return self._recording
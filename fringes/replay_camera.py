@@ -0,0 +1,136 @@
+import time
+
+import xarray as xr
+from PyQt5.QtCore import QThread, QMutex, QMutexLocker, pyqtSignal, pyqtSlot, qDebug
+from PyQt5.QtWidgets import QWidget, QComboBox, QCheckBox, QLabel, QHBoxLayout
+
+from camera import Camera, orient
+from frame import Frame
+
+
+class ReplayCamera(Camera):
+    """
+    Plays back a sequence recorded by the sequence recorder (netCDF file with dimensions index x y x x)
+    as if it came from a camera. Frames are time-stamped when they are played back.
+    """
+
+    virtual = True
+
+    # playback speeds offered in the controls, 0 means as fast as possible:
+    speeds = [("1x", 1.), ("2x", 2.), ("5x", 5.), ("10x", 10.), ("max", 0.)]
+
+    class ReplayThread(QThread):
+        frame_available = pyqtSignal(Frame)
+        message = pyqtSignal(str)
+
+        def __init__(self, camera):
+            super().__init__()
+            self._camera = camera
+            self._mutex = QMutex()
+            self._abort = False
+
+        def stop(self):
+            with QMutexLocker(self._mutex):
+                self._abort = True
+
+        def run(self):
+            self._abort = False
+            cam = self._camera
+            try:
+                # only the metadata is read here, frames are loaded one at a time
+                data = xr.open_dataarray(cam.filename)
+            except (OSError, ValueError) as err:
+                self.message.emit("Could not open {}: {}".format(cam.filename, str(err)))
+                return
+
+            with data:
+                frame_rate = float(data.attrs.get("frame_rate", cam.default_frame_rate))
+                number_frames = data.shape[0]
+                # frames with calibrated coordinates were stored upside down
+                flip = "x" in data.coords and "units" in data.coords["x"].attrs
+                camera_name = "Replay of {}".format(cam.filename)
+                qDebug("Replaying {} frames at {} / s".format(number_frames, frame_rate))
+
+                index = 0
+                next_frame_time = time.perf_counter()
+                while True:
+                    with QMutexLocker(self._mutex):
+                        if self._abort:
+                            break
+                        speed = cam.speed
+                        loop = cam.loop
+
+                    if index >= number_frames:
+                        if not loop:
+                            break
+                        index = 0
+
+                    frame = orient(data[index].values, flip_y=flip)
+                    self.frame_available.emit(Frame(frame, camera=camera_name))
+                    index += 1
+
+                    if speed > 0:
+                        next_frame_time = max(next_frame_time + 1 / (frame_rate * speed), time.perf_counter() - 1)
+                        delay = next_frame_time - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+
+    default_frame_rate = 10.
+
+    def __init__(self, parent=None, filename=None, speed=1., loop=True):
+        """
+        :param filename: netCDF file written by the sequence recorder
+        :param speed: multiple of the recorded frame rate; 0 for as fast as possible
+        :param loop: start again at the beginning at the end of the sequence
+        """
+        super().__init__()
+        self.filename = filename
+        self.speed = speed
+        self.loop = loop
+        self._active = True
+
+        self.replay_thread = self.ReplayThread(self)
+        self.replay_thread.frame_available.connect(self.frame_available)
+        self.replay_thread.message.connect(self.message)
+
+    def __del__(self):
+        self.replay_thread.stop()
+        self.replay_thread.wait()
+
+    def _valid(self):
+        return self._active
+
+    @pyqtSlot()
+    def start(self):
+        self.replay_thread.start()
+
+    @pyqtSlot()
+    def stop(self):
+        self.replay_thread.stop()
+
+    def get_controls(self):
+        controls = QWidget()
+        layout = QHBoxLayout()
+        speed_box = QComboBox()
+        for label, speed in self.speeds:
+            speed_box.addItem(label, speed)
+            if speed == self.speed:
+                speed_box.setCurrentText(label)
+        speed_box.currentIndexChanged.connect(lambda index: self.set_speed(speed_box.itemData(index)))
+        layout.addWidget(QLabel("Playback speed"))
+        layout.addWidget(speed_box)
+        loop_box = QCheckBox("loop")
+        loop_box.setChecked(self.loop)
+        loop_box.toggled.connect(self.set_loop)
+        layout.addWidget(loop_box)
+        layout.addStretch(1)
+        controls.setLayout(layout)
+        return controls
+
+    @pyqtSlot(float)
+    def set_speed(self, speed):
+        self.speed = speed
+
+    @pyqtSlot(bool)
+    def set_loop(self, loop):
+        self.loop = loop
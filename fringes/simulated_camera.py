@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+from PyQt5.QtCore import QThread, QMutex, QMutexLocker, pyqtSignal, pyqtSlot
+
+import instrumentation
+from buffer_pool import BufferPool
+from camera import Camera
+from frame import Frame
+
+
+class SimulatedCamera(Camera):
+    """
+    A camera without hardware: it produces off-axis interferograms (a Gaussian beam with tilted fringes),
+    slowly drifting in phase and with some noise, at a given frame rate.
+    Useful for benchmarking the processing pipeline.
+    """
+
+    virtual = True
+
+    class GeneratorThread(QThread):
+        frame_available = pyqtSignal(Frame)
+
+        def __init__(self, camera):
+            super().__init__()
+            self._camera = camera
+            self._mutex = QMutex()
+            self._abort = False
+            self.buffer_pool = BufferPool(count=8)
+
+        def stop(self):
+            with QMutexLocker(self._mutex):
+                self._abort = True
+
+        def run(self):
+            self._abort = False
+            cam = self._camera
+            height, width = cam.shape
+            dtype = cam.dtype
+            self.buffer_pool.resize(height * width * dtype.itemsize)
+
+            # everything that does not change from frame to frame is calculated only once:
+            y, x = np.ogrid[-height / 2:height / 2, -width / 2:width / 2]
+            angle = np.deg2rad(cam.fringe_angle)
+            k = 2 * np.pi / cam.fringe_period
+            ramp = k * (x * np.cos(angle) + y * np.sin(angle))
+            sigma = min(width, height) / 4
+            envelope = np.exp(-(x ** 2 + y ** 2) / (2 * sigma ** 2)).astype(np.float32)
+            # cos(ramp + phase) = cos(ramp) cos(phase) - sin(ramp) sin(phase)
+            envelope_cos = (envelope * np.cos(ramp)).astype(np.float32)
+            envelope_sin = (envelope * np.sin(ramp)).astype(np.float32)
+            rng = np.random.default_rng()
+            noise_bank = [rng.standard_normal((height, width), dtype=np.float32) for _ in range(4)]
+
+            intensity = np.empty((height, width), dtype=np.float32)
+            fringes = np.empty((height, width), dtype=np.float32)
+            max_value = cam.maxval - 1 if np.issubdtype(dtype, np.integer) else cam.maxval
+
+            phase = 0.
+            frame_number = 0
+            next_frame_time = time.perf_counter()
+            while True:
+                with QMutexLocker(self._mutex):
+                    if self._abort:
+                        break
+                    exposure = cam.get_exposure()
+                    gain = cam.get_gain()
+                    fps = cam.fps
+
+                with instrumentation.measure("capture: generate frame"):
+                    # the signal is linear in exposure time and gain, full scale at 10 ms and 0 dB:
+                    scale = 0.5 * max_value * exposure / 10 * 10 ** (gain / 20)
+                    np.multiply(envelope_cos, np.cos(phase), out=fringes)
+                    fringes -= envelope_sin * np.sin(phase)
+                    np.add(envelope, fringes, out=intensity)
+                    intensity *= scale
+                    if cam.noise > 0:
+                        intensity += noise_bank[frame_number % len(noise_bank)] * (cam.noise * max_value)
+                    np.clip(intensity, 0, max_value, out=intensity)
+
+                    frame = self.buffer_pool.acquire().view(dtype).reshape(height, width)
+                    frame[...] = intensity
+
+                self.frame_available.emit(Frame(frame, exposure=exposure, gain=gain, camera="Simulated camera"))
+
+                phase = (phase + cam.phase_drift) % (2 * np.pi)
+                frame_number += 1
+                if fps > 0:
+                    next_frame_time = max(next_frame_time + 1 / fps, time.perf_counter() - 1)
+                    delay = next_frame_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+    def __init__(self, parent=None, width=1280, height=960, dtype=np.uint16, fringe_period=12.,
+                 fringe_angle=30., phase_drift=0.05, noise=0.01, fps=30.):
+        """
+        :param width: frame width in pixels
+        :param height: frame height in pixels
+        :param dtype: numpy data type of the frames
+        :param fringe_period: fringe period in pixels
+        :param fringe_angle: direction of the fringes in degrees
+        :param phase_drift: change of the fringe phase from one frame to the next, in radians
+        :param noise: standard deviation of the noise, as fraction of the full scale
+        :param fps: target frame rate; 0 for as fast as possible
+        """
+        super().__init__()
+        self.shape = (height, width)
+        self.dtype = np.dtype(dtype)
+        self.fringe_period = fringe_period
+        self.fringe_angle = fringe_angle
+        self.phase_drift = phase_drift
+        self.noise = noise
+        self.fps = fps
+        self._exposure = 8.
+        self._gain = 0.
+        self._active = True
+
+        if np.issubdtype(self.dtype, np.integer):
+            self.maxval = np.iinfo(self.dtype).max + 1
+        else:
+            self.maxval = 1.
+
+        self.generator_thread = self.GeneratorThread(self)
+        self.generator_thread.frame_available.connect(self.frame_available)
+
+    def __del__(self):
+        self.generator_thread.stop()
+        self.generator_thread.wait()
+
+    def _valid(self):
+        return self._active
+
+    @pyqtSlot()
+    def start(self):
+        self.generator_thread.start()
+
+    @pyqtSlot()
+    def stop(self):
+        self.generator_thread.stop()
+
+    def get_exposure(self):
+        return self._exposure
+
+    def get_exposure_range(self):
+        return 0.01, 1000.
+
+    def set_exposure(self, exposure):
+        self._exposure = exposure
+
+    def get_gain(self):
+        return self._gain
+
+    def get_gain_range(self):
+        return 0., 30.
+
+    def set_gain(self, gain):
+        self._gain = gain
+
+    def is_auto_exposure(self):
+        return False
+
+    def is_auto_gain(self):
+        return False
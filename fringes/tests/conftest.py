@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules of the program are imported from its folder, as when it is started with `python main.py`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,70 @@
+import gc
+
+import numpy as np
+
+from buffer_pool import BufferPool
+
+
+def test_buffers_are_page_aligned():
+    pool = BufferPool(1000, count=2)
+    buffer = pool.acquire()
+    assert buffer.nbytes == 1000
+    assert buffer.ctypes.data % BufferPool.page_size == 0
+    assert buffer.flags.writeable
+
+
+def test_buffer_is_busy_while_a_view_is_alive():
+    pool = BufferPool(64, count=2)
+    view = pool.acquire().reshape(8, 8)[::-1, 1:]
+    assert pool.busy == 1
+    other = pool.acquire()
+    assert pool.busy == 2
+    assert other.ctypes.data != view.base.ctypes.data
+    del other
+    assert pool.busy == 1
+
+
+def test_released_buffer_is_reused():
+    pool = BufferPool(64, count=2)
+    buffer = pool.acquire()
+    address = buffer.ctypes.data
+    buffer[:] = 1
+    del buffer
+    gc.collect()
+    assert pool.busy == 0
+    addresses = {pool.acquire().ctypes.data for _ in range(4)}
+    assert address in addresses
+    assert pool.exhausted == 0
+
+
+def test_exhausted_pool_allocates_temporary_buffers():
+    pool = BufferPool(64, count=2)
+    kept = [pool.acquire(), pool.acquire()]
+    extra = pool.acquire()
+    assert pool.exhausted == 1
+    assert extra.nbytes == 64
+    assert all(extra.ctypes.data != buffer.ctypes.data for buffer in kept)
+    # temporary buffers don't go into the pool
+    del extra
+    assert pool.busy == 2
+
+
+def test_read_only_frame_keeps_buffer_busy():
+    from frame import Frame
+    pool = BufferPool(64, count=1)
+    frame = Frame(pool.acquire().view(np.uint16).reshape(4, 8))
+    derived = frame.derive(frame.array[1:3])
+    del frame
+    assert pool.busy == 1
+    del derived
+    assert pool.busy == 0
+
+
+def test_resize_forgets_old_buffers():
+    pool = BufferPool(64, count=1)
+    old = pool.acquire()
+    pool.resize(128)
+    assert pool.busy == 0
+    del old
+    assert pool.busy == 0
+    assert pool.acquire().nbytes == 128
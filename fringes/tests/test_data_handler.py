@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("PyQt5")
+from PyQt5.QtCore import QRect
+
+from camera import Camera
+from data_handler import DataHandler
+from frame import Frame
+from rate_policy import FullRate
+
+
+class FakeCamera(Camera):
+    """
+    Emits frames of a sensor of the given shape on request, with a hardware ROI
+    """
+
+    def __init__(self, shape, value=0):
+        super().__init__()
+        self.sensor_shape = shape
+        self.value = value
+        self.roi = None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def supports_hardware_roi(self):
+        return True
+
+    def set_hardware_roi(self, rect):
+        self.roi = rect
+        return QRect(0, 0, self.sensor_shape[1], self.sensor_shape[0]) if rect is None else QRect(rect)
+
+    def capture(self, shape=None, roi_offset=None):
+        # with the ROI that is set, unless given otherwise (e.g. frames captured before a change)
+        if shape is None:
+            shape = self.sensor_shape if self.roi is None else (self.roi.height(), self.roi.width())
+        if roi_offset is None:
+            roi_offset = (0, 0) if self.roi is None else (self.roi.left(), self.roi.top())
+        self.frame_available.emit(Frame(np.full(shape, self.value, np.uint8), roi_offset=roi_offset))
+
+
+@pytest.fixture
+def handler():
+    handler = DataHandler(headless=True)
+    handler.received = {"frame": [], "clipped_frame": []}
+    for stream in handler.received:
+        handler.subscribe(stream, handler.received[stream].append, FullRate())
+    return handler
+
+
+def test_hardware_roi_reads_out_the_selection(handler):
+    camera = FakeCamera((100, 200))
+    handler.change_camera(camera)
+    camera.capture()
+    handler.set_hardware_roi(True)
+    handler.set_clip_size(QRect(20, 10, 40, 30))
+    assert camera.roi == QRect(20, 10, 40, 30)
+
+    camera.capture()
+    frame = handler.received["clipped_frame"][-1]
+    assert frame.shape == (30, 40)
+    assert frame.roi_offset == (20, 10)
+
+
+def test_switching_cameras_with_hardware_roi(handler):
+    camera = FakeCamera((100, 200))
+    handler.change_camera(camera)
+    camera.capture()
+    handler.set_hardware_roi(True)
+    handler.set_clip_size(QRect(20, 10, 40, 30))
+    camera.capture()
+
+    other = FakeCamera((60, 80), value=1)
+    handler.change_camera(other)
+    other.capture()
+    frame = handler.received["frame"][-1]
+    assert frame.shape == (60, 80) and frame.array[0, 0] == 1
+    # the selection of the old camera is gone, the new one reads out its full sensor
+    assert handler.clip_size == QRect(0, 0, 80, 60)
+    assert handler.frame_rect is None
+    assert handler.received["clipped_frame"][-1].shape == (60, 80)
+
+    # selecting a region works with the new camera
+    handler.set_clip_size(QRect(8, 4, 16, 10))
+    assert other.roi == QRect(8, 4, 16, 10)
+    other.capture()
+    assert handler.received["clipped_frame"][-1].shape == (10, 16)
+
+
+def test_stale_frames_are_skipped_until_the_readout_is_adopted(handler, monkeypatch):
+    camera = FakeCamera((100, 200))
+    handler.change_camera(camera)
+    camera.capture()
+    received = len(handler.received["frame"])
+
+    # a resolution change without readout_changed: skipped at first...
+    camera.sensor_shape = (50, 100)
+    camera.capture()
+    assert len(handler.received["frame"]) == received
+
+    # ...but adopted when it goes on
+    monkeypatch.setattr(handler, "readout_timeout", 0.)
+    messages = []
+    handler.message.connect(messages.append)
+    camera.capture()
+    assert handler.received["frame"][-1].shape == (50, 100)
+    assert handler.clip_size == QRect(0, 0, 100, 50)
+    assert messages
+
+
+def test_only_subscribed_streams_are_derived(handler):
+    camera = FakeCamera((100, 200))
+    handler.change_camera(camera)
+    camera.capture()
+    handler.set_clip_size(QRect(20, 10, 40, 30))
+    color = Frame(np.random.default_rng(0).integers(0, 256, (100, 200, 3), dtype=np.uint8))
+
+    derived = handler.derive_streams(color, {"clipped_frame_bw"})
+    assert set(derived) == {"frame", "clipped_frame_bw"}
+    assert derived["clipped_frame_bw"].shape == (30, 40)
+
+    derived = handler.derive_streams(color, {"frame_bw", "clipped_frame_bw"})
+    assert np.shares_memory(derived["frame_bw"].array, derived["clipped_frame_bw"].array)
+    np.testing.assert_array_equal(derived["clipped_frame_bw"].array, derived["frame_bw"].array[10:40, 20:60])
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import frame_ops
+
+
+@pytest.fixture
+def color():
+    return np.random.default_rng(0).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+
+
+def test_crop_is_a_view_and_clips_negative_starts(color):
+    region = frame_ops.crop(color, (-2, 3, 1, 5))
+    assert region.shape == (3, 4, 3)
+    assert np.shares_memory(region, color)
+
+
+@pytest.mark.parametrize("weighting", sorted(frame_ops.weightings))
+def test_to_grayscale_matches_the_weighted_sum(color, weighting):
+    gray = frame_ops.to_grayscale(color, weighting)
+    expected = (color * np.array(frame_ops.weightings[weighting])).sum(axis=2)
+    assert gray.dtype == np.float32
+    np.testing.assert_allclose(gray, expected, rtol=1e-5)
+
+
+def test_to_grayscale_returns_grayscale_data_unchanged():
+    gray = np.zeros((4, 4), np.uint16)
+    assert frame_ops.to_grayscale(gray) is gray
+
+
+def test_crop_and_grayscale_shares_the_full_conversion(color):
+    rect = (1, 4, 2, 7)
+    full, cropped = frame_ops.crop_and_grayscale(color, rect)
+    assert np.shares_memory(full, cropped)
+    np.testing.assert_array_equal(cropped, frame_ops.crop(full, rect))
+
+
+def test_crop_and_grayscale_only_what_is_requested(color):
+    rect = (1, 4, 2, 7)
+    full, cropped = frame_ops.crop_and_grayscale(color, rect, full=False)
+    assert full is None
+    np.testing.assert_allclose(cropped, frame_ops.to_grayscale(color)[1:4, 2:7])
+    assert frame_ops.crop_and_grayscale(color, rect, full=False, cropped=False) == (None, None)
+
+
+def test_checksum_sees_changes(color):
+    before = frame_ops.checksum(color)
+    changed = color.copy()
+    changed[0, 0, 0] ^= 1
+    assert frame_ops.checksum(changed) != before
+    assert frame_ops.checksum(color[::-1]) == frame_ops.checksum(np.ascontiguousarray(color[::-1]))
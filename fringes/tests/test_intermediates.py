@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+import pytest
+
+import intermediates
+from frame import Frame
+
+
+@pytest.fixture
+def counting_node():
+    calls = []
+
+    @intermediates.node("test: doubled")
+    def doubled(frame, factor=2):
+        calls.append(threading.get_ident())
+        return frame.array * factor
+
+    yield calls
+    del intermediates.nodes["test: doubled"]
+
+
+def test_node_is_calculated_once_per_frame(counting_node):
+    frame = Frame(np.arange(4.))
+    first = intermediates.get(frame, "test: doubled")
+    second = intermediates.get(frame, "test: doubled")
+    assert first is second
+    assert len(counting_node) == 1
+    assert not first.flags.writeable
+
+
+def test_parameters_are_part_of_the_key(counting_node):
+    frame = Frame(np.arange(4.))
+    np.testing.assert_array_equal(intermediates.get(frame, "test: doubled", factor=3), np.arange(4.) * 3)
+    intermediates.get(frame, "test: doubled", factor=2)
+    intermediates.get(frame, "test: doubled", factor=3)
+    assert len(counting_node) == 2
+
+
+def test_derived_frames_have_their_own_intermediates(counting_node):
+    frame = Frame(np.arange(4.))
+    intermediates.get(frame, "test: doubled")
+    derived = frame.derive(frame.array[:2])
+    assert derived.intermediates is None
+    assert intermediates.get(derived, "test: doubled").shape == (2,)
+    assert len(counting_node) == 2
+
+
+def test_concurrent_consumers_share_one_calculation():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    @intermediates.node("test: slow")
+    def slow(frame):
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return frame.array + 1
+
+    try:
+        frame = Frame(np.zeros(3))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(intermediates.get(frame, "test: slow")))
+                   for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert len(calls) == 1
+        assert len(results) == 4 and all(result is results[0] for result in results)
+    finally:
+        del intermediates.nodes["test: slow"]
+
+
+def test_errors_reach_every_consumer():
+    @intermediates.node("test: failing")
+    def failing(frame):
+        raise ValueError("no")
+
+    try:
+        frame = Frame(np.zeros(3))
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                intermediates.get(frame, "test: failing")
+    finally:
+        del intermediates.nodes["test: failing"]
+
+
+def test_pyramid_halves_the_data():
+    frame = Frame(np.ones((17, 32), np.uint16))
+    levels = intermediates.get(frame, "pyramid", levels=3)
+    assert [level.shape for level in levels] == [(8, 16), (4, 8), (2, 4)]
+    assert all(level.dtype == np.float32 and not level.flags.writeable for level in levels)
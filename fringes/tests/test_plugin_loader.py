@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5")
+from plugin_loader import read_manifest
+
+
+plugin_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "plugins")
+
+
+def write(tmp_path, source):
+    path = tmp_path / "plugin.py"
+    path.write_text(source, encoding="utf-8")
+    return str(path)
+
+
+def test_manifest_is_read_without_importing(tmp_path):
+    path = write(tmp_path, 'import not_installed_module\n'
+                           'name = "My plugin"\n'
+                           'description = "Does things"\n'
+                           'raise RuntimeError("imported")\n')
+    assert read_manifest(path) == {"name": "My plugin", "description": "Does things"}
+
+
+def test_only_string_constants_count(tmp_path):
+    path = write(tmp_path, 'name = get_name()\n'
+                           'description = 42\n'
+                           'other = "x"\n'
+                           'def f():\n'
+                           '    name = "inside a function"\n')
+    assert read_manifest(path) == {}
+
+
+def test_syntax_errors_are_raised(tmp_path):
+    with pytest.raises(SyntaxError):
+        read_manifest(write(tmp_path, 'name = "x\n'))
+
+
+@pytest.mark.parametrize("module", ["averaging", "fourier2d", "image", "sequence_recorder"])
+def test_plugins_have_a_manifest(module):
+    manifest = read_manifest(os.path.join(plugin_folder, module + ".py"))
+    assert manifest.get("name") and manifest.get("description")
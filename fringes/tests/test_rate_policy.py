@@ -0,0 +1,77 @@
+from rate_policy import Budget, DisplayRate, FullRate, LatestWhenIdle
+
+
+def test_full_rate_takes_everything():
+    policy = FullRate()
+    assert all(policy.accept(t / 100) for t in range(100))
+
+
+def test_display_rate_limits_the_rate():
+    policy = DisplayRate(rate=10.)
+    accepted = sum(policy.accept(t / 100) for t in range(100))
+    assert accepted == 10
+
+
+def test_display_rate_does_not_catch_up_after_a_pause():
+    policy = DisplayRate(rate=10.)
+    policy.accept(0.)
+    accepted = sum(policy.accept(5. + t / 100) for t in range(100))
+    assert accepted <= 11
+
+
+def test_latest_when_idle_asks_the_consumer():
+    idle = [False]
+    policy = LatestWhenIdle(lambda: idle[0])
+    assert not policy.accept(0.)
+    idle[0] = True
+    assert policy.accept(0.)
+
+
+def run(budget, cost, rate=30., seconds=20., start=0.):
+    """
+    Offer frames at `rate` for `seconds` from `start` on, to a consumer that takes `cost` seconds per frame
+    :return: load (processing time per second) in the last quarter
+    """
+    busy = 0.
+    frames = int(rate * seconds)
+    for i in range(frames):
+        if budget.accept(start + i / rate):
+            budget.add_time(cost)
+            if i >= 3 * frames // 4:
+                busy += cost
+    return busy / (seconds / 4)
+
+
+def test_budget_leaves_cheap_consumers_alone():
+    changes = []
+    budget = Budget(FullRate(), 0.25, changes.append)
+    load = run(budget, cost=0.001)
+    assert budget.decimation == 1
+    assert changes == []
+    assert abs(load - 0.03) < 1e-6
+
+
+def test_budget_decimates_slow_consumers():
+    changes = []
+    budget = Budget(FullRate(), 0.25, changes.append)
+    load = run(budget, cost=0.045)
+    # 30 frames of 45 ms per second would be 1.35 s per second
+    assert budget.decimation == 6
+    assert changes[-1] == 6
+    assert load <= 0.25 + 1e-9
+
+
+def test_budget_goes_back_when_the_consumer_gets_faster():
+    changes = []
+    budget = Budget(FullRate(), 0.25, changes.append)
+    run(budget, cost=0.045)
+    run(budget, cost=0.001, start=20.)
+    assert budget.decimation == 1
+    assert changes[-1] == 1
+
+
+def test_budget_asks_the_policy_of_the_consumer_first():
+    budget = Budget(LatestWhenIdle(lambda: False), 0.25)
+    budget.add_time(10.)
+    assert not any(budget.accept(t / 30) for t in range(100))
+    assert budget.decimation == 1
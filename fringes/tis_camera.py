@@ -1,95 +1,14 @@
-import numpy as np
-
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QTimer, QObject, QSettings
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QSettings
 from PyQt5.QtMultimedia import QCameraInfo
 
+from auto_exposure import AutoExposure
 from camera_settings_widget import CameraSettingsWidget
 from qt_camera import QtCamera
 from tis_cam.tis_settings import TisSettings
 
 
-def clamp(x, minn, maxx):
-    return min(max(x, minn), maxx)
-
-
 class TisCamera(QtCamera):
 
-    class AutoSettingsObject(QObject):
-        gain_changed = pyqtSignal(float)
-        exposure_time_changed = pyqtSignal(float)
-
-        def __init__(self, **kwargs):
-            super().__init__(**kwargs)
-            self._saturation = 0
-            self._enabled = False
-            self._piUi = 0
-            self._last_error = 0
-            self._gain = None
-            self._exposure_time = None
-            self._min_gain = None
-            self._max_gain = None
-            self._min_exposure_time = None
-            self._max_exposure_time = None
-            self._setpoint = 85.
-            self.Kp = None
-            self.Kd = None
-            self.Ki = None
-            self._interval = 200
-            self._timer = QTimer()
-            self._timer.timeout.connect(self._run)
-
-        @pyqtSlot(int)
-        def set_saturation(self, sat):
-            self._saturation = sat
-
-        @pyqtSlot(float)
-        def set_exposure_time(self, exposure):
-            self._exposure_time = exposure
-
-        @pyqtSlot(float)
-        def set_gain(self, gain):
-            self._gain = gain
-
-        def set_exposure_range(self, rng):
-            self._min_exposure_time, self._max_exposure_time = rng
-
-        def set_gain_range(self, rng):
-            self._min_gain, self._max_gain = rng
-
-        def start(self):
-            self._timer.start(self._interval)
-
-        def stop(self):
-            self._timer.stop()
-
-        def _run(self):
-            error = self._saturation - self._setpoint
-            ui = self._piUi + error * self._interval / 1000 * self.Ki
-            self._piUi = ui
-            ud = self._last_error / self._interval * self.Kd
-            output = - self.Kp * (error + ui + ud)
-            self._last_error = error
-
-            previous_gain = self._gain
-            previous_exposure_time = self._exposure_time
-
-            if (error > 0 and self._min_gain < self._gain) or (error < 0 and self._gain < self._max_gain):
-                # adjust gain
-                db_increase = output / 5
-                self._gain = clamp(self._gain + db_increase, self._min_gain, self._max_gain)
-            elif (error > 0 and self._min_exposure_time < self._exposure_time) or \
-                    (error < 0 and self._exposure_time < self._max_exposure_time):
-                self._exposure_time = clamp(self._exposure_time + output, self._min_exposure_time,
-                                            self._max_exposure_time)
-            else:
-                # stuck at the edge...
-                self._piUi = 0
-
-            if self._exposure_time != previous_exposure_time:
-                self.exposure_time_changed.emit(self._exposure_time)
-            if self._gain != previous_gain:
-                self.gain_changed.emit(self._gain)
-
     # to convert the values from ZWO into nice units:
     _gain_factor = 10
     _exposure_factor = 1000
@@ -113,34 +32,35 @@ class TisCamera(QtCamera):
         self._manualMode = False
         self._active = False
 
-        self._last_saturations = []
-        self._saturation = 0
-
         self.settings = TisSettings()
-
-        self.ndarray_available.connect(self.calculate_saturation)
-
-        self.auto_settings_thread = self.AutoSettingsObject()
-        self.auto_settings_thread.set_gain(self.get_gain())
-        self.auto_settings_thread.set_exposure_time(self.get_exposure())
-        self.auto_settings_thread.set_gain_range(self.get_gain_range())
-        self.auto_settings_thread.set_exposure_range(self.get_exposure_range())
+        self._conversion_thread = self._video_surface.conversion_thread
+        self._conversion_thread.exposure = self.get_exposure()
+        self._conversion_thread.gain = self.get_gain()
+        self._conversion_thread.maxval = self.maxval
+        self._conversion_thread.saturation_changed.connect(self.saturation_changed)
+
+        self.auto_exposure = AutoExposure()
+        self.auto_exposure.set_gain(self.get_gain())
+        self.auto_exposure.set_exposure_time(self.get_exposure())
+        self.auto_exposure.set_gain_range(self.get_gain_range())
+        # same limit as in the controls:
+        min_exp, max_exp = self.get_exposure_range()
+        self.auto_exposure.set_exposure_range((min_exp, min(max_exp, 2000)))
+        self.auto_exposure.set_maxval(self.maxval)
+        self._conversion_thread.maxval_changed.connect(self.auto_exposure.set_maxval, Qt.DirectConnection)
         self.set_pid(*self.load_pid_values())
-        self.gain_changed.connect(self.auto_settings_thread.set_gain)
-        self.exposure_time_changed.connect(self.auto_settings_thread.set_exposure_time)
-        self.saturation_changed.connect(self.auto_settings_thread.set_saturation)
-        self.auto_settings_thread.gain_changed.connect(self.set_gain)
-        self.auto_settings_thread.exposure_time_changed.connect(self.set_exposure)
-
-    @pyqtSlot(np.ndarray)
-    def calculate_saturation(self, array):
-        sat = array.max() / self.maxval * 100
-        self._last_saturations.append(sat)
-        if len(self._last_saturations) > 1:
-            self._last_saturations.pop(0)
-        weight = np.arange(1, len(self._last_saturations) + 1)
-        self._saturation = np.sum(weight * np.array(self._last_saturations)) / np.sum(weight)
-        self.saturation_changed.emit(self._saturation)
+        self.gain_changed.connect(self.auto_exposure.set_gain)
+        self.exposure_time_changed.connect(self.auto_exposure.set_exposure_time)
+        # straight from the conversion thread to the controller, without going through the GUI thread:
+        self._conversion_thread.saturation_changed.connect(self.auto_exposure.set_saturation, Qt.DirectConnection)
+        self._conversion_thread.frame_available.connect(self.auto_exposure.set_frame, Qt.DirectConnection)
+        self.auto_exposure.gain_changed.connect(self.set_gain)
+        self.auto_exposure.exposure_time_changed.connect(self.set_exposure)
+
+    def __del__(self):
+        self.auto_exposure.stop()
+        self.auto_exposure.wait()
+        super().__del__()
 
     def _clear_interface(self):
         return False
@@ -162,7 +82,10 @@ class TisCamera(QtCamera):
         controls.set_exposure(self.get_exposure())
         controls.exposure_changed.connect(self.set_exposure)
         controls.gain_changed.connect(self.set_gain)
+        controls.set_auto_modes(self.auto_exposure.modes)
+        controls.set_auto_mode(self.auto_exposure.mode)
         controls.auto_changed.connect(self.enable_auto)
+        controls.auto_mode_changed.connect(self.auto_exposure.set_mode)
         self.exposure_time_changed.connect(controls.set_exposure)
         self.gain_changed.connect(controls.set_gain)
         return controls
@@ -170,11 +93,11 @@ class TisCamera(QtCamera):
     @pyqtSlot(bool)
     def enable_auto(self, auto):
         if auto:
-            self.auto_settings_thread.set_gain = self.get_gain()
-            self.auto_settings_thread.exposure_time = self.get_exposure()
-            self.auto_settings_thread.start()
+            self.auto_exposure.set_gain(self.get_gain())
+            self.auto_exposure.set_exposure_time(self.get_exposure())
+            self.auto_exposure.start()
         else:
-            self.auto_settings_thread.stop()
+            self.auto_exposure.stop()
 
     def get_exposure(self):
         return self.settings.get_exposure()
@@ -190,22 +113,24 @@ class TisCamera(QtCamera):
 
     def set_exposure(self, exposure):
         self.settings.set_exposure(exposure)
+        self._conversion_thread.exposure = exposure
         self.exposure_time_changed.emit(exposure)
 
     def set_gain(self, gain):
         self.settings.set_gain(gain)
+        self._conversion_thread.gain = gain
         self.gain_changed.emit(gain)
 
     def get_pid(self):
-        p = self.auto_settings_thread.Kp
-        i = self.auto_settings_thread.Ki
-        d = self.auto_settings_thread.Kd
+        p = self.auto_exposure.Kp
+        i = self.auto_exposure.Ki
+        d = self.auto_exposure.Kd
         return p, i, d
 
     def set_pid(self, p, i, d):
-        self.auto_settings_thread.Kp = p
-        self.auto_settings_thread.Ki = i
-        self.auto_settings_thread.Kd = d
+        self.auto_exposure.Kp = p
+        self.auto_exposure.Ki = i
+        self.auto_exposure.Kd = d
         self.save_pid_values(p, i, d)
         print("pid:", p, i, d)
 
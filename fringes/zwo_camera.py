@@ -1,138 +1,137 @@
 from python_zwoasi import zwoasi
-from PyQt5.QtCore import QThread, QMutex, QMutexLocker, pyqtSignal, pyqtSlot, qDebug, QObject, QTimer, QSettings
+from PyQt5.QtCore import Qt, QThread, QMutex, QMutexLocker, pyqtSignal, pyqtSlot, qDebug, QSettings, QRect
 import numpy as np
+import time
+from collections import namedtuple
 
-from camera import Camera
+from auto_exposure import AutoExposure
+from buffer_pool import BufferPool
+from camera import Camera, measure_saturation
 from camera_settings_widget import CameraSettingsWidget
+from frame import Frame
+import instrumentation
 
 
 def clamp(x, minn, maxx):
     return min(max(x, minn), maxx)
 
 
+def round_up(x, multiple):
+    return -(-x // multiple) * multiple
+
+
+# what the frames coming from the camera look like:
+FrameDescriptor = namedtuple("FrameDescriptor", ["shape", "dtype", "nbytes", "channels"])
+
+
+def describe_format(whbi):
+    """
+    :param whbi: ROI format as returned by zwoasi.Camera.get_roi_format (width, height, bins, image type)
+    :return: FrameDescriptor
+    """
+    shape = (whbi[1], whbi[0])
+    channels = 1
+    if whbi[3] == zwoasi.ASI_IMG_RAW8 or whbi[3] == zwoasi.ASI_IMG_Y8:
+        dtype = np.dtype(np.uint8)
+    elif whbi[3] == zwoasi.ASI_IMG_RAW16:
+        dtype = np.dtype(np.uint16)
+    elif whbi[3] == zwoasi.ASI_IMG_RGB24:
+        dtype = np.dtype(np.uint8)
+        channels = 3
+        shape += (channels,)
+    else:
+        raise ValueError('Unsupported image type')
+    return FrameDescriptor(shape=shape, dtype=dtype, nbytes=int(np.prod(shape)) * dtype.itemsize, channels=channels)
+
+
 class ZwoCamera(Camera):
 
     class CaptureThread(QThread):
-        ndarray_available = pyqtSignal(np.ndarray)
+        frame_available = pyqtSignal(Frame)
+        # only emitted when the value changes:
+        saturation_changed = pyqtSignal(int)
 
-        def __init__(self, camera: zwoasi.Camera):
+        # how often the SDK is asked for the number of dropped frames (in s):
+        dropped_frames_interval = 1.
+
+        def __init__(self, camera: zwoasi.Camera, name=""):
             super().__init__()
             self._camera = camera
             self._mutex = QMutex()
             self._abort = False
+            # frames are read straight into these buffers; a buffer is reused once no consumer holds the frame any more
+            self.buffer_pool = BufferPool(count=8)
+            # metadata attached to each frame, kept up to date by the ZwoCamera:
+            self.name = name
+            self.exposure = None
+            self.gain = None
+            self.roi_offset = (0, 0)
+            self.maxval = None
+            # only asked from the SDK again when the readout changes:
+            self._descriptor = None
 
         def stop(self):
             with QMutexLocker(self._mutex):
                 self._abort = True
 
+        def invalidate_format(self):
+            with QMutexLocker(self._mutex):
+                self._descriptor = None
+
         def run(self):
             self._abort = False
             self._camera.start_video_capture()
+            dropped = self._camera.get_dropped_frames()
+            last_dropped_check = time.time()
+            last_saturation = None
 
             while True:
                 with QMutexLocker(self._mutex):
                     if self._abort:
                         self._camera.stop_video_capture()
                         break
-
-                data = self._camera.get_video_data()
-                whbi = self._camera.get_roi_format()
-                shape = [whbi[1], whbi[0]]
-                if whbi[3] == zwoasi.ASI_IMG_RAW8 or whbi[3] == zwoasi.ASI_IMG_Y8:
-                    img = np.frombuffer(data, dtype=np.uint8)
-                elif whbi[3] == zwoasi.ASI_IMG_RAW16:
-                    img = np.frombuffer(data, dtype=np.uint16)
-                elif whbi[3] == zwoasi.ASI_IMG_RGB24:
-                    img = np.frombuffer(data, dtype=np.uint8)
-                    shape.append(3)
-                else:
-                    raise ValueError('Unsupported image type')
-                img = img.reshape(shape)
-
-                img = np.rot90(img, 2)
-
-                self.ndarray_available.emit(img)
-
-    class AutoSettingsObject(QObject):
-        gain_changed = pyqtSignal(float)
-        exposure_time_changed = pyqtSignal(float)
-
-        def __init__(self, **kwargs):
-            super().__init__(**kwargs)
-            self._saturation = 0
-            self._enabled = False
-            self._piUi = 0
-            self._last_error = 0
-            self._gain = None
-            self._exposure_time = None
-            self._min_gain = None
-            self._max_gain = None
-            self._min_exposure_time = None
-            self._max_exposure_time = None
-            self._setpoint = 85.
-            self.Kp = 0.5
-            self.Kd = 10
-            self.Ki = 0.3
-            self._interval = 200
-            self._timer = QTimer()
-            self._timer.timeout.connect(self._run)
-
-        @pyqtSlot(int)
-        def set_saturation(self, sat):
-            self._saturation = sat
-
-        @pyqtSlot(float)
-        def set_exposure_time(self, exposure):
-            self._exposure_time = exposure
-
-        @pyqtSlot(float)
-        def set_gain(self, gain):
-            self._gain = gain
-
-        def set_exposure_range(self, rng):
-            self._min_exposure_time, self._max_exposure_time = rng
-
-        def set_gain_range(self, rng):
-            self._min_gain, self._max_gain = rng
-
-        def start(self):
-            self._timer.start(self._interval)
-
-        def stop(self):
-            self._timer.stop()
-
-        def _run(self):
-            error = self._saturation - self._setpoint
-            ui = self._piUi + error * self._interval / 1000 * self.Ki
-            self._piUi = ui
-            ud = self._last_error / self._interval * self.Kd
-            output = - self.Kp * (error + ui + ud)
-            self._last_error = error
-
-            previous_gain = self._gain
-            previous_exposure_time = self._exposure_time
-
-            if (error > 0 and self._min_gain < self._gain) or (error < 0 and self._gain < self._max_gain):
-                # adjust gain
-                db_increase = output / 5
-                self._gain = clamp(self._gain + db_increase, self._min_gain, self._max_gain)
-            elif (error > 0 and self._min_exposure_time < self._exposure_time) or \
-                    (error < 0 and self._exposure_time < self._max_exposure_time):
-                self._exposure_time = clamp(self._exposure_time + output, self._min_exposure_time,
-                                            self._max_exposure_time)
-            else:
-                # stuck at the edge...
-                self._piUi = 0
-
-            if self._exposure_time != previous_exposure_time:
-                self.exposure_time_changed.emit(self._exposure_time)
-            if self._gain != previous_gain:
-                self.gain_changed.emit(self._gain)
+                    descriptor = self._descriptor
+
+                if descriptor is None:
+                    descriptor = describe_format(self._camera.get_roi_format())
+                    self.buffer_pool.resize(descriptor.nbytes)
+                    with QMutexLocker(self._mutex):
+                        self._descriptor = descriptor
+
+                with instrumentation.measure("capture: read from camera"):
+                    data = self._camera.get_video_data(buffer_=self.buffer_pool.acquire())
+                img = data.view(descriptor.dtype).reshape(descriptor.shape)
+
+                saturation = measure_saturation(img, self.maxval)
+                if int(saturation) != last_saturation:
+                    last_saturation = int(saturation)
+                    self.saturation_changed.emit(last_saturation)
+
+                timestamp = time.time()
+                if timestamp - last_dropped_check > self.dropped_frames_interval:
+                    dropped = self._camera.get_dropped_frames()
+                    last_dropped_check = timestamp
+                    instrumentation.set_value("capture: frames dropped by the SDK", dropped)
+                    instrumentation.set_value("capture: buffer pool exhausted", self.buffer_pool.exhausted)
+
+                self.frame_available.emit(Frame(img, timestamp=timestamp, exposure=self.exposure, gain=self.gain,
+                                                roi_offset=self.roi_offset, camera=self.name, dropped=dropped,
+                                                saturation=saturation))
 
     # to convert the values from ZWO into nice units:
     _gain_factor = 10
     _exposure_factor = 1000
 
+    # names and value ranges of the pixel formats:
+    _pixel_format_names = {zwoasi.ASI_IMG_RAW8: "RAW8",
+                           zwoasi.ASI_IMG_RGB24: "RGB24",
+                           zwoasi.ASI_IMG_RAW16: "RAW16",
+                           zwoasi.ASI_IMG_Y8: "Y8"}
+    _pixel_format_maxval = {zwoasi.ASI_IMG_RAW8: 2**8,
+                            zwoasi.ASI_IMG_RGB24: 2**8,
+                            zwoasi.ASI_IMG_RAW16: 2**16,
+                            zwoasi.ASI_IMG_Y8: 2**8}
+
     exposure_time_changed = pyqtSignal(float)
     gain_changed = pyqtSignal(float)
     saturation_changed = pyqtSignal(int)
@@ -141,42 +140,57 @@ class ZwoCamera(Camera):
         super().__init__()
         self._camera = None
 
-        self.maxval = 2**16
-
-        self._last_saturations = []
-        self._saturation = 0
-
         self._camera = zwoasi.Camera(cam_number)
 
         self._active = True
         self._manualMode = True
         self._controls = self._camera.get_controls()
         self._info = self._camera.get_camera_property()
-
-        self._camera.set_image_type(zwoasi.ASI_IMG_RAW16)
+        self._sensor_width = self._info["MaxWidth"]
+        self._sensor_height = self._info["MaxHeight"]
+        self._bins = 1
+        self._image_type = zwoasi.ASI_IMG_RAW16
+
+        # start at the corner of the sensor (set_roi would center the readout), frames have roi_offset (0, 0)
+        self._camera.set_roi(start_x=0, start_y=0, bins=self._bins, image_type=self._image_type)
+        self.maxval = self._pixel_format_maxval[self._image_type]
         self._camera.set_control_value(zwoasi.ASI_GAIN, 20)
         self._camera.set_control_value(zwoasi.ASI_EXPOSURE, 3000)
-        self._camera.set_control_value(zwoasi.ASI_FLIP, 0)
+        # the frames are used rotated by 180 degrees with respect to the sensor (i.e. flipped in both directions),
+        # the camera does that in hardware
+        self.flip_x = True
+        self.flip_y = True
+        self._camera.set_control_value(zwoasi.ASI_FLIP, self._flip_value())
         self._camera.disable_dark_subtract()
         self._camera.set_control_value(zwoasi.ASI_COOLER_ON, 1)
         self._camera.set_control_value(zwoasi.ASI_TARGET_TEMP, self._controls["TargetTemp"]["MinValue"])
 
-        self.capture_thread = self.CaptureThread(self._camera)
-        self.capture_thread.ndarray_available.connect(self.ndarray_available)
-        self.ndarray_available.connect(self.calculate_saturation)
-
-        self.auto_settings_thread = self.AutoSettingsObject()
-        self.auto_settings_thread.set_gain(self.get_gain())
-        self.auto_settings_thread.set_exposure_time(self.get_exposure())
-        self.auto_settings_thread.set_gain_range(self.get_gain_range())
-        self.auto_settings_thread.set_exposure_range(self.get_exposure_range())
-        self.gain_changed.connect(self.auto_settings_thread.set_gain)
-        self.exposure_time_changed.connect(self.auto_settings_thread.set_exposure_time)
-        self.saturation_changed.connect(self.auto_settings_thread.set_saturation)
-        self.auto_settings_thread.gain_changed.connect(self.set_gain)
-        self.auto_settings_thread.exposure_time_changed.connect(self.set_exposure)
+        self.capture_thread = self.CaptureThread(self._camera, name=self._info["Name"])
+        self.capture_thread.exposure = self.get_exposure()
+        self.capture_thread.gain = self.get_gain()
+        self.capture_thread.maxval = self.maxval
+        self.capture_thread.frame_available.connect(self.frame_available)
+        self.capture_thread.saturation_changed.connect(self.saturation_changed)
+
+        self.auto_exposure = AutoExposure()
+        self.auto_exposure.set_gain(self.get_gain())
+        self.auto_exposure.set_exposure_time(self.get_exposure())
+        self.auto_exposure.set_gain_range(self.get_gain_range())
+        # same limit as in the controls:
+        min_exp, max_exp = self.get_exposure_range()
+        self.auto_exposure.set_exposure_range((min_exp, min(max_exp, 2000)))
+        self.auto_exposure.set_maxval(self.maxval)
+        self.gain_changed.connect(self.auto_exposure.set_gain)
+        self.exposure_time_changed.connect(self.auto_exposure.set_exposure_time)
+        # straight from the capture thread to the controller, without going through the GUI thread:
+        self.capture_thread.saturation_changed.connect(self.auto_exposure.set_saturation, Qt.DirectConnection)
+        self.capture_thread.frame_available.connect(self.auto_exposure.set_frame, Qt.DirectConnection)
+        self.auto_exposure.gain_changed.connect(self.set_gain)
+        self.auto_exposure.exposure_time_changed.connect(self.set_exposure)
 
     def __del__(self):
+        self.auto_exposure.stop()
+        self.auto_exposure.wait()
         self.capture_thread.stop()
         self.capture_thread.wait()
 
@@ -188,16 +202,6 @@ class ZwoCamera(Camera):
     def stop(self):
         self.capture_thread.stop()
 
-    @pyqtSlot(np.ndarray)
-    def calculate_saturation(self, array):
-        sat = array.max() / self.maxval * 100
-        self._last_saturations.append(sat)
-        if len(self._last_saturations) > 1:
-            self._last_saturations.pop(0)
-        weight = np.arange(1, len(self._last_saturations) + 1)
-        self._saturation = np.sum(weight * np.array(self._last_saturations)) / np.sum(weight)
-        self.saturation_changed.emit(self._saturation)
-
     @pyqtSlot()
     def get_controls(self):
         controls = CameraSettingsWidget()
@@ -207,9 +211,18 @@ class ZwoCamera(Camera):
         controls.set_gain_range(*self.get_gain_range())
         controls.set_gain(self.get_gain())
         controls.set_exposure(self.get_exposure())
+        controls.set_binning_options(self.get_binning_options())
+        controls.set_binning(self.get_binning())
+        controls.set_pixel_formats(self.get_pixel_formats())
+        controls.set_pixel_format(self.get_pixel_format())
         controls.exposure_changed.connect(self.set_exposure)
         controls.gain_changed.connect(self.set_gain)
+        controls.set_auto_modes(self.auto_exposure.modes)
+        controls.set_auto_mode(self.auto_exposure.mode)
         controls.auto_changed.connect(self.enable_auto)
+        controls.auto_mode_changed.connect(self.auto_exposure.set_mode)
+        controls.binning_changed.connect(self.set_binning)
+        controls.pixel_format_changed.connect(self.set_pixel_format)
         self.exposure_time_changed.connect(controls.set_exposure)
         self.gain_changed.connect(controls.set_gain)
         return controls
@@ -221,11 +234,115 @@ class ZwoCamera(Camera):
     @pyqtSlot(bool)
     def enable_auto(self, auto):
         if auto:
-            self.auto_settings_thread.set_gain = self.get_gain()
-            self.auto_settings_thread.exposure_time = self.get_exposure()
-            self.auto_settings_thread.start()
+            self.auto_exposure.set_gain(self.get_gain())
+            self.auto_exposure.set_exposure_time(self.get_exposure())
+            self.auto_exposure.start()
+        else:
+            self.auto_exposure.stop()
+
+    def get_binning_options(self):
+        return self._info["SupportedBins"]
+
+    def get_binning(self):
+        return self._bins
+
+    @pyqtSlot(int)
+    def set_binning(self, bins):
+        if bins not in self._info["SupportedBins"]:
+            raise ValueError("Binning {} is not supported by this camera".format(bins))
+        if bins != self._bins:
+            self._reconfigure((0, 0), start_x=0, start_y=0, bins=bins, image_type=self._image_type)
+            self._bins = bins
+            self.readout_changed.emit()
+
+    def get_pixel_formats(self):
+        return [self._pixel_format_names[fmt] for fmt in self._info["SupportedVideoFormat"]
+                if fmt in self._pixel_format_names]
+
+    def get_pixel_format(self):
+        return self._pixel_format_names[self._image_type]
+
+    @pyqtSlot(str)
+    def set_pixel_format(self, pixel_format):
+        image_types = {name: fmt for fmt, name in self._pixel_format_names.items()}
+        if pixel_format not in image_types:
+            raise ValueError("Unknown pixel format {}".format(pixel_format))
+        image_type = image_types[pixel_format]
+        if image_type != self._image_type:
+            # go back to the full sensor, the DataHandler resets its selection after readout_changed
+            self._reconfigure((0, 0), start_x=0, start_y=0, bins=self._bins, image_type=image_type)
+            self._image_type = image_type
+            self.maxval = self._pixel_format_maxval[image_type]
+            self.capture_thread.maxval = self.maxval
+            self.auto_exposure.set_maxval(self.maxval)
+            self.readout_changed.emit()
+
+    def _flip_value(self):
+        # ASI_FLIP: 0 none, 1 horizontal, 2 vertical, 3 both
+        return int(self.flip_x) + 2 * int(self.flip_y)
+
+    def set_orientation(self, flip_x, flip_y):
+        if (flip_x, flip_y) != (self.flip_x, self.flip_y):
+            self.flip_x = flip_x
+            self.flip_y = flip_y
+            self._camera.set_control_value(zwoasi.ASI_FLIP, self._flip_value())
+            # the readout region is given in sensor coordinates, go back to the full sensor
+            self.set_hardware_roi(None)
+            self.readout_changed.emit()
+
+    def supports_hardware_roi(self):
+        return True
+
+    def _reconfigure(self, roi_offset, *args, **kwargs):
+        """
+        Change the readout parameters (see zwoasi.Camera.set_roi), capture has to be paused for this
+        :param roi_offset: position of the new readout in frame coordinates
+        """
+        was_running = self.capture_thread.isRunning()
+        if was_running:
+            self.capture_thread.stop()
+            self.capture_thread.wait()
+        try:
+            self._camera.set_roi(*args, **kwargs)
+            self.capture_thread.invalidate_format()
+            self.capture_thread.roi_offset = roi_offset
+        finally:
+            if was_running:
+                self.capture_thread.start()
+
+    def set_hardware_roi(self, rect):
+        # ROI coordinates are in binned pixels
+        width = self._sensor_width // self._bins
+        height = self._sensor_height // self._bins
+        width -= width % 8
+        height -= height % 2
+        if rect is None:
+            start_x, start_y, roi_width, roi_height = 0, 0, width, height
         else:
-            self.auto_settings_thread.stop()
+            # frames are mirrored with respect to the sensor according to the flip settings
+            left = width - (rect.left() + rect.width()) if self.flip_x else rect.left()
+            top = height - (rect.top() + rect.height()) if self.flip_y else rect.top()
+            right = left + rect.width()
+            bottom = top + rect.height()
+            # the SDK wants the width to be a multiple of 8 and the height a multiple of 2:
+            start_x = clamp(left - left % 2, 0, width)
+            start_y = clamp(top - top % 2, 0, height)
+            roi_width = clamp(round_up(right - start_x, 8), 8, width)
+            roi_height = clamp(round_up(bottom - start_y, 2), 2, height)
+            start_x = min(start_x, width - roi_width)
+            start_y = min(start_y, height - roi_height)
+
+        rect = QRect(width - (start_x + roi_width) if self.flip_x else start_x,
+                     height - (start_y + roi_height) if self.flip_y else start_y,
+                     roi_width, roi_height)
+        self._reconfigure((rect.left(), rect.top()), start_x, start_y, roi_width, roi_height)
+        return rect
+
+    def get_buffer_pool_exhausted(self):
+        """
+        Number of frames for which no free capture buffer was available and a temporary one had to be allocated
+        """
+        return self.capture_thread.buffer_pool.exhausted
 
     @staticmethod
     def get_number_cameras():
@@ -275,6 +392,7 @@ class ZwoCamera(Camera):
         if not rng[0] <= true_exposure <= rng[1]:
             raise ValueError("Exposure parameter {} is outside of allowed range {}".format(true_exposure, rng))
         self._camera.set_control_value(zwoasi.ASI_EXPOSURE, true_exposure)
+        self.capture_thread.exposure = exposure
         self.exposure_time_changed.emit(exposure)
 
     @Camera._ensure_valid
@@ -303,18 +421,19 @@ class ZwoCamera(Camera):
         if not rng[0] <= true_gain <= rng[1]:
             raise ValueError("Gain parameter {} is outside of allowed range {}".format(true_gain, rng))
         self._camera.set_control_value(zwoasi.ASI_GAIN, true_gain)
+        self.capture_thread.gain = gain
         self.gain_changed.emit(gain)
 
     def get_pid(self):
-        p = self.auto_settings_thread.Kp
-        i = self.auto_settings_thread.Ki
-        d = self.auto_settings_thread.Kd
+        p = self.auto_exposure.Kp
+        i = self.auto_exposure.Ki
+        d = self.auto_exposure.Kd
         return p, i, d
 
     def set_pid(self, p, i, d):
-        self.auto_settings_thread.Kp = p
-        self.auto_settings_thread.Ki = i
-        self.auto_settings_thread.Kd = d
+        self.auto_exposure.Kp = p
+        self.auto_exposure.Ki = i
+        self.auto_exposure.Kd = d
         self.save_pid_values(p, i, d)
         print("pid:", p, i, i)
 